@@ -183,17 +183,25 @@
 #     import uvicorn
 #     uvicorn.run(app, host="0.0.0.0", port=8000)
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 import os
-from typing import List
+from typing import List, Dict, Any, Optional
 import uuid
 import logging
 from dotenv import load_dotenv
-from app.services.pdf_extractor import PDFExtractor
 from app.services.llm_processor import LLMProcessor
-from app.services.excel_generator import ExcelGenerator
+from app.services.llm_scheduler import LLMScheduler
+from app.services.job_manager import JobManager, JobQueueFullError
+from app.services.pdf_extractor import PDFExtractor
+from app.services.stage_executors import (
+    StageExecutors, parse_pdf, count_pdf_pages, select_pdf_engine, parse_pdf_pages, generate_excel,
+    load_cached_extraction, cache_extraction
+)
+from app.services.extraction_cache import get_extraction_cache
+from app.services.llm_cache import get_llm_response_cache
 import sys
 import asyncio
 
@@ -206,7 +214,78 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="PDF Extraction Tool", version="1.0.0")
+# Constants
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+CHUNK_SIZE = 1024 * 1024  # 1MB chunks
+PROCESSING_TIMEOUT = 600  # 10 minutes
+
+# Background job queue
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "20"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+# Executor pools for the blocking pipeline stages (parse defaults to one worker per CPU)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0")) or None
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", "1"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+
+# Multi-file jobs parse their PDFs in parallel, limited per job so concurrent jobs share the pool
+PARALLEL_EXTRACTION = os.getenv("PARALLEL_EXTRACTION", "true").lower() == "true"
+PARSE_WORKERS_PER_JOB = int(os.getenv("PARSE_WORKERS_PER_JOB", "0")) or max(
+    1, (PARSE_WORKERS or os.cpu_count() or 1) // MAX_CONCURRENT_JOBS
+)
+
+# Large PDFs are split into contiguous page ranges parsed by separate workers
+PAGE_SHARD_THRESHOLD = int(os.getenv("PAGE_SHARD_THRESHOLD", "40"))
+PAGE_SHARD_MIN_PAGES = int(os.getenv("PAGE_SHARD_MIN_PAGES", "10"))
+
+job_manager = JobManager(
+    max_workers=MAX_CONCURRENT_JOBS,
+    max_queue_size=MAX_QUEUED_JOBS,
+    job_timeout=PROCESSING_TIMEOUT,
+    retention_seconds=JOB_RETENTION_SECONDS
+)
+
+stage_executors = StageExecutors(
+    parse_workers=PARSE_WORKERS,
+    excel_workers=EXCEL_WORKERS,
+    llm_workers=LLM_WORKERS
+)
+
+# Shared with the parse workers through its SQLite file; used here for metrics
+extraction_cache = get_extraction_cache()
+
+# Same instance the LLM processors use, so memory-tier hits show up in the metrics
+llm_cache = get_llm_response_cache()
+
+def _create_llm_processor(scheduler: LLMScheduler) -> Optional[LLMProcessor]:
+    """Build the shared LLM processor, or None if it cannot be configured yet"""
+    try:
+        return LLMProcessor(scheduler=scheduler)
+    except Exception as e:
+        logger.error(f"❌ LLM processor unavailable: {str(e)}")
+        return None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the stage executors, background extraction workers and shared LLM scheduler"""
+    app.state.llm_scheduler = LLMScheduler()
+    app.state.llm_processor = _create_llm_processor(app.state.llm_scheduler)
+    stage_executors.start()
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    stage_executors.shutdown()
+    app.state.llm_scheduler.close()
+
+def get_llm_processor(request: Request) -> LLMProcessor:
+    """Dependency returning the application's shared LLM processor"""
+    llm_processor = getattr(request.app.state, "llm_processor", None)
+    if llm_processor is None:
+        raise HTTPException(status_code=503, detail="LLM processor is not configured. Check GROQ_API_KEY and reload the configuration.")
+    return llm_processor
+
+app = FastAPI(title="PDF Extraction Tool", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -223,62 +302,51 @@ OUTPUT_DIR = "output"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Constants
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
-CHUNK_SIZE = 1024 * 1024  # 1MB chunks
-PROCESSING_TIMEOUT = 600  # 10 minutes
+def _cleanup_files(file_paths: List[str]) -> int:
+    """Remove uploaded files, returning how many were deleted"""
+    cleanup_count = 0
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+                cleanup_count += 1
+                logger.info(f"🔍 [DEBUG] Cleaned up: {os.path.basename(file_path)}")
+            except Exception as cleanup_error:
+                logger.error(f"⚠️ [DEBUG] Cleanup failed for {file_path}: {cleanup_error}")
+    return cleanup_count
 
-async def _extract_data_internal(files: List[UploadFile], template_id: int):
+async def _save_uploaded_files(files: List[UploadFile], job_id: str) -> List[str]:
     """
-    Internal function to handle PDF extraction with comprehensive logging
+    Validate and persist uploaded files so the job can run after the request returns
     """
     saved_files = []
-    
+
     try:
-        logger.info("🔍 [DEBUG] STARTING _extract_data_internal")
-        logger.info(f"🔍 [DEBUG] Template ID: {template_id}")
-        logger.info(f"🔍 [DEBUG] Number of files: {len(files)}")
-        
-        # Validate template ID
-        if template_id not in [1, 2]:
-            raise HTTPException(status_code=400, detail="Invalid template ID. Use 1 or 2.")
-        
-        # Validate files
-        if not files:
-            raise HTTPException(status_code=400, detail="No files uploaded")
-        
-        logger.info("🔍 [DEBUG] Template and file validation passed")
-        
-        # Generate unique job ID
-        job_id = str(uuid.uuid4())
-        logger.info(f"🔍 [DEBUG] Generated Job ID: {job_id}")
-        
-        # Save uploaded files with chunked reading
         logger.info("🔍 [DEBUG] Starting file upload process...")
         for file in files:
             logger.info(f"🔍 [DEBUG] Processing file: {file.filename}")
-            
+
             # Check file extension
             if not file.filename.lower().endswith('.pdf'):
                 raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-            
+
             # Check file size
             file.file.seek(0, 2)  # Seek to end
             file_size = file.file.tell()
             file.file.seek(0)  # Reset to beginning
-            
+
             logger.info(f"🔍 [DEBUG] File {file.filename} size: {file_size} bytes")
-            
+
             if file_size > MAX_FILE_SIZE:
                 raise HTTPException(status_code=400, detail=f"File {file.filename} exceeds maximum size of 50MB")
-            
+
             if file_size == 0:
                 raise HTTPException(status_code=400, detail=f"File {file.filename} is empty")
-            
+
             # Save file with chunked reading
             file_path = os.path.join(UPLOAD_DIR, f"{job_id}_{file.filename}")
             logger.info(f"🔍 [DEBUG] Saving file to: {file_path}")
-            
+
             with open(file_path, "wb") as f:
                 chunk_count = 0
                 while True:
@@ -287,111 +355,201 @@ async def _extract_data_internal(files: List[UploadFile], template_id: int):
                         break
                     f.write(chunk)
                     chunk_count += 1
-                
+
                 logger.info(f"🔍 [DEBUG] File saved in {chunk_count} chunks")
-            
+
             saved_files.append(file_path)
             logger.info(f"🔍 [DEBUG] Successfully saved: {file.filename}")
-        
-        logger.info(f"💾 [DEBUG] Saved {len(saved_files)} files for processing")
-        
-        # Extract text from PDFs with comprehensive error handling
-        pdf_extractor = PDFExtractor()
-        extracted_texts = []
-        
-        logger.info("🔍 [DEBUG] Starting PDF text extraction...")
-        for i, file_path in enumerate(saved_files):
-            logger.info(f"🔍 [DEBUG] Processing PDF {i+1}/{len(saved_files)}: {os.path.basename(file_path)}")
-            
-            try:
-                # FIX: PDFExtractor returns a dictionary, not a string
-                extraction_result = pdf_extractor.extract_text(file_path)
-                logger.info(f"🔍 [DEBUG] PDF extraction completed for {os.path.basename(file_path)}")
-                
-                # Check if extraction was successful
-                if extraction_result.get("status") != "success":
-                    logger.error(f"❌ [DEBUG] PDF extraction failed: {extraction_result.get('error', 'Unknown error')}")
-                    extracted_texts.append("PDF_EXTRACTION_FAILED")
-                    continue
-                
-                # Extract the actual text content from the result dictionary
-                text = extraction_result.get("text", "")
-                char_count = extraction_result.get("char_count", 0)
-                page_count = extraction_result.get("page_count", 0)
-                
-                logger.info(f"🔍 [DEBUG] Extraction details - Pages: {page_count}, Chars: {char_count}, Status: {extraction_result.get('status')}")
-                logger.info(f"🔍 [DEBUG] Financial score: {extraction_result.get('financial_content_score', 0)}")
-                logger.info(f"🔍 [DEBUG] Tables found: {len(extraction_result.get('tables', []))}")
-                
-                # Safe text preview logging
-                if text and isinstance(text, str):
-                    preview = text[:200] + "..." if len(text) > 200 else text
-                    logger.info(f"🔍 [DEBUG] First 200 chars: {preview}")
-                else:
-                    logger.warning(f"🔍 [DEBUG] Text is empty or not string. Type: {type(text)}")
-                
-                # Validate extracted text
-                if not text or len(text.strip()) < 10:
-                    logger.warning(f"⚠️ [DEBUG] Little or no text extracted from {os.path.basename(file_path)}")
-                    text = "PDF_CONTENT_UNAVAILABLE"
-                elif len(text.strip()) < 50:
-                    logger.warning(f"⚠️ [DEBUG] Minimal text extracted from {os.path.basename(file_path)}: {len(text)} chars")
-                
-                extracted_texts.append(text)
-                logger.info(f"🔍 [DEBUG] Successfully processed PDF {i+1}")
-                
-            except Exception as e:
-                logger.error(f"❌ [DEBUG] Failed to extract text from {file_path}: {str(e)}")
-                logger.error(f"❌ [DEBUG] Error type: {type(e).__name__}")
-                extracted_texts.append("PDF_EXTRACTION_FAILED")
-        
+
+    except Exception:
+        _cleanup_files(saved_files)
+        raise
+
+    logger.info(f"💾 [DEBUG] Saved {len(saved_files)} files for processing")
+    return saved_files
+
+def _run_llm_processing(llm_processor: LLMProcessor, valid_texts: List[Dict[str, Any]], template_id: int,
+                        job_id: str, loop: asyncio.AbstractEventLoop, model: Optional[str] = None) -> Dict[str, Any]:
+    """Blocking LLM stage, run on the LLM thread pool"""
+    def on_section(section: str):
+        # Called from worker threads; job state belongs to the event loop
+        loop.call_soon_threadsafe(job_manager.record_section, job_id, section)
+
+    return llm_processor.process_texts(valid_texts, template_id, on_section=on_section, model=model)
+
+async def _run_parse_task(parse_slots: asyncio.Semaphore, fn, *args):
+    """Run one task on the parse pool, holding one of the job's parse slots"""
+    async with parse_slots:
+        return await stage_executors.run("parse", fn, *args)
+
+async def _parse_pdf(file_path: str, parse_slots: asyncio.Semaphore, max_shards: int) -> Dict[str, Any]:
+    """
+    Parse a PDF, sharding it by page range when it is large enough to benefit
+    """
+    if max_shards < 2:
+        return await _run_parse_task(parse_slots, parse_pdf, file_path)
+
+    page_count = await _run_parse_task(parse_slots, count_pdf_pages, file_path)
+    if page_count <= PAGE_SHARD_THRESHOLD:
+        return await _run_parse_task(parse_slots, parse_pdf, file_path)
+
+    # Sharded results are cached as a whole, so check before splitting the work
+    cached = await _run_parse_task(parse_slots, load_cached_extraction, file_path)
+    if cached:
+        return cached
+
+    shard_size = max(PAGE_SHARD_MIN_PAGES, -(-page_count // max_shards))
+    page_ranges = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+    logger.info(f"🔍 [DEBUG] Sharding {os.path.basename(file_path)} ({page_count} pages) into {len(page_ranges)} page ranges")
+
+    # With per-document engine selection, scan the whole document once rather than in every shard
+    document_engine = await _run_parse_task(parse_slots, select_pdf_engine, file_path)
+    shard_results = await asyncio.gather(*[
+        _run_parse_task(parse_slots, parse_pdf_pages, file_path, start, end, document_engine)
+        for start, end in page_ranges
+    ])
+    result = PDFExtractor(use_cache=False).merge_page_results(file_path, shard_results)
+    await _run_parse_task(parse_slots, cache_extraction, file_path, result)
+    return result
+
+def _extracted_document(filename: str, text: str, extraction_result: Dict[str, Any]) -> Dict[str, Any]:
+    """One file's input to the LLM stage; page count and financial score also feed model routing"""
+    return {
+        "filename": filename,
+        "text": text,
+        "page_count": extraction_result.get("page_count", 0),
+        "financial_content_score": extraction_result.get("financial_content_score", 0),
+        "page_scores": extraction_result.get("page_scores", []),
+        "tables": extraction_result.get("tables", [])
+    }
+
+async def _extract_single_file(job_id: str, index: int, total: int, file_path: str, parse_slots: asyncio.Semaphore, max_shards: int) -> Dict[str, Any]:
+    """
+    Parse one PDF on the parse pool, returning its text (or a failure marker) and per-page scores
+    """
+    # Uploads are saved as "<job_id>_<filename>"
+    filename = os.path.basename(file_path)[len(job_id) + 1:]
+    logger.info(f"🔍 [DEBUG] Processing PDF {index+1}/{total}: {os.path.basename(file_path)}")
+    job_manager.update_file(job_id, index, status="parsing")
+
+    try:
+        # FIX: PDFExtractor returns a dictionary, not a string
+        extraction_result = await _parse_pdf(file_path, parse_slots, max_shards)
+        logger.info(f"🔍 [DEBUG] PDF extraction completed for {os.path.basename(file_path)}")
+
+        # Check if extraction was successful
+        if extraction_result.get("status") != "success":
+            logger.error(f"❌ [DEBUG] PDF extraction failed: {extraction_result.get('error', 'Unknown error')}")
+            job_manager.update_file(job_id, index, status="failed", error=extraction_result.get('error', 'Unknown error'))
+            return {"filename": filename, "text": "PDF_EXTRACTION_FAILED"}
+
+        # Extract the actual text content from the result dictionary
+        text = extraction_result.get("text", "")
+        char_count = extraction_result.get("char_count", 0)
+        page_count = extraction_result.get("page_count", 0)
+
+        logger.info(f"🔍 [DEBUG] Extraction details - Pages: {page_count}, Chars: {char_count}, Status: {extraction_result.get('status')}")
+        logger.info(f"🔍 [DEBUG] Financial score: {extraction_result.get('financial_content_score', 0)}")
+        logger.info(f"🔍 [DEBUG] Tables found: {len(extraction_result.get('tables', []))}")
+
+        # Safe text preview logging
+        if text and isinstance(text, str):
+            preview = text[:200] + "..." if len(text) > 200 else text
+            logger.info(f"🔍 [DEBUG] First 200 chars: {preview}")
+        else:
+            logger.warning(f"🔍 [DEBUG] Text is empty or not string. Type: {type(text)}")
+
+        # Validate extracted text
+        if not text or len(text.strip()) < 10:
+            logger.warning(f"⚠️ [DEBUG] Little or no text extracted from {os.path.basename(file_path)}")
+            text = "PDF_CONTENT_UNAVAILABLE"
+        elif len(text.strip()) < 50:
+            logger.warning(f"⚠️ [DEBUG] Minimal text extracted from {os.path.basename(file_path)}: {len(text)} chars")
+
+        job_manager.update_file(job_id, index, status="success", page_count=page_count, char_count=char_count)
+        logger.info(f"🔍 [DEBUG] Successfully processed PDF {index+1}")
+        return _extracted_document(filename, text, extraction_result)
+
+    except Exception as e:
+        logger.error(f"❌ [DEBUG] Failed to extract text from {file_path}: {str(e)}")
+        logger.error(f"❌ [DEBUG] Error type: {type(e).__name__}")
+        job_manager.update_file(job_id, index, status="failed", error=str(e))
+        return {"filename": filename, "text": "PDF_EXTRACTION_FAILED"}
+
+async def _extract_data_internal(job_id: str, saved_files: List[str], template_id: int, llm_processor: LLMProcessor,
+                                 model: Optional[str] = None):
+    """
+    Internal function to handle PDF extraction with comprehensive logging
+    """
+    try:
+        logger.info("🔍 [DEBUG] STARTING _extract_data_internal")
+        logger.info(f"🔍 [DEBUG] Job ID: {job_id}")
+        logger.info(f"🔍 [DEBUG] Template ID: {template_id}")
+        logger.info(f"🔍 [DEBUG] Number of files: {len(saved_files)}")
+
+        # Extract text from PDFs with comprehensive error handling. Files are spread over
+        # the parse pool, capped per job so one large batch cannot take every worker;
+        # gather keeps the results in upload order.
+        job_manager.set_stage(job_id, "parsing")
+        parse_cap = PARSE_WORKERS_PER_JOB if PARALLEL_EXTRACTION else 1
+        parse_slots = asyncio.Semaphore(parse_cap)
+
+        logger.info(f"🔍 [DEBUG] Starting PDF text extraction (parallel: {PARALLEL_EXTRACTION}, per-job cap: {PARSE_WORKERS_PER_JOB})...")
+        extracted_texts = await asyncio.gather(*[
+            _extract_single_file(job_id, i, len(saved_files), file_path, parse_slots, parse_cap)
+            for i, file_path in enumerate(saved_files)
+        ])
         logger.info(f"📊 [DEBUG] Total text segments extracted: {len(extracted_texts)}")
-        logger.info(f"📊 [DEBUG] Extraction status: {[ 'SUCCESS' if text not in ['PDF_CONTENT_UNAVAILABLE', 'PDF_EXTRACTION_FAILED'] else 'FAILED' for text in extracted_texts ]}")
-        
+        logger.info(f"📊 [DEBUG] Extraction status: {[ 'SUCCESS' if text_data['text'] not in ['PDF_CONTENT_UNAVAILABLE', 'PDF_EXTRACTION_FAILED'] else 'FAILED' for text_data in extracted_texts ]}")
+
         # Validate texts before LLM processing
         valid_texts = []
-        for i, text in enumerate(extracted_texts):
+        for i, text_data in enumerate(extracted_texts):
+            text = text_data["text"]
             if text in ["PDF_CONTENT_UNAVAILABLE", "PDF_EXTRACTION_FAILED"]:
                 logger.warning(f"⚠️ [DEBUG] Skipping file {i} due to extraction failure")
                 continue
             if len(text.strip()) < 50:
                 logger.warning(f"⚠️ [DEBUG] File {i} has insufficient text: {len(text)} chars")
                 continue
-            valid_texts.append(text)
-        
+            valid_texts.append(text_data)
+
         logger.info(f"🔍 [DEBUG] Valid texts for LLM processing: {len(valid_texts)}/{len(extracted_texts)}")
-        
+
         if not valid_texts:
             raise HTTPException(status_code=400, detail="No valid PDF content could be extracted from any file")
-        
+
         # Process with LLM
-        llm_processor = LLMProcessor()
+        job_manager.set_stage(job_id, "llm_processing")
         logger.info(f"🧠 [DEBUG] Starting LLM processing with template: {template_id}")
         logger.info(f"🧠 [DEBUG] Number of valid texts to process: {len(valid_texts)}")
-        
+
         try:
-            structured_data = llm_processor.process_texts(valid_texts, template_id)
+            structured_data = await stage_executors.run(
+                "llm", _run_llm_processing, llm_processor, valid_texts, template_id, job_id, asyncio.get_running_loop(),
+                model
+            )
             logger.info(f"✅ [DEBUG] LLM processing completed successfully")
             logger.info(f"✅ [DEBUG] Data keys returned: {list(structured_data.keys()) if structured_data else 'None'}")
-            
+
             if not structured_data:
                 logger.warning("⚠️ [DEBUG] LLM returned empty structured data")
                 structured_data = {"error": "No data could be extracted"}
-                
+
         except Exception as e:
             logger.error(f"❌ [DEBUG] LLM processing failed: {str(e)}")
             logger.error(f"❌ [DEBUG] LLM error type: {type(e).__name__}")
             raise HTTPException(status_code=500, detail=f"LLM processing failed: {str(e)}")
-        
+
         # Generate Excel file
-        excel_generator = ExcelGenerator()
+        job_manager.set_stage(job_id, "excel_generation")
         output_path = os.path.join(OUTPUT_DIR, f"{job_id}_extracted_data.xlsx")
         logger.info(f"📊 [DEBUG] Generating Excel file at: {output_path}")
-        
+
         try:
-            excel_generator.generate_excel(structured_data, template_id, output_path)
+            await stage_executors.run("excel", generate_excel, structured_data, template_id, output_path)
             logger.info(f"✅ [DEBUG] Excel file generated successfully")
-            
+
             # Verify file was created
             if os.path.exists(output_path):
                 file_size = os.path.getsize(output_path)
@@ -399,25 +557,16 @@ async def _extract_data_internal(files: List[UploadFile], template_id: int):
             else:
                 logger.error(f"❌ [DEBUG] Output file was not created: {output_path}")
                 raise HTTPException(status_code=500, detail="Failed to create output file")
-                
+
         except Exception as e:
             logger.error(f"❌ [DEBUG] Excel generation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Excel generation failed: {str(e)}")
-        
+
         # Clean up uploaded files
         logger.info("🔍 [DEBUG] Cleaning up uploaded files...")
-        cleanup_count = 0
-        for file_path in saved_files:
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    cleanup_count += 1
-                    logger.info(f"🔍 [DEBUG] Cleaned up: {os.path.basename(file_path)}")
-                except Exception as cleanup_error:
-                    logger.error(f"⚠️ [DEBUG] Cleanup failed for {file_path}: {cleanup_error}")
-        
+        cleanup_count = _cleanup_files(saved_files)
         logger.info(f"🔍 [DEBUG] Cleaned up {cleanup_count}/{len(saved_files)} files")
-        
+
         # Prepare response
         response_data = {
             "job_id": job_id,
@@ -425,38 +574,24 @@ async def _extract_data_internal(files: List[UploadFile], template_id: int):
             "message": f"Data extracted successfully using Template {template_id}",
             "template_used": template_id,
             "download_url": f"/api/download/{job_id}",
-            "files_processed": len(files),
+            "files_processed": len(saved_files),
             "files_successful": len(valid_texts),
-            "files_failed": len(files) - len(valid_texts)
+            "files_failed": len(saved_files) - len(valid_texts)
         }
-        
+
         logger.info(f"🎉 [DEBUG] Extraction completed successfully for job {job_id}")
         logger.info(f"📋 [DEBUG] FINAL RESPONSE - Template used: {template_id}")
         logger.info(f"📋 [DEBUG] Response data: {response_data}")
-        
+
         return response_data
-        
+
     except HTTPException:
         logger.error("🔍 [DEBUG] HTTPException raised in _extract_data_internal")
         raise
     except Exception as e:
         logger.error(f"❌ [DEBUG] Unhandled exception in _extract_data_internal: {str(e)}")
         logger.error(f"❌ [DEBUG] Exception type: {type(e).__name__}")
-        
-        # Enhanced cleanup on error
-        if 'saved_files' in locals():
-            logger.info("🔍 [DEBUG] Starting emergency cleanup...")
-            cleanup_count = 0
-            for file_path in saved_files:
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        cleanup_count += 1
-                        logger.info(f"🔍 [DEBUG] Emergency cleanup: {os.path.basename(file_path)}")
-                    except Exception as cleanup_error:
-                        logger.error(f"⚠️ [DEBUG] Emergency cleanup failed for {file_path}: {cleanup_error}")
-            logger.info(f"🔍 [DEBUG] Emergency cleanup completed: {cleanup_count} files")
-        
+
         # Provide more specific error messages
         error_msg = str(e).lower()
         if "pdf" in error_msg or "extract" in error_msg:
@@ -467,39 +602,86 @@ async def _extract_data_internal(files: List[UploadFile], template_id: int):
             raise HTTPException(status_code=408, detail="Processing timeout")
         else:
             raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
+    finally:
+        # Uploads never outlive the job, whatever the outcome (including timeouts)
+        if any(os.path.exists(file_path) for file_path in saved_files):
+            logger.info("🔍 [DEBUG] Starting emergency cleanup...")
+            cleanup_count = _cleanup_files(saved_files)
+            logger.info(f"🔍 [DEBUG] Emergency cleanup completed: {cleanup_count} files")
 
-@app.post("/api/extract")
+@app.post("/api/extract", status_code=202)
 async def extract_data_from_pdfs(
     files: List[UploadFile] = File(...),
-    template_id: int = Form(...)
+    template_id: int = Form(...),
+    model: Optional[str] = Form(None),
+    llm_processor: LLMProcessor = Depends(get_llm_processor)
 ):
     """
-    Extract data from uploaded PDFs using the specified template
+    Accept PDFs for extraction and queue the job, returning its job_id immediately
+
+    model, if given, is tried first instead of the model the router would pick
     """
     logger.info("🚀 [DEBUG] ========== NEW EXTRACTION REQUEST ==========")
     logger.info(f"🚀 [DEBUG] Endpoint: /api/extract")
     logger.info(f"🚀 [DEBUG] Template ID: {template_id}")
     logger.info(f"🚀 [DEBUG] Files received: {[f.filename for f in files]}")
-    
+
+    # Validate template ID
+    if template_id not in [1, 2]:
+        raise HTTPException(status_code=400, detail="Invalid template ID. Use 1 or 2.")
+
+    model_names = [model_config["name"] for model_config in llm_processor.available_models]
+    if model and model not in model_names:
+        raise HTTPException(status_code=400, detail=f"Unknown model. Use one of: {', '.join(model_names)}")
+
+    # Validate files
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+
+    logger.info("🔍 [DEBUG] Template and file validation passed")
+
+    # Generate unique job ID
+    job_id = str(uuid.uuid4())
+    logger.info(f"🔍 [DEBUG] Generated Job ID: {job_id}")
+
     try:
-        # Set timeout for entire operation
-        logger.info(f"⏰ [DEBUG] Setting processing timeout: {PROCESSING_TIMEOUT} seconds")
-        result = await asyncio.wait_for(
-            _extract_data_internal(files, template_id), 
-            timeout=PROCESSING_TIMEOUT
-        )
-        logger.info("✅ [DEBUG] Extraction completed within timeout")
-        return result
-        
-    except asyncio.TimeoutError:
-        logger.error("⏰ [DEBUG] Extraction timed out!")
-        raise HTTPException(status_code=408, detail="Extraction timed out. Please try with smaller files or fewer PDFs.")
+        saved_files = await _save_uploaded_files(files, job_id)
     except HTTPException:
-        logger.error("🔍 [DEBUG] HTTPException propagated to main endpoint")
         raise
     except Exception as e:
-        logger.error(f"❌ [DEBUG] Unexpected error in main endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+        logger.error(f"❌ [DEBUG] Failed to save uploads: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to save uploaded files: {str(e)}")
+
+    job_manager.create_job(template_id, [f.filename for f in files], job_id=job_id)
+    try:
+        job_manager.submit(job_id, lambda: _extract_data_internal(job_id, saved_files, template_id, llm_processor, model))
+    except JobQueueFullError as e:
+        _cleanup_files(saved_files)
+        logger.error(f"🚦 [DEBUG] {str(e)}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please try again shortly.")
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "message": f"Extraction queued using Template {template_id}",
+            "template_used": template_id,
+            "status_url": f"/api/jobs/{job_id}",
+            "download_url": f"/api/download/{job_id}"
+        }
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Report stage, per-file progress and errors for an extraction job
+    """
+    job = job_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or has expired")
+
+    return job
 
 @app.get("/api/download/{job_id}")
 async def download_file(job_id: str):
@@ -555,12 +737,56 @@ async def health_check():
         "service": "PDF Extraction Tool",
         "upload_dir": upload_dir_exists,
         "output_dir": output_dir_exists,
+        "job_queue": job_manager.get_statistics(),
+        "llm_processor": getattr(app.state, "llm_processor", None) is not None,
         "timestamp": str(asyncio.get_event_loop().time())
     }
     
     logger.info(f"🔍 [DEBUG] Health status: {health_status}")
     return health_status
 
+def _store_statistics(llm_processor: Optional[LLMProcessor]) -> Dict[str, Any]:
+    """Statistics read from the SQLite stores; blocking, so run off the event loop"""
+    return {
+        "extraction_cache": extraction_cache.get_statistics() if extraction_cache else {"enabled": False},
+        "llm_cache": llm_cache.get_statistics() if llm_cache else {"enabled": False},
+        "llm_routing": llm_processor.model_router.get_statistics() if llm_processor else {"enabled": False}
+    }
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Stage executor and job queue metrics"""
+    store_statistics = await asyncio.to_thread(_store_statistics, app.state.llm_processor)
+    return {
+        "stages": stage_executors.get_metrics(),
+        "job_queue": job_manager.get_statistics(),
+        "extraction_cache": store_statistics["extraction_cache"],
+        "llm_cache": store_statistics["llm_cache"],
+        "llm_scheduler": app.state.llm_scheduler.get_statistics(),
+        "llm_routing": store_statistics["llm_routing"]
+    }
+
+@app.post("/api/config/reload")
+async def reload_config(request: Request):
+    """Reload the LLM configuration (.env, API key, template configs) without restarting"""
+    llm_processor = getattr(request.app.state, "llm_processor", None)
+
+    try:
+        if llm_processor is None:
+            llm_processor = LLMProcessor(scheduler=request.app.state.llm_scheduler)
+            request.app.state.llm_processor = llm_processor
+        else:
+            llm_processor.reload_config()
+    except Exception as e:
+        logger.error(f"❌ Configuration reload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Configuration reload failed: {str(e)}")
+
+    return {
+        "status": "reloaded",
+        "available_models": [model["name"] for model in llm_processor.available_models],
+        "supported_templates": list(llm_processor.template_configs.keys())
+    }
+
 @app.get("/api/debug-env")
 async def debug_env():
     """Debug endpoint to check environment variables"""
@@ -0,0 +1,150 @@
+# extraction_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+from app.services.sqlite_store import connect, create_store, evict_least_recently_used, increment
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "cache")
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+EXTRACTION_CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# One cache per process; every worker process opens its own connection to the same file
+_shared_cache = None
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of PDF extraction results.
+
+    Entries are keyed by the SHA-256 of the file bytes plus the extractor version and
+    settings, stored as compressed JSON in SQLite so they are shared by every worker
+    process, and evicted least-recently-used once the store exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_MB * 1024 * 1024,
+                 ttl_seconds: int = EXTRACTION_CACHE_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.db_path = os.path.join(cache_dir, "extraction_cache.sqlite3")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        create_store(self.db_path)
+        with connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_accessed ON entries (last_accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def make_key(self, file_path: str, version: str, settings: Dict[str, Any]) -> str:
+        """Cache key from the file contents, extractor version and extraction settings"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        settings_str = json.dumps(settings, sort_keys=True)
+        return f"{digest.hexdigest()}:{version}:{hashlib.sha256(settings_str.encode()).hexdigest()[:16]}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, counting the hit or miss"""
+        now = time.time()
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                increment(conn, "misses")
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds and created_at + self.ttl_seconds < now:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                increment(conn, "misses")
+                increment(conn, "expired")
+                return None
+
+            conn.execute("UPDATE entries SET last_accessed = ? WHERE key = ?", (now, key))
+            increment(conn, "hits")
+
+        return json.loads(zlib.decompress(value))
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a result, then evict least-recently-used entries over the size limit"""
+        value = zlib.compress(json.dumps(result, default=str).encode("utf-8"))
+        if len(value) > self.max_bytes:
+            logger.warning(f"⚠️ Extraction result too large to cache ({len(value)} bytes)")
+            return
+
+        now = time.time()
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now)
+            )
+            self._evict(conn)
+
+    def clear(self):
+        """Remove every cached entry"""
+        with connect(self.db_path) as conn:
+            conn.execute("DELETE FROM entries")
+        logger.info("Extraction cache cleared")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hit/miss counters and store size"""
+        with connect(self.db_path) as conn:
+            entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "expired": counters.get("expired", 0)
+        }
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least-recently-used entries until the store fits in max_bytes"""
+        evicted = evict_least_recently_used(conn, "entries", self.max_bytes)
+        if evicted:
+            logger.info(f"🧹 Evicted {evicted} extraction cache entries")
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Process-wide extraction cache, or None when caching is disabled"""
+    global _shared_cache
+
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+
+    if _shared_cache is None:
+        try:
+            _shared_cache = ExtractionCache()
+        except Exception as e:
+            logger.warning(f"⚠️ Extraction cache unavailable: {e}")
+            return None
+
+    return _shared_cache
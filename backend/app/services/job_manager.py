@@ -0,0 +1,257 @@
+# job_manager.py
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_FAILED = "failed"
+
+# Pipeline stages and the share of overall progress they cover
+JOB_STAGES = {
+    "queued": (0, 0),
+    "parsing": (0, 50),
+    "llm_processing": (50, 90),
+    "excel_generation": (90, 100),
+    "finished": (100, 100)
+}
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue cannot accept any more work"""
+    pass
+
+
+class JobManager:
+    """
+    Bounded background worker pool for extraction jobs with per-job status tracking
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 20,
+                 job_timeout: float = 600, retention_seconds: int = 3600):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.job_timeout = job_timeout
+        self.retention_seconds = retention_seconds
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._handlers: Dict[str, Callable[[], Awaitable[Dict[str, Any]]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        logger.info(f"Job Manager initialized (workers: {self.max_workers}, queue size: {self.max_queue_size})")
+
+    async def start(self):
+        """Start the background workers"""
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(worker_id + 1))
+            for worker_id in range(self.max_workers)
+        ]
+        logger.info(f"🚦 Started {len(self._workers)} extraction workers")
+
+    async def stop(self):
+        """Cancel the background workers"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("🚦 Extraction workers stopped")
+
+    def create_job(self, template_id: int, filenames: List[str], job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Register a new job in the queued state"""
+        self._prune_finished_jobs()
+
+        job_id = job_id or str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "status": JOB_STATUS_QUEUED,
+            "stage": "queued",
+            "template_id": template_id,
+            "files": [
+                {
+                    "filename": filename,
+                    "status": "pending",
+                    "page_count": None,
+                    "char_count": None,
+                    "error": None
+                }
+                for filename in filenames
+            ],
+            "progress": {
+                "files_total": len(filenames),
+                "files_done": 0,
+                "files_failed": 0,
+                "percent": 0
+            },
+            "sections_completed": [],
+            "errors": [],
+            "error": None,
+            "result": None,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None
+        }
+        self.jobs[job_id] = job
+        return job
+
+    def submit(self, job_id: str, handler: Callable[[], Awaitable[Dict[str, Any]]]):
+        """Queue a job for background execution"""
+        if self._queue is None:
+            raise RuntimeError("Job manager has not been started")
+
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            self.jobs.pop(job_id, None)
+            raise JobQueueFullError(f"Job queue is full ({self.max_queue_size} jobs waiting)")
+
+        self._handlers[job_id] = handler
+        logger.info(f"📥 Job {job_id} queued (queue depth: {self._queue.qsize()})")
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get job status"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        status = dict(job)
+        if job["status"] == JOB_STATUS_QUEUED:
+            status["queue_position"] = self._queue_position(job_id)
+        return status
+
+    def set_stage(self, job_id: str, stage: str):
+        """Move a job to a new pipeline stage"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+
+        job["stage"] = stage
+        self._update_progress(job)
+        logger.info(f"🔄 Job {job_id} stage: {stage}")
+
+    def update_file(self, job_id: str, index: int, **fields):
+        """Update per-file progress"""
+        job = self.jobs.get(job_id)
+        if job is None or not 0 <= index < len(job["files"]):
+            return
+
+        job["files"][index].update(fields)
+        if fields.get("error"):
+            self.add_error(job_id, f"{job['files'][index]['filename']}: {fields['error']}")
+
+        job["progress"]["files_done"] = sum(1 for f in job["files"] if f["status"] in ("success", "failed"))
+        job["progress"]["files_failed"] = sum(1 for f in job["files"] if f["status"] == "failed")
+        self._update_progress(job)
+
+    def record_section(self, job_id: str, section: str):
+        """Note a result section that finished extracting, so clients can see partial progress"""
+        job = self.jobs.get(job_id)
+        if job is not None and section not in job["sections_completed"]:
+            job["sections_completed"].append(section)
+
+    def add_error(self, job_id: str, message: str):
+        """Record a non-fatal error on a job"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job["errors"].append(message)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+        counts = {status: 0 for status in (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)}
+        for job in self.jobs.values():
+            counts[job["status"]] += 1
+
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "jobs": counts
+        }
+
+    async def _worker(self, worker_id: int):
+        """Pull jobs off the queue and run them one at a time"""
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id, worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Worker {worker_id} crashed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str, worker_id: int):
+        """Run a single job and record its outcome"""
+        job = self.jobs.get(job_id)
+        handler = self._handlers.pop(job_id, None)
+        if job is None or handler is None:
+            return
+
+        job["status"] = JOB_STATUS_RUNNING
+        job["started_at"] = datetime.now().isoformat()
+        started = time.monotonic()
+        logger.info(f"🚀 Worker {worker_id} started job {job_id}")
+
+        try:
+            result = await asyncio.wait_for(handler(), timeout=self.job_timeout)
+            job["result"] = result
+            job["status"] = JOB_STATUS_COMPLETED
+            job["stage"] = "finished"
+            self._update_progress(job)
+            logger.info(f"🎉 Job {job_id} completed in {time.monotonic() - started:.1f}s")
+
+        except asyncio.TimeoutError:
+            self._fail_job(job, 408, "Extraction timed out. Please try with smaller files or fewer PDFs.")
+        except asyncio.CancelledError:
+            self._fail_job(job, 503, "Job cancelled during shutdown")
+            raise
+        except Exception as e:
+            # HTTPException carries a status code and detail, anything else is a 500
+            self._fail_job(job, getattr(e, "status_code", 500), str(getattr(e, "detail", e)))
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+
+    def _fail_job(self, job: Dict[str, Any], status_code: int, detail: str):
+        """Mark a job as failed"""
+        job["status"] = JOB_STATUS_FAILED
+        job["error"] = {"status_code": status_code, "detail": detail}
+        job["errors"].append(detail)
+        logger.error(f"❌ Job {job['job_id']} failed at stage '{job['stage']}': {detail}")
+
+    def _update_progress(self, job: Dict[str, Any]):
+        """Recompute overall progress from the stage and per-file progress"""
+        start, end = JOB_STAGES.get(job["stage"], (0, 0))
+        percent = start
+        if job["stage"] == "parsing" and job["progress"]["files_total"]:
+            percent += (end - start) * job["progress"]["files_done"] / job["progress"]["files_total"]
+        job["progress"]["percent"] = round(percent)
+
+    def _queue_position(self, job_id: str) -> int:
+        """Position of a queued job, 1-based"""
+        queued = [jid for jid, job in self.jobs.items() if job["status"] == JOB_STATUS_QUEUED]
+        return queued.index(job_id) + 1 if job_id in queued else 0
+
+    def _prune_finished_jobs(self):
+        """Drop finished jobs older than the retention window"""
+        cutoff = datetime.now().timestamp() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job["finished_at"] and datetime.fromisoformat(job["finished_at"]).timestamp() < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+        if expired:
+            logger.info(f"🧹 Pruned {len(expired)} finished jobs")
@@ -0,0 +1,320 @@
+# json_stream.py
+import bisect
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Characters tolerated before the opening brace that are not part of a code fence
+DEFAULT_MAX_PREAMBLE = 200
+
+# Building blocks for skipping ahead to the next bracket that changes nesting depth:
+# whole strings (escapes included), then whole objects/arrays with no brackets inside
+STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+PLAIN = r'[^{}\[\]"]*(?:' + STRING + r'[^{}\[\]"]*)*'
+FLAT = r'[{\[]' + PLAIN + r'[}\]]'
+SKIP_PATTERN = re.compile(PLAIN + r'(?:' + FLAT + PLAIN + r')*', re.DOTALL)
+
+# An opening brace that starts a JSON object rather than prose: a key, an empty object or the end of the text
+OBJECT_START_PATTERN = re.compile(r'\{\s*(?:"|\}|$)')
+
+# Tokens that matter when cutting a truncated object back to its last complete element
+REPAIR_TOKEN_PATTERN = re.compile(STRING + r'|["{}\[\],]', re.DOTALL)
+
+# Decodes one value from a given offset, ignoring what follows it
+DECODER = json.JSONDecoder()
+
+# Accepted by json but not by orjson
+ORJSON_REJECTED_TOKENS = ("NaN", "Infinity", "\\ud", "\\uD")
+
+
+def loads(text: str) -> Any:
+    """json.loads through orjson when it is installed; raises ValueError on invalid JSON"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json; only retry what json would accept
+            if not any(token in text for token in ORJSON_REJECTED_TOKENS):
+                raise
+    return json.loads(text)
+
+
+def _object_spans(text: str, start: int = 0) -> Iterator[Tuple[int, Optional[int]]]:
+    """
+    (start, end) of every outermost balanced {...} in text from start, in order,
+    found in one linear pass; the last end is None when the text stops inside
+    an object.
+
+    Strings and innermost objects/arrays are skipped by one regex, so the loop
+    only visits brackets that nest; braces and escaped quotes inside strings do
+    not count. Strings are only tracked inside an object: quotes in surrounding
+    prose do not matter.
+    """
+    start = text.find("{", start)
+    while start != -1:
+        depth = 1
+        position = start + 1
+        while depth:
+            position = SKIP_PATTERN.match(text, position).end()
+            # The end of the text, or a string that never closes
+            if position == len(text) or text[position] == '"':
+                yield start, None
+                return
+            depth += 1 if text[position] in "{[" else -1
+            position += 1
+        yield start, position
+        start = text.find("{", position)
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """Every outermost balanced {...} in text, in order"""
+    for start, end in _object_spans(text):
+        if end is not None:
+            yield text[start:end]
+
+
+def ends_inside_object(text: str) -> bool:
+    """
+    Whether the reply's JSON object never closes, as when it is cut off at
+    max_tokens. Only the first brace that opens an object counts, so braces in
+    prose before or after the object do not.
+    """
+    match = OBJECT_START_PATTERN.search(text)
+    if match is None:
+        return False
+    _, end = next(_object_spans(text, match.start()))
+    return end is None
+
+
+def repair_truncated_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Close a JSON object that was cut off mid-way.
+
+    The text is cut back to the last complete element and the containers still
+    open are closed. A record inside a list is kept whole or not at all, while a
+    plain object keeps the fields that were complete. Returns None when nothing
+    usable is left.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    closers: List[str] = []
+    cut = None
+    for match in REPAIR_TOKEN_PATTERN.finditer(text, start):
+        token = match.group()
+        if token == '"':
+            # A string that never closes
+            break
+        if token[0] == '"':
+            continue
+        if token in "{[":
+            closers.append("}" if token == "{" else "]")
+        elif token in "}]":
+            if not closers:
+                break
+            closers.pop()
+            if not closers:
+                cut = (match.end(), "")
+                break
+        # Inside a record of a list, wait for the record to close
+        if "]" in closers[:-1]:
+            continue
+        cut = (match.start() if token == "," else match.end(), "".join(reversed(closers)))
+
+    if cut is None:
+        return None
+    position, closing = cut
+    try:
+        value = loads(text[start:position] + closing)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) and value else None
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    The first JSON object in a model response, whether bare, in a code fence or
+    surrounded by prose. Raises ValueError when there is none.
+    """
+    # Almost always the response is one object, possibly fenced or with a sentence around it
+    match = OBJECT_START_PATTERN.search(text)
+    first, last = match.start() if match else text.find("{"), text.rfind("}")
+    if first != -1 and last > first:
+        try:
+            value = loads(text[first:last + 1])
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        # Prose with braces after the object: decode the object alone
+        try:
+            value, _ = DECODER.raw_decode(text, first)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+
+    for candidate in iter_json_objects(text):
+        try:
+            value = loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+
+    raise ValueError("No valid JSON object found in response")
+
+
+class StreamAbort(Exception):
+    """Raised while streaming when the output can no longer become a valid result"""
+    pass
+
+
+class IncrementalJSONParser:
+    """
+    Parses a streamed JSON object as text arrives, one character at a time.
+
+    Each top-level key/value pair is decoded and passed to on_section as soon as its
+    value closes. feed() raises StreamAbort when the output is clearly unusable: too
+    much non-JSON text before the object, or a top-level key outside expected_keys
+    before any expected key has been seen.
+    """
+
+    def __init__(self, expected_keys: Optional[Iterable[str]] = None,
+                 on_section: Optional[Callable[[str, Any], None]] = None,
+                 max_preamble: int = DEFAULT_MAX_PREAMBLE):
+        self.expected_keys: Optional[Set[str]] = set(expected_keys) if expected_keys is not None else None
+        self.on_section = on_section
+        self.max_preamble = max_preamble
+
+        self.sections: List[str] = []
+        self.complete = False
+        self._seen_expected = False
+
+        self._chunks: List[str] = []
+        # Position in the text where each chunk starts
+        self._offsets: List[int] = []
+        self._position = 0
+        self._started = False
+        self._preamble: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start = None
+        self._key: Optional[str] = None
+        self._value_start = None
+
+    def feed(self, chunk: str):
+        """Consume the next piece of streamed text"""
+        if not chunk or self.complete:
+            return
+
+        self._chunks.append(chunk)
+        self._offsets.append(self._position)
+        for char in chunk:
+            position = self._position
+            self._position += 1
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                else:
+                    self._check_preamble(char)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = self._slice(self._key_start + 1, position)
+                        self._key_start = None
+                        self._check_key(self._key)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = position
+                    self._expect_key = False
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._close_value(position)
+                    self.complete = True
+                    return
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == ":":
+                    self._value_start = position + 1
+                elif char == ",":
+                    self._close_value(position)
+                    self._expect_key = True
+
+    def text(self) -> str:
+        """Everything received so far"""
+        return "".join(self._chunks)
+
+    def _check_preamble(self, char: str):
+        if char.isspace() or char == "`":
+            return
+        self._preamble.append(char)
+        preamble = "".join(self._preamble)
+        # A "```json" fence is not prose
+        if preamble.lower() == "json"[:len(preamble)]:
+            return
+        if len(preamble) > self.max_preamble:
+            raise StreamAbort(f"More than {self.max_preamble} characters of text before the JSON object")
+
+    def _check_key(self, key: str):
+        if self.expected_keys is None or self._seen_expected:
+            return
+        if key in self.expected_keys:
+            self._seen_expected = True
+            return
+        raise StreamAbort(f"Unexpected top-level key '{key}'")
+
+    def _close_value(self, position: int):
+        """A top-level value ended just before position; decode and emit it"""
+        if self._key is None or self._value_start is None:
+            return
+
+        key, raw_value = self._key, self._slice(self._value_start, position)
+        self._key = None
+        self._value_start = None
+
+        try:
+            value = loads(raw_value)
+        except ValueError:
+            logger.debug(f"Streamed section '{key}' is not valid JSON yet, leaving it to the final parse")
+            return
+
+        if self.expected_keys is not None and key in self.expected_keys:
+            self.sections.append(key)
+        if self.on_section:
+            self.on_section(key, value)
+
+    def _slice(self, start: int, end: int) -> str:
+        """text()[start:end], joining only the chunks that cover it"""
+        first = bisect.bisect_right(self._offsets, start) - 1
+        last = bisect.bisect_left(self._offsets, end)
+        offset = self._offsets[first]
+        return "".join(self._chunks[first:last])[start - offset:end - offset]
@@ -0,0 +1,383 @@
+# kpi_extractor.py
+import logging
+import re
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from app.services.page_selector import split_pages
+
+logger = logging.getLogger(__name__)
+
+# Value kinds
+PERCENT = "percent"
+MULTIPLE = "multiple"
+AMOUNT = "amount"
+YEAR = "year"
+
+# KPIs that documents state verbatim, the schema fields they fill and the labels they go by
+KPI_DEFINITIONS = {
+    "gross_irr": {
+        "fields": ["Gross_IRR"],
+        "kind": PERCENT,
+        "labels": ["gross irr", "gross internal rate of return"]
+    },
+    "net_irr": {
+        "fields": ["Net_IRR"],
+        "kind": PERCENT,
+        "labels": ["net irr", "net internal rate of return"]
+    },
+    "tvpi": {
+        "fields": ["TVPI"],
+        "kind": MULTIPLE,
+        "labels": ["tvpi", "total value to paid-in", "total value to paid in", "total value to paid-in capital"]
+    },
+    "dpi": {
+        "fields": ["DPI"],
+        "kind": MULTIPLE,
+        "labels": ["dpi", "distributions to paid-in", "distributions to paid in", "distributions to paid-in capital"]
+    },
+    "rvpi": {
+        "fields": ["RVPI"],
+        "kind": MULTIPLE,
+        "labels": ["rvpi", "residual value to paid-in", "residual value to paid in", "residual value to paid-in capital"]
+    },
+    "net_nav": {
+        "fields": ["NAV_Net"],
+        "kind": AMOUNT,
+        "labels": ["nav", "net nav", "net asset value"]
+    },
+    "gross_nav": {
+        "fields": ["NAV_Gross"],
+        "kind": AMOUNT,
+        "labels": ["gross nav", "gross asset value"]
+    },
+    "beginning_nav": {
+        "fields": ["Beginning_NAV"],
+        "kind": AMOUNT,
+        "labels": ["beginning nav", "opening nav", "beginning net asset value", "opening net asset value"]
+    },
+    "ending_nav": {
+        "fields": ["Ending_NAV"],
+        "kind": AMOUNT,
+        "labels": ["ending nav", "closing nav", "ending net asset value", "closing net asset value"]
+    },
+    "commitments": {
+        "fields": ["Total_Commitments", "Total_Commitment"],
+        "kind": AMOUNT,
+        "labels": ["total commitments", "total commitment", "committed capital", "total committed capital",
+                   "capital commitments"]
+    },
+    "paid_in": {
+        "fields": ["Paid_In_Capital"],
+        "kind": AMOUNT,
+        "labels": ["paid-in capital", "paid in capital", "called capital", "total called capital"]
+    },
+    "remaining_commitments": {
+        "fields": ["Remaining_Commitment", "Remaining_Commitments"],
+        "kind": AMOUNT,
+        "labels": ["remaining commitment", "remaining commitments", "unfunded commitment", "unfunded commitments",
+                   "uncalled capital", "uncalled commitments"]
+    },
+    "contributions": {
+        "fields": ["Total_Contributions"],
+        "kind": AMOUNT,
+        "labels": ["total contributions", "cumulative contributions"]
+    },
+    "distributions": {
+        "fields": ["Total_Distributions"],
+        "kind": AMOUNT,
+        "labels": ["total distributions", "cumulative distributions"]
+    },
+    "vintage_year": {
+        "fields": ["Vintage_Year"],
+        "kind": YEAR,
+        "labels": ["vintage year", "vintage"]
+    },
+    "fund_size": {
+        "fields": ["Fund_Size"],
+        "kind": AMOUNT,
+        "labels": ["fund size"]
+    },
+    "aum": {
+        "fields": ["Assets_Under_Management"],
+        "kind": AMOUNT,
+        "labels": ["assets under management", "aum"]
+    }
+}
+
+
+def _label_key(text: str) -> str:
+    return re.sub(r"[\s\-]+", " ", text.lower()).strip()
+
+
+LABEL_TO_KPI = {_label_key(label): kpi for kpi, definition in KPI_DEFINITIONS.items() for label in definition["labels"]}
+
+# Longest labels first so "beginning nav" wins over "nav"
+LABEL_PATTERN = re.compile(
+    r"(?<![a-z])(?:" + "|".join(
+        re.escape(label).replace(r"\ ", r"[\s\-]+")
+        for label in sorted(LABEL_TO_KPI, key=len, reverse=True)
+    ) + r")(?![a-z])",
+    re.IGNORECASE
+)
+
+VALUE = (
+    r"(?P<negative>\((?=\s*[$€£]?\s*\d)|[-−](?=[$€£]?\d))?\s*(?P<currency>[$€£])?\s*"
+    r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+    r"(?![/\-.]?\d)\s*"
+    r"(?P<unit>%|x(?![a-z])|×|(?:million|mm|mn|m|billion|bn|b|thousand|k)(?![a-z]))?\s*\)?"
+)
+VALUE_PATTERN = re.compile(VALUE, re.IGNORECASE)
+
+# In running text the value follows its label within 30 characters, with no digits between them
+VALUE_AFTER_LABEL_PATTERN = re.compile(r"(?P<gap>[^\d]{0,30}?)" + VALUE, re.IGNORECASE)
+
+# Words that put a date or a per-unit qualifier between a label and the number after it
+GAP_STOPWORDS = re.compile(r"\b(?:per|as of|as at|at|on|since|from|to|in)\b", re.IGNORECASE)
+
+SCALE_UNITS = {
+    "thousand": 1e3, "k": 1e3,
+    "million": 1e6, "mm": 1e6, "mn": 1e6, "m": 1e6,
+    "billion": 1e9, "bn": 1e9, "b": 1e9
+}
+
+# Scale statements such as "($ in millions)", "(USD 000s)" or "(€m)": a short parenthesised note
+SCALE_NOTE_PATTERN = re.compile(r"\(([^()\d]{0,25}0{3}'?s?[^()\d]{0,10}|[^()\d]{1,30})\)")
+SCALE_NOTE_CURRENCY = re.compile(r"[$€£]|\b(?:usd|eur|gbp|chf)", re.IGNORECASE)
+SCALE_NOTE_FILLER = re.compile(r"[$€£'’.\s]|\b(?:usd|eur|gbp|chf|in|of|amounts?|figures?)\b", re.IGNORECASE)
+SCALE_WORDS = {
+    "thousand": 1e3, "thousands": 1e3, "000": 1e3, "000s": 1e3,
+    "million": 1e6, "millions": 1e6, "mm": 1e6, "mn": 1e6,
+    "billion": 1e9, "billions": 1e9, "bn": 1e9
+}
+# Single letters are footnote markers like "(b)" unless a currency comes with them
+SCALE_LETTERS = {"k": 1e3, "m": 1e6, "b": 1e9}
+
+YEAR_RANGE = (1970, 2100)
+
+
+def from_percent(number: float) -> float:
+    """A percentage as the decimal the templates use (15% = 0.15), without float noise"""
+    return round(number / 100, 12)
+
+
+def note_scale(note: str) -> Optional[float]:
+    """The multiplier a "($ in millions)"-style note states, or None if it is not a scale note"""
+    word = SCALE_NOTE_FILLER.sub("", note.strip("()")).lower()
+    if word in SCALE_WORDS:
+        return SCALE_WORDS[word]
+    if word in SCALE_LETTERS and SCALE_NOTE_CURRENCY.search(note):
+        return SCALE_LETTERS[word]
+    return None
+
+
+def text_scale(text: str) -> Optional[float]:
+    """The scale stated by the first scale note in text, e.g. a table or column header"""
+    for match in SCALE_NOTE_PATTERN.finditer(str(text or "")):
+        scale = note_scale(match.group())
+        if scale:
+            return scale
+    return None
+
+
+def parse_value(match: re.Match, kind: str, percent_hint: bool = False, scale: Optional[float] = None) -> Optional[float]:
+    """
+    The number a VALUE_PATTERN match stands for, or None if it is not a plausible
+    value of this kind. Percentages are returned as decimals (15% = 0.15);
+    scale multiplies amounts written without a unit.
+    """
+    raw_number = match.group("number")
+    number = float(raw_number.replace(",", ""))
+    unit = (match.group("unit") or "").lower()
+    negative = match.group("negative") is not None
+
+    if kind == YEAR:
+        if unit or match.group("currency") or negative or not re.fullmatch(r"\d{4}", raw_number):
+            return None
+        return int(number) if YEAR_RANGE[0] <= number <= YEAR_RANGE[1] else None
+
+    if kind == PERCENT:
+        if unit != "%" and not (percent_hint and not unit):
+            return None
+        number = from_percent(number)
+    elif kind == MULTIPLE:
+        if unit not in ("x", "×") and (unit or "." not in raw_number or number >= 20):
+            return None
+    elif kind == AMOUNT:
+        if unit in ("%", "x", "×"):
+            return None
+        # A bare four-digit number after an amount label is almost always a year
+        if not unit and not match.group("currency") and re.fullmatch(r"(?:19|20)\d{2}", raw_number):
+            return None
+        number *= SCALE_UNITS[unit] if unit else scale or 1
+
+    if negative:
+        number = -number
+    return int(number) if number == int(number) and kind == AMOUNT else number
+
+
+def _cell_kpi(cell: Any) -> Tuple[Optional[str], bool]:
+    """KPI a table cell labels, if any, and whether the label announces a percentage"""
+    text = str(cell or "").lower()
+    percent_hint = "%" in text
+    text = SCALE_NOTE_PATTERN.sub(lambda match: " " if note_scale(match.group()) else match.group(), text)
+    text = re.sub(r"\((?:%|x|in [^)]*)\)", "", text)
+    text = re.sub(r"[^a-z0-9\- ]", " ", text)
+    text = re.sub(r"\d+\s*$", "", text)  # footnote markers
+    return LABEL_TO_KPI.get(_label_key(text)), percent_hint
+
+
+class PrefilledFields:
+    """
+    Schema fields filled without the LLM.
+
+    data is shaped like the template schema but holds only the filled fields;
+    provenance maps each filled field path ("Section.Group.Field", or a whole
+    list section) to where its value was found.
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self.provenance: Dict[str, Any] = {}
+
+    @property
+    def covered(self) -> Set[str]:
+        return set(self.provenance)
+
+    def set(self, path: List[str], value: Any, source: Any):
+        node = self.data
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+        self.provenance[".".join(path)] = source
+
+
+def prune_schema(schema: Dict[str, Any], covered: Set[str], prefix: str = "") -> Dict[str, Any]:
+    """The schema without covered fields; groups and sections left empty are dropped"""
+    pruned = {}
+    for key, value in schema.items():
+        path = f"{prefix}{key}"
+        if path in covered:
+            continue
+        if isinstance(value, dict):
+            value = prune_schema(value, covered, path + ".")
+            if not value:
+                continue
+        pruned[key] = value
+    return pruned
+
+
+class KPIExtractor:
+    """
+    Rule-based extraction of headline fund KPIs (IRR, TVPI, DPI, RVPI, NAV,
+    commitments, vintage year...) from labelled text lines and tables.
+
+    A value is only used when every place the document states it agrees;
+    conflicting values are left to the LLM.
+    """
+
+    def extract(self, extracted_texts: List[Dict[str, Any]], schema: Dict[str, Any]) -> PrefilledFields:
+        candidates: Dict[str, List[Tuple[Any, Dict[str, Any]]]] = {}
+        for text_data in extracted_texts:
+            filename = text_data.get("filename")
+            for table in text_data.get("tables") or []:
+                for kpi, value, source in self._scan_table(table):
+                    candidates.setdefault(kpi, []).append((value, {"file": filename, **source}))
+            for page_number, page_text in split_pages(text_data.get("text", "")):
+                for kpi, value, source in self._scan_text(page_text):
+                    candidates.setdefault(kpi, []).append((value, {"file": filename, "page": page_number, **source}))
+
+        resolved = {}
+        for kpi, found in candidates.items():
+            values = {round(value, 6) for value, _ in found}
+            if len(values) == 1:
+                resolved[kpi] = found[0]
+            else:
+                logger.debug(f"KPI {kpi} has conflicting values {sorted(values)}, leaving it to the LLM")
+
+        prefilled = PrefilledFields()
+        field_to_kpi = {field: kpi for kpi, definition in KPI_DEFINITIONS.items() for field in definition["fields"]}
+        self._fill(schema, [], resolved, field_to_kpi, prefilled)
+
+        if prefilled.provenance:
+            logger.info(f"📐 Pre-extracted {len(prefilled.provenance)} KPI fields: {', '.join(sorted(prefilled.provenance))}")
+        return prefilled
+
+    def _fill(self, schema: Dict[str, Any], path: List[str], resolved: Dict[str, Tuple[Any, Dict[str, Any]]],
+              field_to_kpi: Dict[str, str], prefilled: PrefilledFields):
+        for key, value in schema.items():
+            if isinstance(value, dict):
+                self._fill(value, path + [key], resolved, field_to_kpi, prefilled)
+            elif isinstance(value, str) and key in field_to_kpi and field_to_kpi[key] in resolved:
+                found_value, source = resolved[field_to_kpi[key]]
+                prefilled.set(path + [key], found_value, source)
+
+    def _scan_text(self, page_text: str):
+        """
+        (kpi, value, source) for each "label ... value" statement in the page.
+
+        The extractor collapses each page's whitespace, so a page is mostly one
+        line; sources give the character offset of the label in the page text.
+        Amounts without a unit take the scale of the last scale note before them.
+        """
+        notes = [(match.start(), note_scale(match.group())) for match in SCALE_NOTE_PATTERN.finditer(page_text)]
+        notes = [(position, scale) for position, scale in notes if scale]
+
+        for line_match in re.finditer(r"[^\n]+", page_text):
+            labels = list(LABEL_PATTERN.finditer(page_text, line_match.start(), line_match.end()))
+            for index, label_match in enumerate(labels):
+                kpi = LABEL_TO_KPI[_label_key(label_match.group())]
+                end = labels[index + 1].start() if index + 1 < len(labels) else line_match.end()
+                value_match = VALUE_AFTER_LABEL_PATTERN.match(page_text, label_match.end(), end)
+                if value_match is None:
+                    continue
+
+                gap = value_match.group("gap")
+                if GAP_STOPWORDS.search(gap):
+                    continue
+
+                offset = label_match.start()
+                scale = next((scale for position, scale in reversed(notes) if position < offset), None)
+                value = parse_value(value_match, KPI_DEFINITIONS[kpi]["kind"], percent_hint="%" in gap, scale=scale)
+                if value is not None:
+                    yield kpi, value, {"source": "text", "offset": offset,
+                                       "text": page_text[offset:value_match.end()].strip()[:200]}
+
+    def _scan_table(self, table: Dict[str, Any]):
+        """(kpi, value, source) from label/value rows, or a header row over a single value row"""
+        rows = table.get("data") or []
+        source = {"source": "table", "page": table.get("page"), "table": table.get("table_number")}
+        # A scale note in the top-left cell, e.g. "($ in millions)", applies to the whole table
+        table_scale = note_scale(str(rows[0][0] or "")) if rows and rows[0] else None
+
+        for row_index, row in enumerate(rows):
+            for column, cell in enumerate(row):
+                kpi, percent_hint = _cell_kpi(cell)
+                if kpi is None:
+                    continue
+                scale = text_scale(cell) or table_scale
+                values = [
+                    (value_column, value_cell, self._parse_cell(value_cell, kpi, percent_hint, scale))
+                    for value_column, value_cell in enumerate(row[column + 1:], start=column + 1)
+                    if value_cell and VALUE_PATTERN.search(str(value_cell))
+                ]
+                # Several numbers (e.g. one per period) cannot be told apart here
+                if len(values) == 1 and values[0][2] is not None:
+                    value_column, value_cell, value = values[0]
+                    yield kpi, value, {**source, "row": row_index + 1, "column": value_column + 1, "cell": str(value_cell)}
+                break
+
+        if len(rows) == 2:
+            header, values = rows
+            for column, cell in enumerate(header):
+                kpi, percent_hint = _cell_kpi(cell)
+                if kpi is None or column >= len(values) or not values[column]:
+                    continue
+                value = self._parse_cell(values[column], kpi, percent_hint, text_scale(cell) or table_scale)
+                if value is not None:
+                    yield kpi, value, {**source, "row": 2, "column": column + 1, "cell": str(values[column])}
+
+    def _parse_cell(self, cell: Any, kpi: str, percent_hint: bool, scale: Optional[float] = None) -> Optional[float]:
+        match = VALUE_PATTERN.fullmatch(re.sub(r"\s+", " ", str(cell)).strip())
+        if match is None:
+            return None
+        return parse_value(match, KPI_DEFINITIONS[kpi]["kind"], percent_hint, scale)
@@ -0,0 +1,231 @@
+# llm_cache.py
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.services.sqlite_store import connect, create_store, evict_least_recently_used, increment
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.getenv("EXTRACTION_CACHE_DIR", "cache"))
+LLM_CACHE_MEMORY_MB = int(os.getenv("LLM_CACHE_MEMORY_MB", "64"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# One cache per process; uvicorn workers share the SQLite tier
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of structured LLM responses.
+
+    The memory tier is a per-process LRU bounded by memory_bytes. The disk tier is
+    SQLite, survives restarts and is shared by every worker process; it is bounded
+    by max_bytes with least-recently-used eviction. Both tiers honour the TTL.
+    """
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, memory_bytes: int = LLM_CACHE_MEMORY_MB * 1024 * 1024,
+                 max_bytes: int = LLM_CACHE_MAX_MB * 1024 * 1024, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.db_path = os.path.join(cache_dir, "llm_cache.sqlite3")
+        self.memory_bytes = memory_bytes
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (created_at, serialized response)
+        self._memory: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0
+        }
+
+        create_store(self.db_path)
+        with connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    model TEXT,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_accessed ON responses (last_accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def make_key(prompt: str, model: str, template_version: str, processor_version: str) -> str:
+        """Cache key from everything that determines the model's answer"""
+        digest = hashlib.sha256()
+        for part in (processor_version, template_version, model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a response in memory, then on disk, counting the hit or miss"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if self._expired(created_at, now):
+                    self._drop_from_memory(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return json.loads(value)
+
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                increment(conn, "misses")
+                self.stats["misses"] += 1
+                return None
+
+            compressed, created_at = row
+            if self._expired(created_at, now):
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                increment(conn, "misses")
+                increment(conn, "expired")
+                self.stats["misses"] += 1
+                return None
+
+            conn.execute("UPDATE responses SET last_accessed = ? WHERE key = ?", (now, key))
+            increment(conn, "hits")
+
+        value = zlib.decompress(compressed)
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._store_in_memory(key, created_at, value)
+        return json.loads(value)
+
+    def put(self, key: str, response: Dict[str, Any], model: Optional[str] = None):
+        """Store a response in both tiers"""
+        value = json.dumps(response, default=str).encode("utf-8")
+        now = time.time()
+
+        with self._lock:
+            self._store_in_memory(key, now, value)
+
+        compressed = zlib.compress(value)
+        if len(compressed) > self.max_bytes:
+            logger.warning(f"⚠️ LLM response too large to cache on disk ({len(compressed)} bytes)")
+            return
+
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, model, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, compressed, len(compressed), model, now, now)
+            )
+            self._evict(conn)
+
+    def clear(self):
+        """Remove every cached response from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        with connect(self.db_path) as conn:
+            conn.execute("DELETE FROM responses")
+        logger.info("LLM response cache cleared")
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process and for the shared disk tier"""
+        with connect(self.db_path) as conn:
+            entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+
+        with self._lock:
+            process_stats = dict(self.stats)
+            memory_entries = len(self._memory)
+            memory_size = self._memory_size
+
+        lookups = process_stats["memory_hits"] + process_stats["disk_hits"] + process_stats["misses"]
+        disk_hits = counters.get("hits", 0)
+        disk_misses = counters.get("misses", 0)
+        return {
+            "memory": {
+                "entries": memory_entries,
+                "total_bytes": memory_size,
+                "max_bytes": self.memory_bytes,
+                "evictions": process_stats["memory_evictions"]
+            },
+            "disk": {
+                "entries": entries,
+                "total_bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": disk_hits,
+                "misses": disk_misses,
+                "evictions": counters.get("evictions", 0),
+                "expired": counters.get("expired", 0)
+            },
+            "ttl_seconds": self.ttl_seconds,
+            "memory_hits": process_stats["memory_hits"],
+            "disk_hits": process_stats["disk_hits"],
+            "misses": process_stats["misses"],
+            "hit_rate": round((lookups - process_stats["misses"]) / lookups, 4) if lookups else 0.0
+        }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and created_at + self.ttl_seconds < now
+
+    def _store_in_memory(self, key: str, created_at: float, value: bytes):
+        """Insert into the memory tier and evict down to memory_bytes; caller holds the lock"""
+        if len(value) > self.memory_bytes:
+            return
+
+        self._drop_from_memory(key)
+        self._memory[key] = (created_at, value)
+        self._memory_size += len(value)
+
+        while self._memory_size > self.memory_bytes:
+            oldest_key = next(iter(self._memory))
+            self._drop_from_memory(oldest_key)
+            self.stats["memory_evictions"] += 1
+
+    def _drop_from_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= len(entry[1])
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least-recently-used disk entries until the store fits in max_bytes"""
+        evicted = evict_least_recently_used(conn, "responses", self.max_bytes)
+        if evicted:
+            logger.info(f"🧹 Evicted {evicted} LLM cache entries")
+
+
+def get_llm_response_cache() -> Optional[LLMResponseCache]:
+    """Process-wide LLM response cache, or None when caching is disabled"""
+    global _shared_cache
+
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            try:
+                _shared_cache = LLMResponseCache()
+            except Exception as e:
+                logger.warning(f"⚠️ LLM response cache unavailable: {e}")
+                return None
+
+    return _shared_cache
@@ -1,40 +1,180 @@
 # llm_processor.py
+import asyncio
+import functools
+import hashlib
 import json
 import logging
 import os
-import re
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from pathlib import Path
 from datetime import datetime
-import hashlib
-from groq import Groq
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from groq import BadRequestError
+
+from app.services.llm_cache import LLMResponseCache, get_llm_response_cache
+from app.services.result_merger import merge_extraction_results
+from app.services.page_selector import select_pages
+from app.services.text_chunker import TextChunker, estimate_tokens, chunk_tokens_for_models
+from app.services.page_router import PageRouter
+from app.services.model_router import DocumentFeatures, ModelRouter, RouteDecision, create_model_stats_store
+from app.services.json_stream import (
+    IncrementalJSONParser, StreamAbort, parse_json_object, ends_inside_object, repair_truncated_json
+)
+from app.services.llm_scheduler import LLMScheduler, HTTP2_AVAILABLE
+from app.services.kpi_extractor import KPIExtractor, PrefilledFields, prune_schema
+from app.services.table_mapper import TableMapper
+from app.services.prompt_compiler import PromptCompiler
+from app.services.tabular_output import expand_tabular_sections
+from app.services.response_schema import ResponseSchemaCompiler
 
 logger = logging.getLogger(__name__)
 
+PROCESSOR_VERSION = "2.3.0"
+
+# Documents longer than one prompt's text budget are extracted chunk by chunk and merged.
+# Chunks are sized in estimated tokens to fit every model, capped to keep calls fast.
+LLM_MAP_REDUCE = os.getenv("LLM_MAP_REDUCE", "true").lower() == "true"
+LLM_MAX_CHUNK_TOKENS = int(os.getenv("LLM_MAX_CHUNK_TOKENS", "6000"))
+LLM_CHUNK_OVERLAP_TOKENS = int(os.getenv("LLM_CHUNK_OVERLAP_TOKENS", "200"))
+LLM_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", "4"))
+LLM_MAX_CHUNKS = int(os.getenv("LLM_MAX_CHUNKS", "8"))
+
+# Pages are ranked by financial content and packed into the text budget; boilerplate is dropped
+LLM_PAGE_SELECTION = os.getenv("LLM_PAGE_SELECTION", "true").lower() == "true"
+
+# "document" sends the whole schema in one call (per chunk); "sections" extracts each
+# top-level schema section concurrently from the pages routed to it
+EXTRACTION_MODE_DOCUMENT = "document"
+EXTRACTION_MODE_SECTIONS = "sections"
+LLM_EXTRACTION_MODE = os.getenv("LLM_EXTRACTION_MODE", EXTRACTION_MODE_DOCUMENT).lower()
+LLM_SECTION_CONTEXT_TOKENS = int(os.getenv("LLM_SECTION_CONTEXT_TOKENS", "4000"))
+LLM_SECTION_MAX_TOKENS = int(os.getenv("LLM_SECTION_MAX_TOKENS", "3000"))
+
+# Stream completions, parse them as they arrive and abort output that cannot be valid
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+LLM_STREAM_MAX_PREAMBLE = int(os.getenv("LLM_STREAM_MAX_PREAMBLE", "200"))
+
+# Replies cut off inside the JSON are resumed by follow-up requests, then repaired if still open
+LLM_MAX_CONTINUATIONS = int(os.getenv("LLM_MAX_CONTINUATIONS", "2"))
+LLM_OUTPUT_REPAIR = os.getenv("LLM_OUTPUT_REPAIR", "true").lower() == "true"
+
+# Ask models that support it for provider JSON mode, so the reply is always a JSON object
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# A result is accepted only if at least one of these sections is present and valid
+TEMPLATE_KEY_SECTIONS = {
+    1: ["Fund_and_Investment_Vehicle_Information", "Fund_Manager", "Fund_Companies"],
+    2: ["Executive_Portfolio_Summary", "Schedule_of_Investments", "Statement_of_Operations"]
+}
+
+# Keep the good sections of an incomplete reply and re-ask only for the invalid ones (and, when the
+# reply falls short, the empty key sections) from their routed pages, instead of retrying everything
+LLM_PARTIAL_REASK = os.getenv("LLM_PARTIAL_REASK", "true").lower() == "true"
+LLM_REASK_MAX_SECTIONS = int(os.getenv("LLM_REASK_MAX_SECTIONS", "4"))
+
+# Ask for record lists (schedules, cashflows...) as a header row plus value arrays instead of
+# repeating every field name per record; expanded back to records before anything else sees them
+LLM_TABULAR_LISTS = os.getenv("LLM_TABULAR_LISTS", "false").lower() == "true"
+
+# Fill plainly stated KPIs (IRR, TVPI, NAV, commitments...) by rule and only ask the LLM for the rest
+LLM_KPI_PREEXTRACTION = os.getenv("LLM_KPI_PREEXTRACTION", "true").lower() == "true"
+
+# Fill list sections (schedules, cashflows, valuations...) from the PDF's tables when they map cleanly
+LLM_TABLE_MAPPING = os.getenv("LLM_TABLE_MAPPING", "true").lower() == "true"
+
+# Hedged requests: start the fallback model while the primary is still running
+# when the primary is slower than its recent LLM_HEDGE_PERCENTILE latency
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "20"))
+# Opt-in: send prompts up to LLM_HEDGE_PARALLEL_TOKENS to every model at once (pays for each model)
+LLM_HEDGE_PARALLEL = os.getenv("LLM_HEDGE_PARALLEL", "false").lower() == "true"
+LLM_HEDGE_PARALLEL_TOKENS = int(os.getenv("LLM_HEDGE_PARALLEL_TOKENS", "2500"))
+LLM_HEDGE_LATENCY_WINDOW = 200
+
 class LLMProcessor:
     """
     Enhanced LLM Processor with detailed template-specific prompts
+
+    Meant to be created once per application and shared: it is safe to call
+    process_texts from several threads, and every API call goes through one
+    LLMScheduler (rate limits, concurrency, connection pool). Pass scheduler
+    to share one owned by the caller.
     """
     
-    def __init__(self, cache_enabled: bool = True):
+    def __init__(self, cache_enabled: bool = True, scheduler: Optional[LLMScheduler] = None):
         self.cache_enabled = cache_enabled
-        self.response_cache = {}
+        self._reload_lock = threading.Lock()
+        # Shared by every processor in the process and, on disk, across workers
+        self.response_cache = get_llm_response_cache() if cache_enabled else None
         self.usage_stats = {
             "total_requests": 0,
             "successful_extractions": 0,
             "failed_extractions": 0,
-            "cache_hits": 0
+            "cache_hits": 0,
+            "stream_aborts": 0,
+            "json_mode_failures": 0,
+            "continuations": 0,
+            "repairs": 0,
+            "reasked_sections": 0,
+            "recovered_sections": 0,
+            "hedging": {
+                "hedged_requests": 0,
+                "wins": {},
+                "hedged_wins": {}
+            }
         }
+        # Recent latencies per model of the requests it was tried first in
+        self._primary_latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=LLM_HEDGE_LATENCY_WINDOW))
+        self.kpi_extractor = KPIExtractor()
+        self.table_mapper = TableMapper()
+        self.prompt_compiler = PromptCompiler()
+        self.response_schema_compiler = ResponseSchemaCompiler()
+        # Models that rejected a JSON-mode request are asked without it from then on
+        self._json_mode_unsupported = set()
         
         self._setup_environment()
+        self._owns_scheduler = scheduler is None
+        self.scheduler = scheduler or LLMScheduler()
         self._initialize_clients()
+        # Picks the first model per request; its statistics persist next to the response cache
+        self.model_router = ModelRouter(self.available_models, create_model_stats_store())
         self.template_configs = self._initialize_template_configs()
+        self._chunk_token_limits: Dict[Tuple[int, str], int] = {}
+        # Bounds concurrent chunk calls across every job sharing this processor
+        self._map_executor = ThreadPoolExecutor(max_workers=max(1, LLM_MAP_CONCURRENCY), thread_name_prefix="llm-map")
         
-        logger.info("LLM Processor initialized successfully")
+        logger.info(f"LLM Processor initialized successfully (HTTP/2: {HTTP2_AVAILABLE})")
+
+    def reload_config(self):
+        """
+        Re-read the environment and rebuild the API client and template configs.
+
+        The scheduler and its connection pool are kept; requests already in flight finish with the
+        old client and configs, which are swapped in one step.
+        """
+        with self._reload_lock:
+            self._setup_environment(override=True)
+            self._initialize_clients()
+            self.model_router.models = self.available_models
+            self.template_configs = self._initialize_template_configs()
+            self._chunk_token_limits = {}
+
+        logger.info("🔄 LLM Processor configuration reloaded")
 
-    def _setup_environment(self):
+    def close(self):
+        """Stop the chunk workers and the scheduler if this processor created it"""
+        self._map_executor.shutdown(wait=False, cancel_futures=True)
+        if self._owns_scheduler:
+            self.scheduler.close()
+
+    def _setup_environment(self, override: bool = False):
         """Setup environment variables"""
         try:
             possible_env_paths = [
@@ -46,7 +186,7 @@ class LLMProcessor:
             env_loaded = False
             for env_path in possible_env_paths:
                 if env_path.exists():
-                    load_dotenv(env_path)
+                    load_dotenv(env_path, override=override)
                     logger.info(f"Loaded environment from: {env_path}")
                     env_loaded = True
                     break
@@ -54,9 +194,10 @@ class LLMProcessor:
             if not env_loaded:
                 logger.warning("No .env file found, relying on system environment variables")
             
-            self.api_key = os.getenv("GROQ_API_KEY")
-            if not self.api_key:
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
                 raise ValueError("GROQ_API_KEY not found in environment variables")
+            self.api_key = api_key
                 
         except Exception as e:
             logger.error(f"Environment setup failed: {str(e)}")
@@ -65,19 +206,25 @@ class LLMProcessor:
     def _initialize_clients(self):
         """Initialize Groq client"""
         try:
-            self.client = Groq(api_key=self.api_key)
+            self.client = self.scheduler.create_client(self.api_key)
             
             # Simplified model list for better reliability
             self.available_models = [
                 {
                     "name": "llama-3.3-70b-versatile",
                     "priority": 1,
-                    "max_tokens": 8000  # Increased for larger responses
+                    "context_window": 131072,
+                    "max_tokens": 8000,  # Increased for larger responses
+                    "json_mode": True,
+                    "cost": 0.79  # USD per million output tokens; only ranks models for routing
                 },
                 {
                     "name": "llama-3.1-8b-instant", 
                     "priority": 2,
-                    "max_tokens": 8000
+                    "context_window": 131072,
+                    "max_tokens": 8000,
+                    "json_mode": True,
+                    "cost": 0.08
                 }
             ]
             
@@ -88,11 +235,15 @@ class LLMProcessor:
             raise
 
     def _initialize_template_configs(self) -> Dict[int, Dict[str, Any]]:
-        """Initialize detailed template configurations"""
-        return {
+        """Initialize detailed template configurations, each with its compiled prompt and response schema"""
+        configs = {
             1: self._get_template_1_config(),
             2: self._get_template_2_config()
         }
+        for template_id, config in configs.items():
+            config["compiled_prompt"] = self.prompt_compiler.compile(template_id, config, LLM_TABULAR_LISTS)
+            config["response_schema"] = self.response_schema_compiler.compile(template_id, config)
+        return configs
 
     def _get_template_1_config(self) -> Dict[str, Any]:
         """Configuration for Template 1 - Private Equity Fund"""
@@ -114,6 +265,10 @@ class LLMProcessor:
                 "Reference Values"
             ],
             "json_schema": self._get_template_1_json_schema(),
+            "prompt_focus": """
+            YOU ARE EXTRACTING DATA FOR TEMPLATE 1 - PRIVATE EQUITY FUND DETAILED TEMPLATE
+            Focus on: Fund details, manager information, financial positions, portfolio companies, investments
+            """,
             "extraction_guidelines": self._get_template_1_extraction_guidelines(),
             "specific_fields": self._get_template_1_specific_fields()
         }
@@ -136,6 +291,10 @@ class LLMProcessor:
                 "Reference Values"
             ],
             "json_schema": self._get_template_2_json_schema(),
+            "prompt_focus": """
+            YOU ARE EXTRACTING DATA FOR TEMPLATE 2 - PORTFOLIO SUMMARY TEMPLATE
+            Focus on: Executive summary, investment schedule, financial statements, company profiles
+            """,
             "extraction_guidelines": self._get_template_2_extraction_guidelines(),
             "specific_fields": self._get_template_2_specific_fields()
         }
@@ -615,38 +774,6 @@ class LLMProcessor:
         - Return valid JSON matching the exact schema
         """
 
-    def process_texts(self, extracted_texts: List[Dict[str, Any]], template_id: int) -> Dict[str, Any]:
-        """
-        Process extracted texts with specified template - ENHANCED VERSION
-        """
-        self.usage_stats["total_requests"] += 1
-        
-        try:
-            # Validate inputs
-            self._validate_inputs(extracted_texts, template_id)
-            
-            # Get template configuration
-            template_config = self.template_configs.get(template_id)
-            if not template_config:
-                raise ValueError(f"Invalid template_id: {template_id}")
-            
-            logger.info(f"🧠 PROCESSING WITH TEMPLATE: {template_config['name']} (ID: {template_id})")
-            
-            # Combine texts
-            combined_text = self._combine_texts(extracted_texts)
-            
-            # Check cache with template-specific key
-            cache_key = self._generate_cache_key(combined_text, template_id)
-            if self.cache_enabled and cache_key in self.response_cache:
-                logger.info(f"💾 Cache hit for template {template_id}")
-                self.usage_stats["cache_hits"] += 1
-                return self.response_cache[cache_key]
-        
-        except Exception as e:
-            self.usage_stats["failed_extractions"] += 1
-            logger.error(f"❌ LLM processing failed for template {template_id}: {str(e)}")
-            raise Exception(f"LLM processing failed for template {template_id}: {str(e)}")
-
     def _validate_inputs(self, extracted_texts: List[Dict[str, Any]], template_id: int):
         """Validate input parameters"""
         if not extracted_texts:
@@ -655,130 +782,504 @@ class LLMProcessor:
         if template_id not in self.template_configs:
             raise ValueError(f"Invalid template_id: {template_id}")
 
-    def _combine_texts(self, extracted_texts: List[Dict[str, Any]]) -> str:
+    def _combine_texts(self, extracted_texts: List[Dict[str, Any]], max_tokens: int) -> str:
         """Combine extracted texts"""
         texts = [text_data.get("text", "") for text_data in extracted_texts]
         combined_text = "\n\n".join(texts)
         
-        # Less aggressive truncation for better extraction
-        if len(combined_text) > 25000:
-            combined_text = combined_text[:25000] + "... [text truncated for processing]"
+        # Without map-reduce the prompt can only hold the first chunk's worth of text
+        if not LLM_MAP_REDUCE and estimate_tokens(combined_text) > max_tokens:
+            combined_text = TextChunker(max_tokens).split(combined_text)[0] + "... [text truncated for processing]"
         
         return combined_text
 
-    def _generate_cache_key(self, text: str, template_id: int) -> str:
+    def _chunk_tokens(self, template_config: Dict[str, Any], template_id: int) -> int:
+        """
+        Document tokens per call: what every model's context leaves after completion and prompt overhead.
+
+        Pre-extraction prunes the schema per document, which changes the prompt
+        overhead, so the limit is cached per schema rather than per template.
+        """
+        schema_hash = hashlib.sha256(json.dumps(template_config["json_schema"], sort_keys=True).encode()).hexdigest()[:16]
+        cache_key = (template_id, template_config["version"], schema_hash)
+        if cache_key not in self._chunk_token_limits:
+            overhead = estimate_tokens(self._create_template_specific_prompt("", template_config, template_id, part=(1, 1)))
+            overhead += estimate_tokens(self._system_message(template_id))
+            self._chunk_token_limits[cache_key] = chunk_tokens_for_models(self.available_models, overhead, LLM_MAX_CHUNK_TOKENS)
+        return self._chunk_token_limits[cache_key]
+
+    def _generate_cache_key(self, prompt: str, model_name: str, template_id: int) -> str:
         """Generate cache key"""
-        content = f"{text}_{template_id}"
-        return hashlib.md5(content.encode()).hexdigest()
+        template_version = self.template_configs[template_id]["version"]
+        return LLMResponseCache.make_key(prompt, model_name, template_version, PROCESSOR_VERSION)
+
+    def _get_cached_response(self, prompt: str, template_id: int) -> Optional[Dict[str, Any]]:
+        """Return a cached response from any model, in model priority order"""
+        if not self.response_cache:
+            return None
+
+        for model_config in self.available_models:
+            try:
+                cached = self.response_cache.get(self._generate_cache_key(prompt, model_config["name"], template_id))
+            except Exception as e:
+                logger.warning(f"⚠️ LLM cache lookup failed: {e}")
+                return None
+            if cached is not None:
+                cached.setdefault("_metadata", {})["cache_hit"] = True
+                return cached
+
+        return None
+
+    def _cache_response(self, prompt: str, model_name: str, template_id: int, structured_data: Dict[str, Any]):
+        """Store a response under the model that produced it"""
+        if not self.response_cache:
+            return
+
+        try:
+            self.response_cache.put(self._generate_cache_key(prompt, model_name, template_id), structured_data, model=model_name)
+        except Exception as e:
+            logger.warning(f"⚠️ LLM cache store failed: {e}")
+
+    def _create_template_specific_prompt(self, text: str, template_config: Dict[str, Any], template_id: int,
+                                         part: Optional[Tuple[int, int]] = None, section: Optional[str] = None) -> str:
+        """Create template-specific prompt with strict instructions, around the template's precompiled prefix"""
+        return template_config["compiled_prompt"].render(
+            text, schema=template_config["json_schema"], part=part, section=section
+        )
+
+    def _execute_template_extraction(self, prompt: str, template_config: Dict[str, Any], template_id: int,
+                                     min_data_points: int = 5, section: Optional[str] = None,
+                                     max_tokens: Optional[int] = None,
+                                     on_section: Optional[Callable[[str], None]] = None,
+                                     allow_partial: bool = False,
+                                     route: Optional[RouteDecision] = None,
+                                     call_kind: str = "document") -> Tuple[Dict[str, Any], str]:
+        """
+        Execute extraction with template validation, returning the data and the model that produced it.
 
-    def _create_template_specific_prompt(self, text: str, template_config: Dict[str, Any], template_id: int) -> str:
-        """Create template-specific prompt with strict instructions"""
-        schema_str = json.dumps(template_config["json_schema"], indent=2)
+        Models are raced in priority order: the next model is started when the
+        previous one fails or, when hedging, when it is slower than usual. The
+        first valid result wins and the other requests are cancelled. With
+        allow_partial, a result with at least one valid, non-empty section also
+        wins; the caller re-asks for the rest. route, when given, sets the model
+        order, and the attempts are recorded for routing as call_kind calls
+        (section calls always count as "section").
+        """
+        expected_keys = [section] if section else list(template_config["json_schema"].keys())
+        messages = [
+            {
+                "role": "system",
+                "content": self._system_message(template_id)
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        client = self.client
+        models = list(route.models if route else self.available_models)
+        # (model, valid, seconds) of each attempt the model answered, appended on the scheduler loop
+        outcomes: List[Tuple[str, bool, float]] = []
         
-        # Template-specific instructions
-        if template_id == 1:
-            template_specific_instruction = """
-            YOU ARE EXTRACTING DATA FOR TEMPLATE 1 - PRIVATE EQUITY FUND DETAILED TEMPLATE
-            Focus on: Fund details, manager information, financial positions, portfolio companies, investments
-            """
-        else:
-            template_specific_instruction = """
-            YOU ARE EXTRACTING DATA FOR TEMPLATE 2 - PORTFOLIO SUMMARY TEMPLATE  
-            Focus on: Executive summary, investment schedule, financial statements, company profiles
-            """
+        attempts = [
+            functools.partial(
+                self._attempt_model, client, model_config, messages, template_id,
+                min_data_points, section, max_tokens, expected_keys, on_section,
+                allow_partial=allow_partial, outcomes=outcomes, primary=index == 0
+            )
+            for index, model_config in enumerate(models)
+        ]
+        hedge_delay = self._hedge_delay(estimate_tokens(prompt), models)
         
-        prompt = f"""
-        FINANCIAL DOCUMENT DATA EXTRACTION
+        try:
+            winner, structured_data, hedged = self.scheduler.race(attempts, hedge_delay)
+        except Exception as e:
+            # Every attempt finished, so none of them is missing from the outcomes
+            if route:
+                self._record_outcomes(route, "section" if section else call_kind, outcomes)
+            raise Exception(f"All extraction attempts failed for template {template_id}") from e
         
-        TEMPLATE ID: {template_id}
-        TEMPLATE NAME: {template_config['name']}
+        # A hedged race cancels the slower attempt, so its outcomes would only show the faster model
+        if route and not hedged:
+            self._record_outcomes(route, "section" if section else call_kind, outcomes)
         
-        {template_specific_instruction}
+        model_name = models[winner]["name"]
+        self._record_race(model_name, hedged)
+        return structured_data, model_name
+
+    async def _attempt_model(self, client: Any, model_config: Dict[str, Any], messages: List[Dict[str, str]],
+                             template_id: int, min_data_points: int, section: Optional[str],
+                             max_tokens: Optional[int], expected_keys: List[str],
+                             on_section: Optional[Callable[[str], None]], allow_partial: bool = False,
+                             outcomes: Optional[List[Tuple[str, bool, float]]] = None,
+                             primary: bool = False) -> Dict[str, Any]:
+        """
+        One model's extraction, run on the scheduler loop; raises unless the data is valid.
+
+        Once the model has answered, whether the answer was valid and how long
+        the model took (from when the request was sent, without queueing) are
+        appended to outcomes. API errors and cancelled attempts add nothing.
+        """
+        model_name = model_config["name"]
+        completion_tokens = min(max_tokens or model_config["max_tokens"], model_config["max_tokens"])
+        started = time.monotonic()
+        sent = []
+        
+        def record(valid: bool):
+            if outcomes is not None and sent:
+                outcomes.append((model_name, valid, time.monotonic() - sent[0]))
+        
+        try:
+            logger.info(f"🤖 Trying model: {model_name} for template {template_id}")
+            
+            parser = self._stream_parser(expected_keys, on_section) if LLM_STREAMING else None
+            result_text, finish_reason = await self._request(client, model_config, messages, completion_tokens, parser,
+                                                             on_send=lambda: sent.append(time.monotonic()))
+            
+            result_text, recovery = await self._continue_output(client, model_name, messages, completion_tokens,
+                                                                result_text, finish_reason, parser)
+        except StreamAbort as e:
+            self.usage_stats["stream_aborts"] += 1
+            logger.warning(f"✋ Aborted {model_name} stream for template {template_id}: {e}")
+            record(False)
+            raise
+        except Exception as e:
+            logger.warning(f"❌ Model {model_name} failed for template {template_id}: {e}")
+            raise
         
-        EXTRACTION GUIDELINES:
-        {template_config['extraction_guidelines']}
+        try:
+            structured_data = self._repair_output(result_text, model_name, recovery)
+        except ValueError:
+            record(False)
+            raise
+        if LLM_TABULAR_LISTS:
+            structured_data = expand_tabular_sections(structured_data)
         
-        DOCUMENT TEXT:
-        {text}
+        # Enhanced validation to ensure template-specific data
+        structured_data, section_validity = self._validate_sections(structured_data, template_id)
+        if section:
+            valid = section_validity.get(section, {}).get("valid", False)
+            record(valid)
+        else:
+            valid = self._is_acceptable(structured_data, section_validity, template_id, expected_keys, min_data_points)
+            record(valid)
+            if not valid and allow_partial and self._has_usable_sections(structured_data, section_validity):
+                logger.info(f"🧩 Model {model_name} left sections incomplete for template {template_id}, keeping the valid ones")
+                valid = True
         
-        REQUIRED JSON STRUCTURE:
-        {schema_str}
+        if not valid:
+            invalid = [name for name, result in section_validity.items() if not result["valid"]]
+            logger.warning(f"⚠️ Model {model_name} produced invalid data for template {template_id} (invalid sections: {invalid})")
+            raise ValueError(f"Model {model_name} produced invalid data for template {template_id}")
         
-        CRITICAL INSTRUCTIONS:
-        - Extract data specifically for TEMPLATE {template_id}
-        - Use null for missing data
-        - Format dates as YYYY-MM-DD
-        - Return ONLY valid JSON matching the exact structure above
-        - DO NOT include any explanations or additional text
-        - The JSON structure MUST match Template {template_id} requirements
+        if primary:
+            self._primary_latencies[model_name].append(time.monotonic() - started)
+        structured_data["_metadata"] = {"section_validity": section_validity}
+        if recovery["continuations"] or recovery["repairs"]:
+            structured_data["_metadata"]["output_recovery"] = recovery
+        logger.info(f"✅ Model {model_name} produced valid data for template {template_id}")
+        return structured_data
+
+    def _stream_parser(self, expected_keys: List[str],
+                       on_section: Optional[Callable[[str], None]] = None) -> IncrementalJSONParser:
+        def section_closed(key: str, value: Any):
+            if on_section and key in expected_keys:
+                on_section(key)
         
-        RETURN VALID JSON:
+        return IncrementalJSONParser(expected_keys, on_section=section_closed, max_preamble=LLM_STREAM_MAX_PREAMBLE)
+
+    async def _request(self, client: Any, model_config: Dict[str, Any], messages: List[Dict[str, str]],
+                       max_tokens: int, parser: Optional[IncrementalJSONParser],
+                       on_send: Optional[Callable[[], None]] = None) -> Tuple[str, Optional[str]]:
+        """
+        One completion, streamed through parser when given, in JSON mode when the model supports it.
+        on_send is passed on to the scheduler.
+
+        In JSON mode the provider rejects output that is not a valid JSON object,
+        including output cut off at max_tokens; the rejected text is kept so it
+        can still be continued or repaired, with finish reason "length" when it
+        was cut off. A model that rejects the JSON-mode request itself is asked
+        without it from then on; any other bad request is raised.
         """
+        model_name = model_config["name"]
+        response_format = None
+        if LLM_JSON_MODE and model_config.get("json_mode") and model_name not in self._json_mode_unsupported:
+            response_format = JSON_RESPONSE_FORMAT
         
-        return prompt
+        try:
+            if parser:
+                return await self._stream_completion(client, model_name, messages, max_tokens, parser, response_format,
+                                                     on_send)
+            return await self.scheduler.acomplete(client, model_name, messages, max_tokens,
+                                                  response_format=response_format, on_send=on_send)
+        except BadRequestError as e:
+            if response_format is None:
+                raise
+            failed_generation = self._failed_generation(e)
+            if failed_generation is not None:
+                self.usage_stats["json_mode_failures"] += 1
+                logger.warning(f"⚠️ {model_name} output failed JSON-mode validation ({len(failed_generation)} characters)")
+                if parser:
+                    parser.feed(failed_generation)
+                if self._hit_max_tokens(e, failed_generation, max_tokens):
+                    return failed_generation, "length"
+                return failed_generation, "json_validate_failed"
+            if not self._rejects_json_mode(e):
+                raise
+            self._json_mode_unsupported.add(model_name)
+            logger.warning(f"⚠️ {model_name} rejected JSON mode, asking without it: {e}")
+            return await self._request(client, model_config, messages, max_tokens, parser, on_send)
 
-    def _execute_template_extraction(self, prompt: str, template_config: Dict[str, Any], template_id: int) -> Dict[str, Any]:
-        """Execute extraction with template validation"""
-        for model_config in self.available_models:
-            model_name = model_config["name"]
-            
+    @staticmethod
+    def _hit_max_tokens(error: BadRequestError, failed_generation: str, max_tokens: int) -> bool:
+        """Whether JSON mode rejected the output for running out of tokens; the error does not always say so"""
+        message = str(error).lower()
+        if "max_tokens" in message or ("maximum" in message and "token" in message):
+            return True
+        return ends_inside_object(failed_generation) and estimate_tokens(failed_generation) >= max_tokens * 0.9
+
+    @staticmethod
+    def _rejects_json_mode(error: BadRequestError) -> bool:
+        """Whether the provider refused the response_format parameter, rather than something else in the request"""
+        body = error.body if isinstance(error.body, dict) else {}
+        details = body.get("error", body)
+        if isinstance(details, dict) and details.get("param") == "response_format":
+            return True
+        message = str(error).lower()
+        return any(marker in message for marker in ("response_format", "json_object", "json mode"))
+
+    @staticmethod
+    def _failed_generation(error: BadRequestError) -> Optional[str]:
+        """The output JSON mode rejected, which the provider returns with the error"""
+        body = error.body if isinstance(error.body, dict) else {}
+        details = body.get("error", body)
+        failed_generation = details.get("failed_generation") if isinstance(details, dict) else None
+        return failed_generation if isinstance(failed_generation, str) else None
+
+    async def _stream_completion(self, client: Any, model_name: str, messages: List[Dict[str, str]], max_tokens: int,
+                                 parser: IncrementalJSONParser,
+                                 response_format: Optional[Dict[str, Any]] = None,
+                                 on_send: Optional[Callable[[], None]] = None) -> Tuple[str, Optional[str]]:
+        """
+        Stream a completion through the incremental JSON parser.
+
+        Raises StreamAbort (and closes the connection) as soon as the output is
+        clearly not the requested JSON, so the next model can be tried without
+        paying for the rest of the generation.
+        """
+        def on_delta(content: str) -> bool:
+            parser.feed(content)
+            return parser.complete
+        
+        _, finish_reason = await self.scheduler.acomplete(client, model_name, messages, max_tokens, on_delta=on_delta,
+                                                          response_format=response_format, on_send=on_send)
+        return parser.text(), finish_reason
+
+    async def _continue_output(self, client: Any, model_name: str, messages: List[Dict[str, str]], max_tokens: int,
+                               text: str, finish_reason: Optional[str],
+                               parser: Optional[IncrementalJSONParser]) -> Tuple[str, Dict[str, int]]:
+        """
+        Resume a reply that hit max_tokens inside its JSON object.
+
+        Up to LLM_MAX_CONTINUATIONS follow-up requests get the partial reply as
+        an assistant message to continue from; each continuation is appended
+        (and fed to the stream parser, so finished sections are still reported).
+        A failed continuation keeps what was received so far.
+        """
+        recovery = {"continuations": 0, "repairs": 0}
+        while (recovery["continuations"] < LLM_MAX_CONTINUATIONS and finish_reason == "length"
+               and ends_inside_object(text)):
+            logger.info(f"✂️ {model_name} hit max_tokens inside the JSON after {len(text)} characters, requesting a continuation")
+            continuation_messages = messages + [{"role": "assistant", "content": text}]
             try:
-                logger.info(f"🤖 Trying model: {model_name} for template {template_id}")
-                
-                response = self.client.chat.completions.create(
-                    model=model_name,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": f"You are a financial data extraction expert. You MUST extract data for Template {template_id}. Return ONLY valid JSON without any additional text."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    temperature=0.1,
-                    max_tokens=8000,
-                    stream=False
-                )
-                
-                result_text = response.choices[0].message.content
-                structured_data = self._parse_response(result_text)
-                
-                # Enhanced validation to ensure template-specific data
-                if self._validate_template_specific_data(structured_data, template_id):
-                    logger.info(f"✅ Model {model_name} produced valid data for template {template_id}")
-                    return structured_data
-                else:
-                    logger.warning(f"⚠️ Model {model_name} produced invalid data for template {template_id}")
-                    
+                continuation, finish_reason = await self.scheduler.acomplete(client, model_name, continuation_messages,
+                                                                             max_tokens)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.warning(f"❌ Model {model_name} failed for template {template_id}: {e}")
-                continue
+                logger.warning(f"⚠️ Continuation request to {model_name} failed: {e}")
+                break
+            
+            continuation = self._strip_continuation(continuation or "")
+            if not continuation:
+                break
+            recovery["continuations"] += 1
+            self.usage_stats["continuations"] += 1
+            text += continuation
+            if parser:
+                parser.feed(continuation)
         
-        # All models failed
-        raise Exception(f"All extraction attempts failed for template {template_id}")
+        return text, recovery
+
+    @staticmethod
+    def _strip_continuation(continuation: str) -> str:
+        """A continuation may open a fresh code fence; the partial reply already has one if needed"""
+        stripped = continuation.lstrip()
+        if stripped.startswith("```"):
+            newline = stripped.find("\n")
+            return stripped[newline + 1:] if newline != -1 else ""
+        return continuation
+
+    def _repair_output(self, text: str, model_name: str, recovery: Dict[str, int]) -> Dict[str, Any]:
+        """Parse the reply; one still cut off is closed after its last complete element"""
+        if LLM_OUTPUT_REPAIR and ends_inside_object(text):
+            repaired = repair_truncated_json(text)
+            if repaired:
+                recovery["repairs"] += 1
+                self.usage_stats["repairs"] += 1
+                logger.warning(f"🩹 Repaired cut-off JSON from {model_name} ({len(text)} characters)")
+                return repaired
+        return self._parse_response(text)
+
+    def _record_outcomes(self, route: RouteDecision, call_kind: str, outcomes: List[Tuple[str, bool, float]]):
+        """Store the answered attempts of one race for routing; runs on the calling worker thread"""
+        for model_name, valid, latency in outcomes:
+            self.model_router.record(route, model_name, call_kind, valid, latency)
+
+    def _hedge_delay(self, prompt_tokens: int, models: List[Dict[str, Any]]) -> Optional[float]:
+        """
+        Seconds to wait on a model before also starting the next one.
+
+        None disables hedging (plain fallback on failure). With LLM_HEDGE_PARALLEL,
+        small prompts go to every model at once; otherwise the delay is the
+        LLM_HEDGE_PERCENTILE latency of the first model's recent successes as
+        the first model tried.
+        """
+        if not LLM_HEDGING or len(models) < 2:
+            return None
+        if LLM_HEDGE_PARALLEL and prompt_tokens <= LLM_HEDGE_PARALLEL_TOKENS:
+            return 0.0
+
+        samples = sorted(self._primary_latencies[models[0]["name"]])
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return samples[min(len(samples) - 1, int(len(samples) * LLM_HEDGE_PERCENTILE / 100))]
+
+    def _record_race(self, model_name: str, hedged: int):
+        """Count which model won, separately for races where a hedge request was sent"""
+        hedging = self.usage_stats["hedging"]
+        hedging["wins"][model_name] = hedging["wins"].get(model_name, 0) + 1
+        if hedged:
+            hedging["hedged_requests"] += 1
+            hedging["hedged_wins"][model_name] = hedging["hedged_wins"].get(model_name, 0) + 1
+            logger.info(f"🏁 {model_name} won a hedged request")
+
+    def _system_message(self, template_id: int) -> str:
+        return f"You are a financial data extraction expert. You MUST extract data for Template {template_id}. Return ONLY valid JSON without any additional text."
+
+    def _validate_sections(self, data: Dict[str, Any], template_id: int) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """Validate and coerce each template section against the compiled response schema"""
+        return self.template_configs[template_id]["response_schema"].validate(data)
 
-    def _validate_template_specific_data(self, data: Dict[str, Any], template_id: int) -> bool:
-        """Validate that data matches template requirements"""
-        if not data or not isinstance(data, dict):
-            return False
+    def _is_acceptable(self, data: Dict[str, Any], section_validity: Dict[str, Dict[str, Any]], template_id: int,
+                       requested_sections: List[str], min_data_points: int = 5) -> bool:
+        """
+        Enough data points, and at least one of the template's key sections valid.
+
+        Only key sections that were asked for count; when pre-extraction left
+        none of them to the LLM, any valid requested section does.
+        """
+        key_sections = [name for name in TEMPLATE_KEY_SECTIONS.get(template_id, []) if name in requested_sections]
+        found_expected = any(
+            section_validity.get(name, {}).get("valid", False) for name in (key_sections or requested_sections)
+        )
+        return found_expected and self._count_data_points(data) >= min_data_points
+
+    def _has_usable_sections(self, data: Dict[str, Any], section_validity: Dict[str, Dict[str, Any]]) -> bool:
+        return any(
+            result["valid"] and self._count_data_points(data.get(section)) > 0
+            for section, result in section_validity.items()
+        )
+
+    def _section_completeness(self, data: Dict[str, Any], section_validity: Dict[str, Dict[str, Any]],
+                              schema: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Status (complete, empty or invalid) and data points of each requested section"""
+        report = {}
+        for section in schema:
+            data_points = self._count_data_points(data.get(section))
+            if not section_validity.get(section, {"valid": True})["valid"]:
+                status = "invalid"
+            else:
+                status = "complete" if data_points else "empty"
+            report[section] = {"status": status, "data_points": data_points}
+        return report
+
+    def _reask_sections(self, structured_data: Dict[str, Any], section_validity: Dict[str, Dict[str, Any]],
+                        extracted_texts: List[Dict[str, Any]], template_config: Dict[str, Any], template_id: int,
+                        chunk_tokens: int, route: RouteDecision,
+                        min_data_points: int = 5) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Re-ask for the sections a reply got wrong, each from its own routed pages.
+
+        Invalid sections are always re-asked; empty ones only when the reply is
+        not acceptable, and then only the key sections, since most documents
+        legitimately leave some sections empty. Sections with no matching page
+        are not re-asked. Returns the completeness report after the re-ask, what
+        each re-ask did and the re-ask results; structured_data and
+        section_validity are updated in place.
+        """
+        schema = template_config["json_schema"]
+        completeness = self._section_completeness(structured_data, section_validity, schema)
+        if not LLM_PARTIAL_REASK:
+            return completeness, {}, []
         
-        # Template-specific validation
-        if template_id == 1:
-            # Template 1 should have private equity specific fields
-            expected_fields = ['Fund_and_Investment_Vehicle_Information', 'Fund_Manager', 'Fund_Companies']
-            found_expected = any(field in data for field in expected_fields)
-        else:
-            # Template 2 should have portfolio summary specific fields  
-            expected_fields = ['Executive_Portfolio_Summary', 'Schedule_of_Investments', 'Statement_of_Operations']
-            found_expected = any(field in data for field in expected_fields)
+        acceptable = self._is_acceptable(structured_data, section_validity, template_id, list(schema), min_data_points)
+        key_sections = [name for name in TEMPLATE_KEY_SECTIONS.get(template_id, []) if name in schema] or list(schema)
+        candidates = [section for section, report in completeness.items() if report["status"] == "invalid"]
+        if not acceptable:
+            candidates += [section for section in key_sections if completeness[section]["status"] == "empty"]
+        candidates = candidates[:max(0, LLM_REASK_MAX_SECTIONS)]
+        if not candidates:
+            return completeness, {}, []
+        
+        router = PageRouter(extracted_texts)
+        budget_tokens = min(chunk_tokens, LLM_SECTION_CONTEXT_TOKENS)
+        reasked = {}
+        results = []
+        futures = {}
+        for section in candidates:
+            text, routed_pages = router.route(section, schema[section], budget_tokens)
+            if not any(page["score"] > 0 for page in routed_pages):
+                reasked[section] = {"status": "skipped", "reason": "no relevant pages"}
+                continue
+            reasked[section] = {"pages": routed_pages}
+            futures[section] = self._map_executor.submit(self._extract_section, text, section, template_config,
+                                                         template_id, route)
+        
+        logger.info(f"🔁 Re-asking {len(futures)} of {len(schema)} sections for template {template_id}: {list(futures)}")
+        self.usage_stats["reasked_sections"] += len(futures)
+        
+        for section, future in futures.items():
+            try:
+                section_data, model_name = future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ Re-asking section {section} failed for template {template_id}: {e}")
+                reasked[section].update(status="failed", error=str(e))
+                continue
+            
+            results.append(section_data)
+            value = section_data.get(section)
+            data_points = self._count_data_points(value)
+            reasked[section].update(model=model_name, data_points=data_points)
+            # A valid but empty answer still replaces an invalid one
+            if data_points or completeness[section]["status"] == "invalid":
+                structured_data[section] = value
+                section_validity[section] = section_data["_metadata"]["section_validity"].get(section, {"valid": True})
+            reasked[section]["status"] = "recovered" if data_points else "empty"
+            if data_points:
+                self.usage_stats["recovered_sections"] += 1
         
-        return found_expected and self._count_data_points(data) >= 5
+        return self._section_completeness(structured_data, section_validity, schema), reasked, results
 
-    def process_texts(self, extracted_texts: List[Dict[str, Any]], template_id: int) -> Dict[str, Any]:
+    def process_texts(self, extracted_texts: List[Dict[str, Any]], template_id: int,
+                      on_section: Optional[Callable[[str], None]] = None,
+                      model: Optional[str] = None) -> Dict[str, Any]:
         """
         Process extracted texts with specified template - COMPLETE FIXED VERSION
+
+        on_section, if given, is called with each top-level section name as soon as
+        that section of the result is complete. model, if given, is tried first
+        instead of the one the router would pick.
         """
         self.usage_stats["total_requests"] += 1
         
@@ -793,100 +1294,332 @@ class LLMProcessor:
             
             logger.info(f"🧠 PROCESSING WITH TEMPLATE: {template_config['name']} (ID: {template_id})")
             
+            # Fields found by rule or read from tables are left out of the schema the LLM is asked to fill
+            prefilled = None
+            min_data_points = 5
+            if LLM_KPI_PREEXTRACTION or LLM_TABLE_MAPPING:
+                prefilled = self._prefill(extracted_texts, template_config["json_schema"])
+                if prefilled.covered:
+                    llm_schema = prune_schema(template_config["json_schema"], prefilled.covered)
+                    if not llm_schema:
+                        logger.info(f"📐 Every field of template {template_id} was pre-extracted, skipping the LLM")
+                        self.usage_stats["successful_extractions"] += 1
+                        return self._with_prefilled({}, prefilled, template_config, template_id)
+                    template_config = {**template_config, "json_schema": llm_schema}
+                    min_data_points = max(1, min_data_points - len(prefilled.covered))
+            
+            # Routing features describe the whole document, before pages are dropped
+            features = DocumentFeatures(extracted_texts)
+            
+            # Keep the most relevant pages within the text budget
+            chunk_tokens = self._chunk_tokens(template_config, template_id)
+            page_selection = None
+            if LLM_PAGE_SELECTION:
+                extracted_texts, page_selection = self._select_pages(extracted_texts, chunk_tokens)
+            
             # Combine texts
-            combined_text = self._combine_texts(extracted_texts)
+            combined_text = self._combine_texts(extracted_texts, chunk_tokens)
             
-            # Check cache with template-specific key
-            cache_key = self._generate_cache_key(combined_text, template_id)
-            if self.cache_enabled and cache_key in self.response_cache:
-                logger.info(f"💾 Cache hit for template {template_id}")
-                self.usage_stats["cache_hits"] += 1
-                return self.response_cache[cache_key]
+            # Section calls, chunk calls and whole-document calls keep separate statistics
+            if LLM_EXTRACTION_MODE == EXTRACTION_MODE_SECTIONS:
+                call_kind = "section"
+            elif LLM_MAP_REDUCE and estimate_tokens(combined_text) > chunk_tokens:
+                call_kind = "chunk"
+            else:
+                call_kind = "document"
+            route = self.model_router.route(template_id, features, call_kind=call_kind, override=model)
+            
+            if call_kind == "section":
+                return self._with_prefilled(
+                    self._process_sections(extracted_texts, template_config, template_id, chunk_tokens, route,
+                                           page_selection, on_section, min_data_points),
+                    prefilled, template_config, template_id
+                )
+            
+            # Long documents are extracted chunk by chunk instead of being truncated
+            if call_kind == "chunk":
+                return self._with_prefilled(
+                    self._process_map_reduce(extracted_texts, template_config, template_id, chunk_tokens, route,
+                                             page_selection, min_data_points),
+                    prefilled, template_config, template_id
+                )
             
             # Create template-specific prompt
             prompt = self._create_template_specific_prompt(combined_text, template_config, template_id)
             
+            # Check the shared cache; keys cover prompt, model, template and processor version
+            cached_data = self._get_cached_response(prompt, template_id)
+            if cached_data is not None:
+                logger.info(f"💾 Cache hit for template {template_id}")
+                self.usage_stats["cache_hits"] += 1
+                self.usage_stats["successful_extractions"] += 1
+                return self._with_prefilled(cached_data, prefilled, template_config, template_id)
+            
             # Execute extraction with template validation
-            structured_data = self._execute_template_extraction(prompt, template_config, template_id)
+            structured_data, model_name = self._execute_template_extraction(
+                prompt, template_config, template_id, min_data_points=min_data_points, on_section=on_section,
+                allow_partial=LLM_PARTIAL_REASK, route=route
+            )
+            output_recovery = self._output_recovery([structured_data])
+            section_validity = structured_data.pop("_metadata", {}).get("section_validity", {})
+            
+            # Keep the good sections and re-ask only for the ones the reply got wrong
+            completeness, reasked, reask_results = self._reask_sections(
+                structured_data, section_validity, extracted_texts, template_config, template_id,
+                chunk_tokens, route, min_data_points
+            )
+            if not self._is_acceptable(structured_data, section_validity, template_id,
+                                       list(template_config["json_schema"]), min_data_points):
+                raise Exception(f"Extraction results do not match template {template_id} (re-asked sections: {list(reasked)})")
+            output_recovery = self._output_recovery(reask_results, output_recovery)
             
             # Add metadata
-            structured_data["_metadata"] = {
-                "extraction_timestamp": datetime.now().isoformat(),
-                "template_name": template_config['name'],
-                "template_id": template_id,  # Ensure template ID is stored
-                "template_version": template_config['version'],
-                "processor_version": "2.3.0",
-                "data_points": self._count_data_points(structured_data)
-            }
+            structured_data["_metadata"] = self._build_metadata(
+                structured_data, template_config, template_id, model=model_name, page_selection=page_selection,
+                routing=route.to_dict(),
+                section_validity=section_validity,
+                section_completeness=completeness,
+                reasked_sections=reasked,
+                output_recovery=output_recovery
+            )
             
-            # Cache result with template-specific key
-            if self.cache_enabled:
-                self.response_cache[cache_key] = structured_data
+            # Cache result under the model that produced it; a repaired reply is missing its tail
+            if not output_recovery["repairs"]:
+                self._cache_response(prompt, model_name, template_id, structured_data)
             
             self.usage_stats["successful_extractions"] += 1
             logger.info(f"✅ Successfully extracted {self._count_data_points(structured_data)} data points for template {template_id}")
             
-            return structured_data
+            return self._with_prefilled(structured_data, prefilled, template_config, template_id)
             
         except Exception as e:
             self.usage_stats["failed_extractions"] += 1
             logger.error(f"❌ LLM processing failed for template {template_id}: {str(e)}")
             raise Exception(f"LLM processing failed for template {template_id}: {str(e)}")
 
+    def _prefill(self, extracted_texts: List[Dict[str, Any]], schema: Dict[str, Any]) -> PrefilledFields:
+        """Fields that can be filled without the LLM: stated KPIs and cleanly mapped tables"""
+        prefilled = self.kpi_extractor.extract(extracted_texts, schema) if LLM_KPI_PREEXTRACTION else PrefilledFields()
+        if LLM_TABLE_MAPPING:
+            self.table_mapper.fill(extracted_texts, schema, prefilled)
+        return prefilled
+
+    def _with_prefilled(self, structured_data: Dict[str, Any], prefilled: Optional[PrefilledFields],
+                        template_config: Dict[str, Any], template_id: int) -> Dict[str, Any]:
+        """Combine pre-extracted fields with the LLM result, in template order, recording their provenance"""
+        if not prefilled or not prefilled.covered:
+            return structured_data
+        
+        metadata = structured_data.get("_metadata") or self._build_metadata(
+            structured_data, template_config, template_id, model=None, extraction_mode="prefilled"
+        )
+        merged = merge_extraction_results([prefilled.data, structured_data])
+        
+        # Sections the LLM was not asked for come back in their original place
+        schema = self.template_configs[template_id]["json_schema"]
+        ordered = {key: merged[key] for key in schema if key in merged}
+        ordered.update((key, value) for key, value in merged.items() if key not in ordered)
+        
+        ordered["_metadata"] = {
+            **metadata,
+            "prefilled_fields": prefilled.provenance,
+            "data_points": self._count_data_points(ordered)
+        }
+        return ordered
+
+    def _select_pages(self, extracted_texts: List[Dict[str, Any]], chunk_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Rank pages by financial content and keep what fits the text budget of the extraction calls"""
+        budget_tokens = chunk_tokens * (max(1, LLM_MAX_CHUNKS) if LLM_MAP_REDUCE else 1)
+        selected_texts, report = select_pages(extracted_texts, budget_tokens)
+        
+        # Never send nothing: if every page looked like boilerplate, keep the documents whole
+        if not selected_texts:
+            logger.warning("⚠️ Page selection kept no pages, using the full text")
+            return extracted_texts, None
+        
+        return selected_texts, report
+
+    def _process_map_reduce(self, extracted_texts: List[Dict[str, Any]], template_config: Dict[str, Any],
+                            template_id: int, chunk_tokens: int, route: RouteDecision,
+                            page_selection: Optional[Dict[str, Any]] = None,
+                            min_data_points: int = 5) -> Dict[str, Any]:
+        """Extract every chunk of a long document concurrently and merge the results"""
+        chunker = TextChunker(chunk_tokens, LLM_CHUNK_OVERLAP_TOKENS)
+        chunks = chunker.split_documents([text_data.get("text", "") for text_data in extracted_texts])
+        logger.info(f"🧩 Map-reduce extraction: {len(chunks)} chunks for template {template_id}")
+        
+        futures = [
+            self._map_executor.submit(self._extract_chunk, chunk, index + 1, len(chunks), template_config, template_id, route)
+            for index, chunk in enumerate(chunks)
+        ]
+        
+        chunk_results = []
+        models = []
+        failed_chunks = []
+        for index, future in enumerate(futures):
+            try:
+                chunk_data, model_name = future.result()
+                chunk_results.append(chunk_data)
+                models.append(model_name)
+            except Exception as e:
+                logger.warning(f"⚠️ Chunk {index + 1}/{len(chunks)} failed for template {template_id}: {e}")
+                failed_chunks.append(index + 1)
+        
+        if not chunk_results:
+            raise Exception(f"All {len(chunks)} chunks failed for template {template_id}")
+        
+        structured_data, section_validity = self._validate_sections(merge_extraction_results(chunk_results), template_id)
+        completeness, reasked, reask_results = self._reask_sections(
+            structured_data, section_validity, extracted_texts, template_config, template_id, chunk_tokens, route,
+            min_data_points
+        )
+        if not self._is_acceptable(structured_data, section_validity, template_id, list(template_config["json_schema"]),
+                                   min_data_points):
+            raise Exception(f"Merged chunk results do not match template {template_id}")
+        
+        structured_data["_metadata"] = self._build_metadata(
+            structured_data, template_config, template_id,
+            model=max(set(models), key=models.count),
+            extraction_mode="map_reduce",
+            chunks=len(chunks),
+            failed_chunks=failed_chunks,
+            page_selection=page_selection,
+            routing=route.to_dict(),
+            section_validity=section_validity,
+            section_completeness=completeness,
+            reasked_sections=reasked,
+            output_recovery=self._output_recovery(chunk_results + reask_results)
+        )
+        
+        self.usage_stats["successful_extractions"] += 1
+        logger.info(f"✅ Merged {len(chunk_results)}/{len(chunks)} chunks into {structured_data['_metadata']['data_points']} data points for template {template_id}")
+        
+        return structured_data
+
+    def _extract_chunk(self, chunk: str, part: int, total_parts: int, template_config: Dict[str, Any],
+                       template_id: int, route: RouteDecision) -> Tuple[Dict[str, Any], str]:
+        """Extract one chunk, served from the response cache when possible"""
+        prompt = self._create_template_specific_prompt(chunk, template_config, template_id, part=(part, total_parts))
+        
+        # A chunk may legitimately hold only a few values
+        return self._extract_cached(prompt, template_config, template_id, min_data_points=1, route=route,
+                                    call_kind="chunk")
+
+    def _process_sections(self, extracted_texts: List[Dict[str, Any]], template_config: Dict[str, Any],
+                          template_id: int, chunk_tokens: int, route: RouteDecision,
+                          page_selection: Optional[Dict[str, Any]] = None,
+                          on_section: Optional[Callable[[str], None]] = None,
+                          min_data_points: int = 5) -> Dict[str, Any]:
+        """Extract each top-level schema section concurrently from the pages routed to it"""
+        schema = template_config["json_schema"]
+        router = PageRouter(extracted_texts)
+        budget_tokens = min(chunk_tokens, LLM_SECTION_CONTEXT_TOKENS)
+        
+        futures = {}
+        routing = {}
+        for section, section_schema in schema.items():
+            text, routed_pages = router.route(section, section_schema, budget_tokens)
+            routing[section] = routed_pages
+            futures[section] = self._map_executor.submit(self._extract_section, text, section, template_config,
+                                                         template_id, route)
+            if on_section:
+                futures[section].add_done_callback(
+                    lambda future, name=section: on_section(name) if not future.exception() else None
+                )
+        
+        logger.info(f"🧩 Section extraction: {len(futures)} sections over {len(router.pages)} pages for template {template_id}")
+        
+        structured_data: Dict[str, Any] = {}
+        sections_report = {}
+        failed_sections = []
+        models = []
+        section_results = []
+        for section, future in futures.items():
+            try:
+                section_data, model_name = future.result()
+                section_results.append(section_data)
+                structured_data[section] = section_data.get(section)
+                models.append(model_name)
+                sections_report[section] = {"status": "success", "model": model_name, "pages": routing[section]}
+            except Exception as e:
+                logger.warning(f"⚠️ Section {section} failed for template {template_id}: {e}")
+                structured_data[section] = [] if isinstance(schema[section], list) else None
+                failed_sections.append(section)
+                sections_report[section] = {"status": "failed", "error": str(e), "pages": routing[section]}
+        
+        structured_data, section_validity = self._validate_sections(structured_data, template_id)
+        if not self._is_acceptable(structured_data, section_validity, template_id, list(schema), min_data_points):
+            raise Exception(f"Section results do not match template {template_id} (failed sections: {failed_sections})")
+        
+        structured_data["_metadata"] = self._build_metadata(
+            structured_data, template_config, template_id,
+            model=max(set(models), key=models.count) if models else None,
+            extraction_mode=EXTRACTION_MODE_SECTIONS,
+            sections=sections_report,
+            failed_sections=failed_sections,
+            page_selection=page_selection,
+            routing=route.to_dict(),
+            section_validity=section_validity,
+            section_completeness=self._section_completeness(structured_data, section_validity, schema),
+            output_recovery=self._output_recovery(section_results)
+        )
+        
+        self.usage_stats["successful_extractions"] += 1
+        logger.info(f"✅ Assembled {len(schema) - len(failed_sections)}/{len(schema)} sections into {structured_data['_metadata']['data_points']} data points for template {template_id}")
+        
+        return structured_data
+
+    def _extract_section(self, text: str, section: str, template_config: Dict[str, Any],
+                         template_id: int, route: RouteDecision) -> Tuple[Dict[str, Any], str]:
+        """Extract one schema section from its routed pages"""
+        prompt = self._create_template_specific_prompt(text, template_config, template_id, section=section)
+        return self._extract_cached(prompt, template_config, template_id, section=section,
+                                    max_tokens=LLM_SECTION_MAX_TOKENS, route=route)
+
+    def _extract_cached(self, prompt: str, template_config: Dict[str, Any], template_id: int,
+                        **extraction_options) -> Tuple[Dict[str, Any], str]:
+        """Run one extraction call, served from the response cache when possible"""
+        cached_data = self._get_cached_response(prompt, template_id)
+        if cached_data is not None:
+            self.usage_stats["cache_hits"] += 1
+            return cached_data, cached_data["_metadata"].get("model")
+        
+        data, model_name = self._execute_template_extraction(prompt, template_config, template_id, **extraction_options)
+        data["_metadata"] = {"model": model_name, **data.get("_metadata", {})}
+        if not self._output_recovery([data])["repairs"]:
+            self._cache_response(prompt, model_name, template_id, data)
+        return data, model_name
+
+    @staticmethod
+    def _output_recovery(results: List[Dict[str, Any]], totals: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Continuations and repairs behind a set of extraction results, added to totals when given"""
+        totals = dict(totals or {"continuations": 0, "repairs": 0})
+        for result in results:
+            recovery = (result.get("_metadata") or {}).get("output_recovery", {})
+            for key in totals:
+                totals[key] += recovery.get(key, 0)
+        return totals
+
+    def _build_metadata(self, structured_data: Dict[str, Any], template_config: Dict[str, Any], template_id: int,
+                        model: Optional[str], extraction_mode: str = "single", **extra) -> Dict[str, Any]:
+        """Metadata block attached to every extraction result"""
+        return {
+            "extraction_timestamp": datetime.now().isoformat(),
+            "template_name": template_config['name'],
+            "template_id": template_id,  # Ensure template ID is stored
+            "template_version": template_config['version'],
+            "processor_version": PROCESSOR_VERSION,
+            "model": model,
+            "extraction_mode": extraction_mode,
+            **extra,
+            "data_points": self._count_data_points(structured_data)
+        }
+
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """Parse LLM response with enhanced error handling"""
         try:
-            # Clean response text
-            cleaned_text = response_text.strip()
-            
-            # Try direct JSON parsing first
-            try:
-                return json.loads(cleaned_text)
-            except json.JSONDecodeError:
-                pass
-            
-            # Try to extract JSON from code blocks
-            json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', cleaned_text, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group(1).strip())
-                except json.JSONDecodeError:
-                    pass
-            
-            # Try to find JSON between curly braces (more robust)
-            brace_match = re.search(r'\{[\s\S]*\}', cleaned_text)
-            if brace_match:
-                try:
-                    return json.loads(brace_match.group(0))
-                except json.JSONDecodeError:
-                    pass
-            
-            # Last attempt: find any JSON-like structure
-            lines = cleaned_text.split('\n')
-            json_start = -1
-            json_end = -1
-            brace_count = 0
-            
-            for i, line in enumerate(lines):
-                if '{' in line and json_start == -1:
-                    json_start = i
-                    brace_count += line.count('{') - line.count('}')
-                elif json_start != -1:
-                    brace_count += line.count('{') - line.count('}')
-                    if brace_count == 0:
-                        json_end = i + 1
-                        break
-            
-            if json_start != -1 and json_end != -1:
-                json_content = '\n'.join(lines[json_start:json_end])
-                try:
-                    return json.loads(json_content)
-                except json.JSONDecodeError:
-                    pass
-            
-            raise ValueError("No valid JSON found in response")
-            
-        except Exception as e:
+            return parse_json_object(response_text)
+        except ValueError as e:
             logger.error(f"Response parsing failed: {e}")
             logger.error(f"Response text: {response_text[:500]}...")
             raise ValueError(f"Failed to parse response: {str(e)}")
@@ -916,22 +1649,30 @@ class LLMProcessor:
         """Get usage statistics"""
         return {
             **self.usage_stats,
-            "cache_size": len(self.response_cache),
+            "cache": self.response_cache.get_statistics() if self.response_cache else {"enabled": False},
+            "scheduler": self.scheduler.get_statistics(),
+            "routing": self.model_router.get_statistics(),
+            "prompts": {
+                template_id: config["compiled_prompt"].get_statistics()
+                for template_id, config in self.template_configs.items()
+            },
             "timestamp": datetime.now().isoformat(),
             "supported_templates": list(self.template_configs.keys())
         }
 
     def clear_cache(self):
         """Clear response cache"""
-        self.response_cache.clear()
+        if self.response_cache:
+            self.response_cache.clear()
         logger.info("Cache cleared")
 
     def health_check(self) -> Dict[str, Any]:
         """Health check"""
         try:
-            test_response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": "Say 'OK'"}],
+            self.scheduler.complete(
+                self.client,
+                "llama-3.1-8b-instant",
+                [{"role": "user", "content": "Say 'OK'"}],
                 max_tokens=10
             )
             
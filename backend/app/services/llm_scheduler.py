@@ -0,0 +1,442 @@
+# llm_scheduler.py
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from groq import AsyncGroq, RateLimitError
+
+from app.services.text_chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# HTTP connection pool shared by every LLM call
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+# Scheduler limits; a per-minute limit of 0 leaves it to the provider's rate-limit headers
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+
+# Wait used after a 429 that carries no Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Pooled keep-alive HTTP client for the LLM API, using HTTP/2 when h2 is installed"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+    )
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a rate-limit header value such as "7.66s", "2m59.56s", "120ms" or "30" """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously.
+
+    A rate of 0 means unlimited until set_limit is called with a real limit.
+    """
+
+    def __init__(self, per_minute: int):
+        self.configured = per_minute
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.capacity > 0
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available; requests larger than the bucket wait for a full one"""
+        if not self.limited:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) * 60.0 / self.capacity
+
+    def consume(self, amount: float, now: float):
+        if self.limited:
+            self._refill(now)
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        if self.limited and amount > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+    def set_limit(self, limit: float):
+        """Adopt the provider's limit, never exceeding a configured one"""
+        if limit <= 0:
+            return
+        capacity = min(limit, self.configured) if self.configured else limit
+        if capacity != self.capacity:
+            self.level = min(self.level, capacity) if self.limited else capacity
+            self.capacity = float(capacity)
+
+    def set_remaining(self, remaining: float, now: float):
+        """The provider's count is authoritative when it is lower than ours"""
+        if self.limited:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+
+class ModelLimits:
+    """Rate-limit state for one model; the provider enforces its limits per model"""
+
+    def __init__(self):
+        self.requests = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(LLM_TOKENS_PER_MINUTE)
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "requests_per_minute": self.requests.capacity or None,
+            "tokens_per_minute": self.tokens.capacity or None,
+            "tokens_available": round(max(0.0, self.tokens.level)) if self.tokens.limited else None,
+            "blocked_seconds": round(max(0.0, self.blocked_until - now), 2)
+        }
+
+
+class LLMScheduler:
+    """
+    Runs every LLM request on one asyncio loop, within the API's rate limits.
+
+    The loop runs in a background thread and owns the async HTTP connection
+    pool, so blocking callers (the LLM stage workers) submit requests with
+    complete() and wait on the result. Requests wait for a per-model budget of
+    requests and tokens per minute, then for one of LLM_MAX_CONCURRENT_REQUESTS
+    slots. The budgets follow the provider's x-ratelimit-* headers, and a 429
+    pauses the model for its Retry-After before the request is retried.
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self._owns_http_client = http_client is None
+        self.http_client = http_client or create_http_client()
+        self.max_concurrency = max(1, LLM_MAX_CONCURRENT_REQUESTS)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._limits: Dict[str, ModelLimits] = {}
+        self.metrics = {
+            "requests": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "throttled_requests": 0,
+            "throttle_seconds": 0.0,
+            "queue_wait_seconds": 0.0,
+            "rate_limited": 0,
+            "retries": 0,
+            "cancelled": 0,
+            "hedged": 0
+        }
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"🚦 LLM scheduler started ({self.max_concurrency} concurrent requests, HTTP/2: {HTTP2_AVAILABLE})")
+
+    def create_client(self, api_key: str) -> AsyncGroq:
+        """Groq client on the shared pool; retries are left to the scheduler"""
+        return AsyncGroq(api_key=api_key, http_client=self.http_client, max_retries=0)
+
+    def complete(self, client: AsyncGroq, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                 temperature: float = 0.1, on_delta: Optional[Callable[[str], bool]] = None,
+                 response_format: Optional[Dict[str, Any]] = None,
+                 on_send: Optional[Callable[[], None]] = None) -> Tuple[str, Optional[str]]:
+        """
+        Blocking wrapper around acomplete for worker threads.
+
+        With on_delta the completion is streamed and each piece of content is
+        passed to it on the scheduler thread; returning True stops the stream.
+        Exceptions raised by on_delta propagate to the caller.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.acomplete(client, model, messages, max_tokens, temperature, on_delta, response_format, on_send),
+            self._loop
+        )
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def acomplete(self, client: AsyncGroq, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                        temperature: float = 0.1, on_delta: Optional[Callable[[str], bool]] = None,
+                        response_format: Optional[Dict[str, Any]] = None,
+                        on_send: Optional[Callable[[], None]] = None) -> Tuple[str, Optional[str]]:
+        """
+        Send one chat completion once the model's budget and a concurrency slot are free.
+
+        Returns the content and the finish reason ("length" when max_tokens cut
+        it off; None when on_delta stopped the stream). response_format is passed
+        through, e.g. {"type": "json_object"} for JSON mode. on_send is called
+        each time the request leaves the queue and is sent, so callers can time
+        the model without the wait for rate limits and slots.
+        """
+        limits = self._limits.setdefault(model, ModelLimits())
+        reserved = sum(estimate_tokens(message["content"]) for message in messages) + max_tokens
+
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            queued_at = time.monotonic()
+            self._enter_queue()
+            try:
+                await self._reserve(limits, reserved)
+                await self._semaphore.acquire()
+            finally:
+                self._leave_queue()
+            self.metrics["queue_wait_seconds"] += time.monotonic() - queued_at
+
+            self.metrics["requests"] += 1
+            self.metrics["in_flight"] += 1
+            try:
+                if on_send:
+                    on_send()
+                text, used_tokens, finish_reason = await self._send(client, model, messages, max_tokens, temperature,
+                                                                    on_delta, response_format, limits)
+                if used_tokens is not None:
+                    limits.tokens.refund(reserved - used_tokens)
+                return text, finish_reason
+            except asyncio.CancelledError:
+                self.metrics["cancelled"] += 1
+                raise
+            except RateLimitError as e:
+                self.metrics["rate_limited"] += 1
+                retry_after = self._retry_after(e.response.headers)
+                limits.blocked_until = max(limits.blocked_until, time.monotonic() + retry_after)
+                self._observe_headers(limits, e.response.headers)
+                if attempt == LLM_RATE_LIMIT_RETRIES:
+                    self.metrics["failed"] += 1
+                    raise
+                self.metrics["retries"] += 1
+                logger.warning(f"⏳ Rate limited on {model}, retrying in {retry_after:.1f}s "
+                               f"(attempt {attempt + 1}/{LLM_RATE_LIMIT_RETRIES})")
+            except BaseException:
+                self.metrics["failed"] += 1
+                raise
+            finally:
+                self.metrics["in_flight"] -= 1
+                self._semaphore.release()
+
+    def race(self, attempts: List[Callable[[], Awaitable[Any]]], hedge_delay: Optional[float]) -> Tuple[int, Any, int]:
+        """Blocking wrapper around arace for worker threads"""
+        future = asyncio.run_coroutine_threadsafe(self.arace(attempts, hedge_delay), self._loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def arace(self, attempts: List[Callable[[], Awaitable[Any]]],
+                    hedge_delay: Optional[float]) -> Tuple[int, Any, int]:
+        """
+        Run attempts in order until one succeeds, hedging slow ones.
+
+        The next attempt starts as soon as the running ones have all failed or,
+        with a hedge_delay, once that many seconds pass without a result (0 starts
+        them all at once; None only falls back on failure). The first attempt to
+        return wins and the others are cancelled. Returns the winner's index, its
+        result and how many attempts the hedge timer started after a non-zero
+        wait; raises the last error if none succeeds.
+        """
+        running: Dict[asyncio.Task, int] = {}
+        errors: List[BaseException] = []
+        launched = 0
+        hedged = 0
+
+        def launch():
+            nonlocal launched
+            running[asyncio.ensure_future(attempts[launched]())] = launched
+            launched += 1
+
+        launch()
+        try:
+            while running:
+                timeout = hedge_delay if launched < len(attempts) else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Attempts started together (delay 0) are parallel, not hedged
+                    if hedge_delay:
+                        self.metrics["hedged"] += 1
+                        hedged += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    index = running.pop(task)
+                    if task.exception() is None:
+                        return index, task.result(), hedged
+                    errors.append(task.exception())
+
+                if not running and launched < len(attempts):
+                    launch()
+
+            raise errors[-1]
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _reserve(self, limits: ModelLimits, tokens: int):
+        """Wait until the model can take one more request of this size, in arrival order"""
+        async with limits.lock:
+            throttled = False
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    limits.blocked_until - now,
+                    limits.requests.wait_time(1, now),
+                    limits.tokens.wait_time(tokens, now)
+                )
+                if wait <= 0:
+                    break
+                throttled = True
+                await asyncio.sleep(wait)
+
+            limits.requests.consume(1, now)
+            limits.tokens.consume(tokens, now)
+            if throttled:
+                self.metrics["throttled_requests"] += 1
+                self.metrics["throttle_seconds"] += now - started
+
+    async def _send(self, client: AsyncGroq, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                    temperature: float, on_delta: Optional[Callable[[str], bool]],
+                    response_format: Optional[Dict[str, Any]],
+                    limits: ModelLimits) -> Tuple[str, Optional[int], Optional[str]]:
+        """Make the request; returns the content, the tokens used (when reported) and the finish reason"""
+        options = {"response_format": response_format} if response_format else {}
+        raw = await client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=on_delta is not None,
+            **options
+        )
+        self._observe_headers(limits, raw.headers)
+        response = await raw.parse()
+
+        if on_delta is None:
+            usage = response.usage
+            choice = response.choices[0]
+            return choice.message.content, usage.total_tokens if usage else None, choice.finish_reason
+
+        parts = []
+        usage = None
+        finish_reason = None
+        try:
+            async for chunk in response:
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and x_groq.usage is not None:
+                    usage = x_groq.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                content = chunk.choices[0].delta.content
+                if content:
+                    parts.append(content)
+                    if on_delta(content):
+                        break
+        finally:
+            await response.close()
+
+        return "".join(parts), usage.total_tokens if usage else None, finish_reason
+
+    def _observe_headers(self, limits: ModelLimits, headers: httpx.Headers):
+        """Follow the provider's view of the limits (Groq: requests per day, tokens per minute)"""
+        now = time.monotonic()
+        token_limit = headers.get("x-ratelimit-limit-tokens")
+        token_remaining = headers.get("x-ratelimit-remaining-tokens")
+        try:
+            if token_limit:
+                limits.tokens.set_limit(float(token_limit))
+            if token_remaining:
+                limits.tokens.set_remaining(float(token_remaining), now)
+            # The request allowance is per day; only honour it once it runs out
+            if headers.get("x-ratelimit-remaining-requests") == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    limits.blocked_until = max(limits.blocked_until, now + reset)
+        except ValueError:
+            logger.debug(f"Ignoring malformed rate-limit headers: {dict(headers)}")
+
+    def _retry_after(self, headers: httpx.Headers) -> float:
+        return (
+            parse_duration(headers.get("retry-after"))
+            or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            or DEFAULT_RETRY_AFTER
+        )
+
+    def _enter_queue(self):
+        self.metrics["queue_depth"] += 1
+        self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self.metrics["queue_depth"])
+
+    def _leave_queue(self):
+        self.metrics["queue_depth"] -= 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Queue, throttling and per-model rate-limit metrics"""
+        return {
+            **self.metrics,
+            "throttle_seconds": round(self.metrics["throttle_seconds"], 2),
+            "queue_wait_seconds": round(self.metrics["queue_wait_seconds"], 2),
+            "max_concurrency": self.max_concurrency,
+            "models": {model: limits.snapshot() for model, limits in list(self._limits.items())}
+        }
+
+    def close(self):
+        """Close the connection pool if this scheduler created it, then stop the loop"""
+        if self._loop.is_closed():
+            return
+        if self._owns_http_client:
+            asyncio.run_coroutine_threadsafe(self.http_client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,377 @@
+# model_router.py
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.llm_cache import LLM_CACHE_DIR
+from app.services.sqlite_store import connect, create_store
+from app.services.text_chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Pick the first model per request from document features and observed model statistics;
+# when off, models are tried in their fixed priority order
+LLM_ROUTING = os.getenv("LLM_ROUTING", "true").lower() == "true"
+LLM_ROUTER_DIR = os.getenv("LLM_ROUTER_DIR", LLM_CACHE_DIR)
+
+# Kinds of extraction call; each is timed and scored separately
+CALL_KINDS = ("document", "chunk", "section")
+
+# A model is routed to first for a kind of document once it has this record there
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "20"))
+LLM_ROUTER_MIN_SUCCESS_RATE = float(os.getenv("LLM_ROUTER_MIN_SUCCESS_RATE", "0.9"))
+LLM_ROUTER_MAX_LATENCY = float(os.getenv("LLM_ROUTER_MAX_LATENCY", "60"))
+LLM_ROUTER_LATENCY_PERCENTILE = float(os.getenv("LLM_ROUTER_LATENCY_PERCENTILE", "90"))
+LLM_ROUTER_STATS_WINDOW = int(os.getenv("LLM_ROUTER_STATS_WINDOW", "200"))
+
+# Share of requests that try a model without enough samples first, so the router can learn about it
+LLM_ROUTER_EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.1"))
+
+# Document size and density classes
+LLM_ROUTER_SMALL_PAGES = int(os.getenv("LLM_ROUTER_SMALL_PAGES", "5"))
+LLM_ROUTER_SMALL_TOKENS = int(os.getenv("LLM_ROUTER_SMALL_TOKENS", "4000"))
+LLM_ROUTER_LARGE_TOKENS = int(os.getenv("LLM_ROUTER_LARGE_TOKENS", "12000"))
+LLM_ROUTER_DENSE_TABLES = int(os.getenv("LLM_ROUTER_DENSE_TABLES", "5"))
+LLM_ROUTER_DENSE_PAGE_SCORE = float(os.getenv("LLM_ROUTER_DENSE_PAGE_SCORE", "12"))
+
+# Fixed first model per template, e.g. "1:llama-3.1-8b-instant,2:llama-3.3-70b-versatile"
+LLM_ROUTER_TEMPLATE_MODELS = os.getenv("LLM_ROUTER_TEMPLATE_MODELS", "")
+
+# Routing decisions kept on disk for analysis
+LLM_ROUTER_MAX_DECISIONS = int(os.getenv("LLM_ROUTER_MAX_DECISIONS", "10000"))
+
+
+def parse_template_models(value: str) -> Dict[int, str]:
+    """Template overrides from "template_id:model" pairs separated by commas"""
+    overrides = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        template_id, _, model = pair.partition(":")
+        try:
+            overrides[int(template_id)] = model.strip()
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring malformed template model override: {pair!r}")
+    return overrides
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * percentile / 100))], 3)
+
+
+class DocumentFeatures:
+    """What the router knows about a document before any model sees it"""
+
+    def __init__(self, extracted_texts: List[Dict[str, Any]]):
+        self.pages = sum(text_data.get("page_count") or 1 for text_data in extracted_texts)
+        self.tokens = sum(estimate_tokens(text_data.get("text", "")) for text_data in extracted_texts)
+        self.financial_content_score = sum(text_data.get("financial_content_score", 0) for text_data in extracted_texts)
+        self.tables = sum(len(text_data.get("tables") or []) for text_data in extracted_texts)
+
+    @property
+    def size(self) -> str:
+        if self.pages <= LLM_ROUTER_SMALL_PAGES and self.tokens <= LLM_ROUTER_SMALL_TOKENS:
+            return "small"
+        return "large" if self.tokens > LLM_ROUTER_LARGE_TOKENS else "medium"
+
+    @property
+    def dense(self) -> bool:
+        """Many tables, or pages that score high for financial content"""
+        return (
+            self.tables >= LLM_ROUTER_DENSE_TABLES
+            or self.financial_content_score / max(1, self.pages) >= LLM_ROUTER_DENSE_PAGE_SCORE
+        )
+
+    @property
+    def document_class(self) -> str:
+        """Statistics are kept per class, e.g. "small" or "large-dense\""""
+        return f"{self.size}-dense" if self.dense else self.size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "tokens": self.tokens,
+            "financial_content_score": self.financial_content_score,
+            "tables": self.tables,
+            "document_class": self.document_class
+        }
+
+
+class RouteDecision:
+    """The model order chosen for one request, and why; call_kind is the kind of call the request is mostly made of"""
+
+    def __init__(self, template_id: int, document_class: str, call_kind: str, models: List[Dict[str, Any]],
+                 reason: str, decision_id: Optional[int] = None):
+        self.template_id = template_id
+        self.document_class = document_class
+        self.call_kind = call_kind
+        self.models = models
+        self.reason = reason
+        self.decision_id = decision_id
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "document_class": self.document_class,
+            "call_kind": self.call_kind,
+            "models": [model_config["name"] for model_config in self.models],
+            "reason": self.reason,
+            "decision_id": self.decision_id
+        }
+
+
+class ModelStatsStore:
+    """
+    Per-model outcomes and routing decisions in SQLite, so they survive restarts
+    and are shared by every worker process.
+
+    Outcomes are kept per model, template, call kind and document class,
+    trimmed to the last LLM_ROUTER_STATS_WINDOW; decisions to the last
+    LLM_ROUTER_MAX_DECISIONS.
+    """
+
+    def __init__(self, stats_dir: str = LLM_ROUTER_DIR, window: int = LLM_ROUTER_STATS_WINDOW,
+                 max_decisions: int = LLM_ROUTER_MAX_DECISIONS):
+        self.db_path = os.path.join(stats_dir, "model_router.sqlite3")
+        self.window = window
+        self.max_decisions = max_decisions
+
+        create_store(self.db_path)
+        with connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outcomes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    decision_id INTEGER,
+                    model TEXT NOT NULL,
+                    template_id INTEGER NOT NULL,
+                    call_kind TEXT NOT NULL DEFAULT 'document',
+                    document_class TEXT NOT NULL,
+                    success INTEGER NOT NULL,
+                    latency REAL NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS decisions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    template_id INTEGER NOT NULL,
+                    call_kind TEXT NOT NULL DEFAULT 'document',
+                    document_class TEXT NOT NULL,
+                    features TEXT NOT NULL,
+                    models TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Stores written before outcomes were split by call kind
+            for table in ("outcomes", "decisions"):
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if "call_kind" not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN call_kind TEXT NOT NULL DEFAULT 'document'")
+            conn.execute("DROP INDEX IF EXISTS idx_outcomes_key")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outcomes_kind ON outcomes (template_id, call_kind, document_class, model)"
+            )
+
+    def record_outcome(self, decision_id: Optional[int], model: str, template_id: int, call_kind: str,
+                       document_class: str, success: bool, latency: float):
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO outcomes (decision_id, model, template_id, call_kind, document_class, success, latency, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (decision_id, model, template_id, call_kind, document_class, int(success), latency, time.time())
+            )
+            key = (template_id, call_kind, document_class, model)
+            conn.execute(
+                "DELETE FROM outcomes WHERE template_id = ? AND call_kind = ? AND document_class = ? AND model = ? "
+                "AND id <= (SELECT id FROM outcomes WHERE template_id = ? AND call_kind = ? AND document_class = ? "
+                "AND model = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                key + key + (self.window,)
+            )
+
+    def record_decision(self, template_id: int, call_kind: str, document_class: str, features: Dict[str, Any],
+                        models: List[str], reason: str) -> int:
+        with connect(self.db_path) as conn:
+            cursor = conn.execute(
+                "INSERT INTO decisions (template_id, call_kind, document_class, features, models, reason, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (template_id, call_kind, document_class, json.dumps(features), json.dumps(models), reason, time.time())
+            )
+            conn.execute("DELETE FROM decisions WHERE id <= ?", (cursor.lastrowid - self.max_decisions,))
+            return cursor.lastrowid
+
+    def model_stats(self, template_id: Optional[int] = None, call_kind: Optional[str] = None,
+                    document_class: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Success rate and latency percentiles per model, keyed by
+        "template:call kind:document class"; optionally for one template, kind and class.
+        """
+        query = "SELECT template_id, call_kind, document_class, model, success, latency FROM outcomes"
+        conditions, params = [], []
+        if template_id is not None:
+            conditions.append("template_id = ?")
+            params.append(template_id)
+        if call_kind is not None:
+            conditions.append("call_kind = ?")
+            params.append(call_kind)
+        if document_class is not None:
+            conditions.append("document_class = ?")
+            params.append(document_class)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with connect(self.db_path) as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        outcomes: Dict[tuple, List[tuple]] = {}
+        for row_template, row_kind, row_class, model, success, latency in rows:
+            outcomes.setdefault((f"{row_template}:{row_kind}:{row_class}", model), []).append((success, latency))
+
+        stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (key, model), results in outcomes.items():
+            latencies = [latency for success, latency in results if success]
+            stats.setdefault(key, {})[model] = {
+                "samples": len(results),
+                "success_rate": round(sum(success for success, _ in results) / len(results), 4),
+                "latency_p50": _percentile(latencies, 50),
+                f"latency_p{LLM_ROUTER_LATENCY_PERCENTILE:g}": _percentile(latencies, LLM_ROUTER_LATENCY_PERCENTILE)
+            }
+        return stats
+
+    def decision_counts(self) -> Dict[str, int]:
+        with connect(self.db_path) as conn:
+            return dict(conn.execute("SELECT reason, COUNT(*) FROM decisions GROUP BY reason").fetchall())
+
+
+class ModelRouter:
+    """
+    Chooses which model to try first for each request.
+
+    Models keep their priority order as the fallback chain; the router only
+    picks the head. In order of precedence: a per-request override, a
+    per-template override (LLM_ROUTER_TEMPLATE_MODELS), then the cheapest
+    model that has proven itself on this template, kind of call and document
+    class (enough samples, success rate and latency percentile within
+    limits). Any other model that lacks samples is occasionally tried first
+    instead, to learn about it. Every decision is logged and stored with the
+    document features.
+    """
+
+    def __init__(self, models: List[Dict[str, Any]], store: Optional[ModelStatsStore] = None):
+        self.models = models
+        self.store = store
+        self.template_models = parse_template_models(LLM_ROUTER_TEMPLATE_MODELS)
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def route(self, template_id: int, features: DocumentFeatures, call_kind: str = "document",
+              override: Optional[str] = None) -> RouteDecision:
+        document_class = features.document_class
+        first, reason = None, "priority"
+
+        if override:
+            first, reason = override, "request override"
+        elif template_id in self.template_models:
+            first, reason = self.template_models[template_id], "template override"
+        elif LLM_ROUTING and self.store:
+            first, reason = self._choose(template_id, call_kind, document_class)
+
+        names = [model_config["name"] for model_config in self.models]
+        if first and first not in names:
+            logger.warning(f"⚠️ Unknown model {first!r} ({reason}), using priority order")
+            first, reason = None, "priority"
+
+        models = list(self.models)
+        if first:
+            models.sort(key=lambda model_config: model_config["name"] != first)
+
+        decision = RouteDecision(template_id, document_class, call_kind, models, reason)
+        model_names = [model_config["name"] for model_config in models]
+        if self.store:
+            try:
+                decision.decision_id = self.store.record_decision(template_id, call_kind, document_class,
+                                                                  features.to_dict(), model_names, reason)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not store routing decision: {e}")
+        logger.info(f"🧭 Routed template {template_id} {call_kind} calls ({document_class}, {features.pages} pages, "
+                    f"{features.tokens} tokens, {features.tables} tables) to {model_names[0]}: {reason}")
+        return decision
+
+    def record(self, decision: RouteDecision, model: str, call_kind: str, success: bool, latency: float):
+        """Store one finished model attempt of a call_kind call made under decision; blocking"""
+        if not self.store:
+            return
+        try:
+            self.store.record_outcome(decision.decision_id, model, decision.template_id, call_kind,
+                                      decision.document_class, success, latency)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not store model outcome: {e}")
+
+    def _choose(self, template_id: int, call_kind: str, document_class: str) -> tuple:
+        """The head model from observed statistics, and the reason"""
+        key = f"{template_id}:{call_kind}:{document_class}"
+        try:
+            stats = self.store.model_stats(template_id, call_kind, document_class).get(key, {})
+        except Exception as e:
+            logger.warning(f"⚠️ Model statistics unavailable: {e}")
+            return None, "priority"
+
+        latency_key = f"latency_p{LLM_ROUTER_LATENCY_PERCENTILE:g}"
+        proven = [
+            model_config for model_config in self.models
+            if stats.get(model_config["name"], {}).get("samples", 0) >= LLM_ROUTER_MIN_SAMPLES
+            and stats[model_config["name"]]["success_rate"] >= LLM_ROUTER_MIN_SUCCESS_RATE
+            and (stats[model_config["name"]][latency_key] or 0) <= LLM_ROUTER_MAX_LATENCY
+        ]
+        best = min(proven, key=lambda model_config: (
+            model_config.get("cost", 0), stats[model_config["name"]][latency_key] or 0
+        )) if proven else None
+
+        # Any model other than the one that would go first may lack samples, the priority head included
+        head = best or self.models[0]
+        untried = [
+            model_config for model_config in self.models
+            if model_config is not head
+            and stats.get(model_config["name"], {}).get("samples", 0) < LLM_ROUTER_MIN_SAMPLES
+        ]
+        with self._lock:
+            explore = untried and self._random.random() < LLM_ROUTER_EXPLORE_RATE
+        if explore:
+            least_sampled = min(untried, key=lambda model_config: stats.get(model_config["name"], {}).get("samples", 0))
+            return least_sampled["name"], "explore"
+
+        if best:
+            model_stats = stats[best["name"]]
+            logger.debug(f"{best['name']} on {key}: {model_stats['success_rate']:.0%} valid, "
+                         f"p{LLM_ROUTER_LATENCY_PERCENTILE:g} {model_stats[latency_key] or 0:.1f}s "
+                         f"over {model_stats['samples']} calls")
+            return best["name"], "statistics"
+
+        return None, "priority"
+
+    def get_statistics(self) -> Dict[str, Any]:
+        if not self.store:
+            return {"enabled": LLM_ROUTING, "persistent": False}
+        try:
+            return {
+                "enabled": LLM_ROUTING,
+                "persistent": True,
+                "template_overrides": self.template_models,
+                "decisions": self.store.decision_counts(),
+                "models": self.store.model_stats()
+            }
+        except Exception as e:
+            return {"enabled": LLM_ROUTING, "persistent": True, "error": str(e)}
+
+
+def create_model_stats_store() -> Optional[ModelStatsStore]:
+    """Stats store in LLM_ROUTER_DIR, or None when it cannot be opened (routing then falls back to priority order)"""
+    try:
+        return ModelStatsStore()
+    except Exception as e:
+        logger.warning(f"⚠️ Model statistics store unavailable: {e}")
+        return None
@@ -0,0 +1,155 @@
+# page_router.py
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.page_selector import split_pages
+from app.services.text_chunker import TextChunker, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+# Schema words that say nothing about where a section's data lives
+QUERY_STOPWORDS = {
+    "and", "of", "or", "the", "to", "string", "number", "null", "name", "date", "type",
+    "total", "other", "details", "information", "percentage", "value", "values", "id"
+}
+
+# Words documents use for a section that its field names do not contain
+SECTION_KEYWORDS = {
+    "Fund_and_Investment_Vehicle_Information": ["fund", "vintage", "domicile", "commitments", "closing", "fee"],
+    "Fund_Manager": ["manager", "general", "partner", "gp", "contact", "address", "website"],
+    "Fund_Investment_Vehicle_Financial_Position": ["nav", "irr", "tvpi", "dpi", "contributions", "distributions"],
+    "LP_Investor_Cashflows": ["capital", "call", "contribution", "distribution", "investor", "lp"],
+    "Fund_Companies": ["portfolio", "company", "companies", "sector", "industry"],
+    "Initial_Investments": ["initial", "investment", "acquired", "acquisition", "instrument"],
+    "Company_Investment_Positions": ["cost", "fair", "unrealized", "realized", "invested"],
+    "Company_Valuation": ["valuation", "enterprise", "equity", "multiple", "ownership"],
+    "Company_Financials": ["revenue", "ebitda", "ltm", "debt", "cash"],
+    "Investment_History": ["follow", "exit", "sale", "transaction", "proceeds"],
+    "Executive_Portfolio_Summary": ["summary", "overview", "highlights", "performance", "aum"],
+    "Schedule_of_Investments": ["schedule", "investments", "cost", "fair", "value", "security", "shares"],
+    "Statement_of_Operations": ["operations", "income", "expenses", "fees", "gains", "losses"],
+    "Statements_of_Cashflows": ["cash", "flows", "operating", "financing", "activities"],
+    "PCAP_Statements": ["partners", "capital", "account", "pcap", "beginning", "ending", "nav"],
+    "Portfolio_Companies_Profile": ["company", "description", "business", "headquarters", "founded"],
+    "Portfolio_Companies_Financials": ["revenue", "ebitda", "margin", "growth", "debt"],
+    "FootNotes": ["notes", "note", "organization", "accounting", "policies", "valuation"],
+    "Reference_Values": ["currency", "country", "industry"]
+}
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of pages, built once and queried per section"""
+
+    def __init__(self, documents: List[str]):
+        self.term_counts = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        document_frequency: Counter = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query_terms: List[str]) -> List[float]:
+        """BM25 score of every page for the query"""
+        terms = [term for term in set(query_terms) if term in self.idf]
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.average_length) if self.average_length else BM25_K1
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            results.append(score)
+        return results
+
+
+def section_query(section_name: str, section_schema: Any) -> List[str]:
+    """Query terms for a schema section: its name, its field names and its known keywords"""
+    words = tokenize(section_name.replace("_", " "))
+    words.extend(SECTION_KEYWORDS.get(section_name, []))
+
+    def collect(node: Any):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                words.extend(tokenize(key.replace("_", " ")))
+                collect(value)
+        elif isinstance(node, list):
+            for item in node:
+                collect(item)
+
+    collect(section_schema)
+    return [word for word in words if word not in QUERY_STOPWORDS and len(word) > 1]
+
+
+class PageRouter:
+    """
+    Routes the pages of the job's documents to each schema section.
+
+    Pages are indexed once with BM25; each section's query picks its best pages
+    up to a token budget, returned in document order.
+    """
+
+    def __init__(self, extracted_texts: List[Dict[str, Any]]):
+        self.pages: List[Tuple[Dict[str, Any], Optional[int], str]] = []
+        for text_data in extracted_texts:
+            for page_number, page_text in split_pages(text_data.get("text", "")):
+                if page_text.strip():
+                    self.pages.append((text_data, page_number, page_text))
+
+        self.page_tokens = [estimate_tokens(page_text) for _, _, page_text in self.pages]
+        self.index = BM25Index([page_text for _, _, page_text in self.pages])
+
+    def route(self, section_name: str, section_schema: Any, budget_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """Text of the section's best pages within budget_tokens, and which pages they were"""
+        scores = self.index.scores(section_query(section_name, section_schema))
+        ranked = sorted(range(len(self.pages)), key=lambda i: (-scores[i], i))
+
+        # With no matching page at all, fall back to the start of the documents
+        matched = any(scores)
+        if not matched:
+            ranked = list(range(len(self.pages)))
+
+        chosen = []
+        remaining = budget_tokens
+        for i in ranked:
+            if matched and scores[i] <= 0:
+                break
+            if self.page_tokens[i] <= remaining:
+                chosen.append(i)
+                remaining -= self.page_tokens[i]
+
+        chosen.sort()
+        routed = [
+            {"file": self.pages[i][0].get("filename"), "page": self.pages[i][1], "score": round(scores[i], 2)}
+            for i in chosen
+        ]
+        text = "\n\n".join(self.pages[i][2].strip() for i in chosen)
+
+        # The best page alone is over budget: send as much of it as fits
+        if not chosen and ranked:
+            best = ranked[0]
+            text = TextChunker(budget_tokens).split(self.pages[best][2])[0]
+            routed = [{"file": self.pages[best][0].get("filename"), "page": self.pages[best][1],
+                       "score": round(scores[best], 2), "truncated": True}]
+
+        return text, routed
@@ -0,0 +1,143 @@
+# page_selector.py
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.text_chunker import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Page header written by PDFExtractor._clean_text
+PAGE_HEADER_PATTERN = re.compile(r"===== Page (\d+) =====")
+
+# Phrases typical of disclaimer, legal and navigation pages
+BOILERPLATE_MARKERS = [
+    "forward-looking statements",
+    "forward looking statements",
+    "disclaimer",
+    "not an offer to sell",
+    "solicitation of an offer",
+    "past performance is not",
+    "strictly confidential",
+    "for informational purposes only",
+    "this document is confidential",
+    "all rights reserved",
+    "table of contents",
+    "privacy notice",
+    "terms of use",
+    "important notice",
+    "does not constitute"
+]
+
+# A page this low on financial content with this many markers is boilerplate
+BOILERPLATE_MAX_SCORE = 5
+BOILERPLATE_MIN_MARKERS = 2
+
+
+def split_pages(text: str) -> List[Tuple[Optional[int], str]]:
+    """Split extracted text into (page_number, page_text) on the page headers"""
+    starts = [match.start() for match in PAGE_HEADER_PATTERN.finditer(text)]
+    if not starts:
+        return [(None, text)]
+
+    pages = []
+    if text[:starts[0]].strip():
+        pages.append((None, text[:starts[0]]))
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        page_text = text[start:end]
+        pages.append((int(PAGE_HEADER_PATTERN.match(page_text).group(1)), page_text))
+    return pages
+
+
+def is_boilerplate(page_text: str, financial_score: int) -> bool:
+    """Disclaimer/legal/contents page with little financial content"""
+    if financial_score > BOILERPLATE_MAX_SCORE:
+        return False
+    text_lower = page_text.lower()
+    return sum(1 for marker in BOILERPLATE_MARKERS if marker in text_lower) >= BOILERPLATE_MIN_MARKERS
+
+
+def select_pages(extracted_texts: List[Dict[str, Any]], budget_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Keep the most relevant pages of each document within budget_tokens (estimated).
+
+    Boilerplate pages are always dropped. If the rest does not fit, pages are
+    ranked by financial_content_score (the first page of each document is kept
+    first, since it usually names the fund) and packed greedily. Selected pages
+    keep their document order. Returns the reduced texts and a report of what
+    was dropped.
+    """
+    candidates = []
+    documents = []
+    for doc_index, text_data in enumerate(extracted_texts):
+        page_scores = text_data.get("page_scores") or []
+        pages = split_pages(text_data.get("text", ""))
+        documents.append(pages)
+
+        for position, (page_number, page_text) in enumerate(pages):
+            score = 0
+            if page_number is not None and 0 < page_number <= len(page_scores):
+                score = page_scores[page_number - 1] or 0
+            candidates.append({
+                "doc": doc_index,
+                "position": position,
+                "page_number": page_number,
+                "size": estimate_tokens(page_text),
+                "score": score,
+                "first": position == 0,
+                "boilerplate": page_number is not None and is_boilerplate(page_text, score)
+            })
+
+    kept = [c for c in candidates if not c["boilerplate"]]
+    total_size = sum(c["size"] for c in kept)
+
+    if total_size > budget_tokens:
+        # Text without page headers cannot be ranked and is always kept
+        selected = [c for c in kept if c["page_number"] is None]
+        remaining = budget_tokens - sum(c["size"] for c in selected)
+        ranked = sorted(
+            (c for c in kept if c["page_number"] is not None),
+            key=lambda c: (not c["first"], -c["score"], c["doc"], c["position"])
+        )
+        for candidate in ranked:
+            if candidate["size"] <= remaining:
+                selected.append(candidate)
+                remaining -= candidate["size"]
+    else:
+        selected = kept
+
+    chosen = {(c["doc"], c["position"]) for c in selected}
+    selected_texts = []
+    for doc_index, (text_data, pages) in enumerate(zip(extracted_texts, documents)):
+        text = "".join(page_text for position, (_, page_text) in enumerate(pages) if (doc_index, position) in chosen)
+        selected_texts.append({**text_data, "text": text.strip()})
+
+    report = {
+        "budget_tokens": budget_tokens,
+        "pages_total": len(candidates),
+        "pages_selected": len(selected),
+        "tokens_selected": sum(c["size"] for c in selected),
+        "boilerplate_pages": _pages_by_document(extracted_texts, [c for c in candidates if c["boilerplate"]]),
+        "dropped_pages": _pages_by_document(
+            extracted_texts,
+            [c for c in candidates if (c["doc"], c["position"]) not in chosen]
+        )
+    }
+
+    if report["pages_selected"] < report["pages_total"]:
+        logger.info(f"📑 Selected {report['pages_selected']}/{report['pages_total']} pages "
+                    f"({report['tokens_selected']} of {budget_tokens} budget tokens)")
+
+    return [text_data for text_data in selected_texts if text_data["text"]], report
+
+
+def _pages_by_document(extracted_texts: List[Dict[str, Any]], candidates: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """Page numbers grouped by file name"""
+    grouped: Dict[str, List[int]] = {}
+    for candidate in candidates:
+        if candidate["page_number"] is None:
+            continue
+        name = extracted_texts[candidate["doc"]].get("filename") or f"document_{candidate['doc'] + 1}"
+        grouped.setdefault(name, []).append(candidate["page_number"])
+    return {name: sorted(pages) for name, pages in grouped.items()}
@@ -1,15 +1,34 @@
 # pdf_extractor.py
 import pdfplumber
 import logging
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import os
 import re
 from datetime import datetime
+from app.services.pdf_text_engines import (
+    TextEngineSelector, ENGINE_AUTO, ENGINE_PDFIUM, SELECTION_DOCUMENT, summarize_engines
+)
+from app.services.extraction_cache import ExtractionCache, get_extraction_cache
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever extraction output changes so cached results are not reused
+EXTRACTOR_VERSION = "2.2.1"
+
+# Text engine selection: "auto" uses pdfium for pages without table rulings,
+# "pdfplumber" or "pdfium" force one engine. Selection is per "page" or per "document".
+PDF_TEXT_ENGINE = os.getenv("PDF_TEXT_ENGINE", "auto")
+PDF_ENGINE_SELECTION = os.getenv("PDF_ENGINE_SELECTION", "page")
+PDF_RULING_THRESHOLD = int(os.getenv("PDF_RULING_THRESHOLD", "10"))
+
 class PDFExtractor:
-    def __init__(self):
+    def __init__(self, text_engine: Optional[str] = None, engine_selection: Optional[str] = None,
+                 ruling_threshold: Optional[int] = None, cache: Optional[ExtractionCache] = None,
+                 use_cache: bool = True):
+        self.text_engine = text_engine or PDF_TEXT_ENGINE
+        self.engine_selection = engine_selection or PDF_ENGINE_SELECTION
+        self.ruling_threshold = ruling_threshold if ruling_threshold is not None else PDF_RULING_THRESHOLD
+        self.cache = (cache or get_extraction_cache()) if use_cache else None
         self.financial_keywords = [
             'financial', 'statement', 'balance', 'income', 'cash flow', 'revenue',
             'ebitda', 'nav', 'irr', 'multiple', 'commitment', 'investment',
@@ -30,56 +49,19 @@ class PDFExtractor:
                 logger.error(error_msg)
                 return self._create_error_response(file_path, error_msg)
             
-            text_content = ""
-            metadata = {}
-            page_count = 0
-            char_count = 0
-            financial_content_score = 0
-            
-            with pdfplumber.open(file_path) as pdf:
-                # Extract metadata
-                metadata = pdf.metadata or {}
-                page_count = len(pdf.pages)
-                
-                logger.info(f"📖 Processing {page_count} pages from {file_path}")
-                
-                # Extract text from each page with financial content detection
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        page_text = self._extract_page_text(page, page_num + 1)
-                        if page_text:
-                            text_content += page_text
-                            char_count += len(page_text)
-                            
-                            # Score page for financial content
-                            page_score = self._score_financial_content(page_text)
-                            financial_content_score += page_score
-                            
-                            logger.debug(f"✅ Extracted {len(page_text)} chars from page {page_num + 1} (score: {page_score})")
-                        else:
-                            logger.warning(f"⚠️ No text extracted from page {page_num + 1}")
-                    except Exception as page_error:
-                        logger.warning(f"⚠️ Error extracting text from page {page_num + 1}: {page_error}")
-                        continue
-            
-            # Extract tables separately for financial data
-            tables_data = self._extract_tables(file_path)
+            # A cache hit skips PDF parsing entirely
+            cache_key = self._cache_key(file_path)
+            cached = self._load_from_cache(file_path, cache_key)
+            if cached:
+                return cached
             
-            result = {
-                "file_path": file_path,
-                "metadata": metadata,
-                "text": text_content.strip(),
-                "page_count": page_count,
-                "char_count": char_count,
-                "financial_content_score": financial_content_score,
-                "tables": tables_data,
-                "status": "success",
-                "extraction_timestamp": datetime.now().isoformat()
-            }
+            walk = self._walk_pages(file_path)
+            result = self._build_text_result(file_path, walk["metadata"], walk["page_count"], walk["pages"])
+            self._store_in_cache(cache_key, result)
             
-            logger.info(f"✅ Successfully extracted {char_count} characters from {page_count} pages")
-            logger.info(f"💰 Financial content score: {financial_content_score}")
-            logger.info(f"📊 Tables extracted: {len(tables_data)}")
+            logger.info(f"✅ Successfully extracted {result['char_count']} characters from {result['page_count']} pages")
+            logger.info(f"💰 Financial content score: {result['financial_content_score']}")
+            logger.info(f"📊 Tables extracted: {len(result['tables'])}")
             
             return result
             
@@ -90,11 +72,247 @@ class PDFExtractor:
             logger.error(f"Stack trace: {traceback.format_exc()}")
             
             return self._create_error_response(file_path, error_msg)
-    
-    def _extract_page_text(self, page, page_num: int) -> str:
-        """Extract and clean text from a single page"""
+
+    def get_cached_result(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Cached extract_text result for this file, if any"""
+        return self._load_from_cache(file_path, self._cache_key(file_path))
+
+    def cache_result(self, file_path: str, result: Dict[str, Any]):
+        """Store an extract_text result, e.g. one merged from page-range shards"""
+        if result.get("status") == "success":
+            self._store_in_cache(self._cache_key(file_path), result)
+
+    def _cache_key(self, file_path: str) -> Optional[str]:
+        """Content-addressed cache key, or None when caching is off"""
+        if self.cache is None:
+            return None
+        
+        try:
+            return self.cache.make_key(file_path, EXTRACTOR_VERSION, {
+                "text_engine": self.text_engine,
+                "engine_selection": self.engine_selection,
+                "ruling_threshold": self.ruling_threshold
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Could not compute extraction cache key: {e}")
+            return None
+
+    def _load_from_cache(self, file_path: str, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not cache_key:
+            return None
+        
+        try:
+            cached = self.cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"⚠️ Extraction cache lookup failed: {e}")
+            return None
+        
+        if cached:
+            cached["file_path"] = file_path
+            cached["cache_hit"] = True
+            logger.info(f"💾 Extraction cache hit for {file_path} ({cached.get('page_count', 0)} pages)")
+        return cached
+
+    def _store_in_cache(self, cache_key: Optional[str], result: Dict[str, Any]):
+        if not cache_key:
+            return
+        
+        try:
+            self.cache.put(cache_key, result)
+        except Exception as e:
+            logger.warning(f"⚠️ Extraction cache store failed: {e}")
+
+    def get_page_count(self, file_path: str) -> int:
+        """Get the number of pages without extracting any content"""
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+
+    def select_document_engine(self, file_path: str) -> Optional[str]:
+        """
+        The text engine for the whole document when engines are selected per
+        document, so page-range shards share one selection; None otherwise
+        """
+        if self.text_engine != ENGINE_AUTO or self.engine_selection != SELECTION_DOCUMENT:
+            return None
+        with TextEngineSelector(file_path, self.text_engine, self.engine_selection, self.ruling_threshold) as engines:
+            return engines.document_engine
+
+    def extract_page_range(self, file_path: str, start_page: int, end_page: int,
+                           document_engine: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Extract text, financial score and tables for pages start_page..end_page-1 (0-based).
+        Used to shard one large PDF across several workers; document_engine is the
+        select_document_engine result, computed once for all shards.
+        """
+        logger.info(f"📄 Extracting pages {start_page + 1}-{end_page} from: {file_path}")
+        
+        walk = self._walk_pages(file_path, start_page, end_page, document_engine)
+        
+        # Raw text is only needed by extract_with_layout; keep the shard payload small
+        for page in walk["pages"]:
+            page.pop("raw_text", None)
+        
+        return {
+            "file_path": file_path,
+            **walk,
+            "status": "success"
+        }
+
+    def merge_page_results(self, file_path: str, shard_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge page-range shards back into the extract_text result format, in page order
+        """
+        shards = sorted(shard_results, key=lambda shard: shard["start_page"])
+        pages = [page for shard in shards for page in shard["pages"]]
+        
+        result = self._build_text_result(
+            file_path,
+            shards[0]["metadata"] if shards else {},
+            shards[0]["page_count"] if shards else 0,
+            pages
+        )
+        result["shard_count"] = len(shards)
+        
+        logger.info(f"✅ Merged {len(shards)} shards: {result['char_count']} characters from {result['page_count']} pages")
+        
+        return result
+
+    def _walk_pages(self, file_path: str, start_page: int = 0, end_page: Optional[int] = None,
+                    document_engine: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Single pass over the document: open it once and compute text, financial score
+        and tables for each page from the same parsed page object
+        """
+        pages = []
+        
+        with pdfplumber.open(file_path) as pdf, TextEngineSelector(
+            file_path, self.text_engine, self.engine_selection, self.ruling_threshold, document_engine
+        ) as engines:
+            metadata = pdf.metadata or {}
+            page_count = len(pdf.pages)
+            end_page = page_count if end_page is None else min(end_page, page_count)
+            
+            logger.info(f"📖 Processing pages {start_page + 1}-{end_page} of {page_count} from {file_path}")
+            
+            for page_num in range(start_page, end_page):
+                page = pdf.pages[page_num]
+                try:
+                    pages.append(self._process_page(page, page_num + 1, engines))
+                finally:
+                    # Release the page's cached layout objects as soon as it is done
+                    page.close()
+        
+        return {
+            "metadata": metadata,
+            "page_count": page_count,
+            "start_page": start_page,
+            "end_page": end_page,
+            "pages": pages
+        }
+
+    def _process_page(self, page, page_num: int, engines: TextEngineSelector) -> Dict[str, Any]:
+        """Compute text, financial score and tables for a single parsed page"""
+        engine = engines.select(page_num - 1)
+        page_data = {
+            "page_number": page_num,
+            "engine": engine,
+            "raw_text": "",
+            "text": "",
+            "financial_score": 0,
+            "tables": []
+        }
+        
+        try:
+            if engine == ENGINE_PDFIUM:
+                page_data["raw_text"] = engines.extract_text(page_num - 1)
+            else:
+                page_data["raw_text"] = page.extract_text() or ""
+            page_text = self._extract_page_text(page_data["raw_text"], page_num)
+            if page_text:
+                page_data["text"] = page_text
+                page_data["financial_score"] = self._score_financial_content(page_text)
+                logger.debug(f"✅ Extracted {len(page_text)} chars from page {page_num} (score: {page_data['financial_score']})")
+            else:
+                logger.warning(f"⚠️ No text extracted from page {page_num}")
+        except Exception as page_error:
+            logger.warning(f"⚠️ Error extracting text from page {page_num}: {page_error}")
+        
+        # Without rulings pdfplumber cannot find tables, so skip its layout analysis
+        if not engines.needs_table_detection(page_num - 1):
+            return page_data
+        
+        try:
+            for table_num, table in enumerate(page.extract_tables() or []):
+                if not table or not any(any(cell for cell in row) for row in table):
+                    continue
+                
+                is_financial = self._is_financial_table(table)
+                page_data["tables"].append({
+                    "page": page_num,
+                    "table_number": table_num + 1,
+                    "data": table,
+                    "rows": len(table),
+                    "columns": len(table[0]) if table else 0,
+                    "is_financial": is_financial,
+                    "financial_score": self._score_table_financial_content(table) if is_financial else 0
+                })
+                if is_financial:
+                    logger.debug(f"📊 Found financial table {table_num + 1} on page {page_num}")
+        except Exception as table_error:
+            logger.warning(f"Error extracting tables from page {page_num}: {table_error}")
+        
+        return page_data
+
+    def _build_text_result(self, file_path: str, metadata: Dict[str, Any], page_count: int,
+                           pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Aggregate per-page results into the extract_text result dict"""
+        return {
+            "file_path": file_path,
+            "metadata": metadata,
+            "text": "".join(page["text"] for page in pages).strip(),
+            "page_count": page_count,
+            "char_count": sum(len(page["text"]) for page in pages),
+            "financial_content_score": sum(page["financial_score"] for page in pages),
+            "page_scores": [page["financial_score"] for page in pages],
+            "tables": self._financial_tables(pages),
+            "page_engines": [page["engine"] for page in pages],
+            "text_engines": summarize_engines([page["engine"] for page in pages]),
+            "status": "success",
+            "extraction_timestamp": datetime.now().isoformat()
+        }
+
+    def _financial_tables(self, pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Financial tables across pages, in the format returned by extract_text.
+
+        A table continued on the next page usually has no header row to match,
+        so a table right after a kept one with the same column count is kept too.
+        """
+        tables = []
+        previous = None
+        for page in pages:
+            for table in page["tables"]:
+                continues = (
+                    previous is not None
+                    and table["columns"] == previous["columns"]
+                    and table["page"] - previous["page"] in (0, 1)
+                )
+                if not table["is_financial"] and not continues:
+                    previous = None
+                    continue
+                tables.append({
+                    "page": table["page"],
+                    "table_number": table["table_number"],
+                    "data": table["data"],
+                    "rows": table["rows"],
+                    "financial_score": table["financial_score"]
+                })
+                previous = table
+        return tables
+
+    def _extract_page_text(self, text: str, page_num: int) -> str:
+        """Clean the raw text of a single page"""
         try:
-            text = page.extract_text()
             if not text or not text.strip():
                 return ""
             
@@ -172,33 +390,11 @@ class PDFExtractor:
 
     def _extract_tables(self, file_path: str) -> List[Dict[str, Any]]:
         """Extract tables from PDF with financial data optimization"""
-        tables_data = []
-        
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        tables = page.extract_tables()
-                        if tables:
-                            for table_num, table in enumerate(tables):
-                                if self._is_financial_table(table):
-                                    table_data = {
-                                        "page": page_num + 1,
-                                        "table_number": table_num + 1,
-                                        "data": table,
-                                        "rows": len(table),
-                                        "financial_score": self._score_table_financial_content(table)
-                                    }
-                                    tables_data.append(table_data)
-                                    logger.debug(f"📊 Found financial table {table_num + 1} on page {page_num + 1}")
-                    except Exception as table_error:
-                        logger.warning(f"Error extracting tables from page {page_num + 1}: {table_error}")
-                        continue
-            
+            return self._financial_tables(self._walk_pages(file_path)["pages"])
         except Exception as e:
             logger.warning(f"Error during table extraction: {e}")
-        
-        return tables_data
+            return []
 
     def _is_financial_table(self, table: List[List[str]]) -> bool:
         """Check if table contains financial data"""
@@ -262,61 +458,46 @@ class PDFExtractor:
                 "extraction_timestamp": datetime.now().isoformat()
             }
             
-            table_count = 0
-            financial_table_count = 0
-            
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    page_data = {
-                        "page_number": page_num + 1,
-                        "text": page.extract_text() or "",
-                        "tables": [],
-                        "financial_tables": []
+            for page in self._walk_pages(file_path)["pages"]:
+                page_data = {
+                    "page_number": page["page_number"],
+                    "engine": page["engine"],
+                    "text": page["raw_text"],
+                    "tables": [],
+                    "financial_tables": []
+                }
+                
+                for table in page["tables"]:
+                    table_data = {
+                        "table_number": table["table_number"],
+                        "data": table["data"],
+                        "rows": table["rows"],
+                        "columns": table["columns"]
                     }
                     
-                    # Extract tables with enhanced detection
-                    try:
-                        tables = page.extract_tables()
-                        for table_num, table in enumerate(tables):
-                            if table and any(any(cell for cell in row) for row in table):
-                                table_data = {
-                                    "table_number": table_num + 1,
-                                    "data": table,
-                                    "rows": len(table),
-                                    "columns": len(table[0]) if table else 0
-                                }
-                                
-                                page_data["tables"].append(table_data)
-                                result["tables"].append({
-                                    "page": page_num + 1,
-                                    "table_number": table_num + 1,
-                                    "data": table
-                                })
-                                table_count += 1
-                                
-                                # Check if it's a financial table
-                                if self._is_financial_table(table):
-                                    financial_score = self._score_table_financial_content(table)
-                                    financial_table_data = {
-                                        **table_data,
-                                        "financial_score": financial_score
-                                    }
-                                    page_data["financial_tables"].append(financial_table_data)
-                                    result["financial_tables"].append(financial_table_data)
-                                    financial_table_count += 1
-                                    logger.debug(f"💰 Found financial table {table_num + 1} on page {page_num + 1} (score: {financial_score})")
-                                
-                                logger.debug(f"📊 Found table {table_num + 1} on page {page_num + 1}")
-                    except Exception as table_error:
-                        logger.warning(f"⚠️ Error extracting tables from page {page_num + 1}: {table_error}")
+                    page_data["tables"].append(table_data)
+                    result["tables"].append({
+                        "page": table["page"],
+                        "table_number": table["table_number"],
+                        "data": table["data"]
+                    })
                     
-                    result["pages"].append(page_data)
+                    # Check if it's a financial table
+                    if table["is_financial"]:
+                        financial_table_data = {
+                            **table_data,
+                            "financial_score": table["financial_score"]
+                        }
+                        page_data["financial_tables"].append(financial_table_data)
+                        result["financial_tables"].append(financial_table_data)
+                
+                result["pages"].append(page_data)
             
-            result["table_count"] = table_count
-            result["financial_table_count"] = financial_table_count
+            result["table_count"] = len(result["tables"])
+            result["financial_table_count"] = len(result["financial_tables"])
             result["page_count"] = len(result["pages"])
             
-            logger.info(f"✅ Enhanced layout extraction completed: {table_count} total tables, {financial_table_count} financial tables across {len(result['pages'])} pages")
+            logger.info(f"✅ Enhanced layout extraction completed: {result['table_count']} total tables, {result['financial_table_count']} financial tables across {len(result['pages'])} pages")
             
             return result
             
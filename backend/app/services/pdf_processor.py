@@ -6,6 +6,8 @@ import pdfplumber
 import PyPDF2
 from pathlib import Path
 
+from app.services.text_chunker import TextChunker
+
 logger = logging.getLogger(__name__)
 
 class PDFProcessor:
@@ -117,29 +119,10 @@ class PDFProcessor:
         
         return indicator_count >= 2
     
-    def _split_text(self, text: str, max_chunk_size: int = 10000) -> List[str]:
-        """Split text into manageable chunks"""
-        if len(text) <= max_chunk_size:
-            return [text]
-        
-        chunks = []
-        current_chunk = ""
-        
-        # Split by paragraphs first
-        paragraphs = text.split('\n\n')
-        
-        for paragraph in paragraphs:
-            if len(current_chunk) + len(paragraph) <= max_chunk_size:
-                current_chunk += paragraph + "\n\n"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = paragraph + "\n\n"
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+    def _split_text(self, text: str, max_chunk_tokens: int = 2500, overlap_tokens: int = 0) -> List[str]:
+        """Split text into manageable chunks on page and paragraph boundaries"""
+        chunks = TextChunker(max_chunk_tokens, overlap_tokens).split(text)
+        return chunks or [text]
     
     def get_pdf_info(self, file_path: str) -> Dict[str, Any]:
         """Get basic information about PDF"""
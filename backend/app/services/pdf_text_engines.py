@@ -0,0 +1,136 @@
+# pdf_text_engines.py
+import logging
+from typing import Dict, List, Optional
+
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    pdfium = None
+    pdfium_c = None
+    PDFIUM_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ENGINE_PDFPLUMBER = "pdfplumber"
+ENGINE_PDFIUM = "pdfium"
+ENGINE_AUTO = "auto"
+
+SELECTION_PAGE = "page"
+SELECTION_DOCUMENT = "document"
+
+
+class TextEngineSelector:
+    """
+    Chooses the text engine for each page of a document.
+
+    pdfium extracts text natively and is much faster than pdfplumber/pdfminer,
+    but has no table detection. pdfplumber's default table finder only works from
+    ruling lines, so a page without vector rulings cannot yield tables and is safe
+    to hand to pdfium. Pages with rulings stay on pdfplumber so text and table
+    cells come from the same layout analysis.
+
+    With document granularity the whole document is scanned for rulings once;
+    page-range shards of the same document pass in that document_engine
+    instead of rescanning every page.
+    """
+
+    def __init__(self, file_path: str, policy: str = ENGINE_AUTO,
+                 granularity: str = SELECTION_PAGE, ruling_threshold: int = 10,
+                 document_engine: Optional[str] = None):
+        self.file_path = file_path
+        self.policy = policy
+        self.granularity = granularity
+        self.ruling_threshold = ruling_threshold
+        self._pdf = None
+        self._rulings: Dict[int, bool] = {}
+
+        if policy not in (ENGINE_AUTO, ENGINE_PDFIUM, ENGINE_PDFPLUMBER):
+            raise ValueError(f"Unknown text engine policy: {policy}")
+
+        if policy != ENGINE_PDFPLUMBER:
+            if PDFIUM_AVAILABLE:
+                self._pdf = pdfium.PdfDocument(file_path)
+            else:
+                logger.warning("⚠️ pypdfium2 not installed, falling back to pdfplumber text extraction")
+                self.policy = ENGINE_PDFPLUMBER
+
+        self._document_engine = None
+        if self.policy == ENGINE_AUTO and granularity == SELECTION_DOCUMENT:
+            if document_engine:
+                self._document_engine = document_engine
+            else:
+                any_rulings = any(self.has_rulings(index) for index in range(len(self._pdf)))
+                self._document_engine = ENGINE_PDFPLUMBER if any_rulings else ENGINE_PDFIUM
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the pdfium document"""
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+    @property
+    def document_engine(self) -> Optional[str]:
+        """The engine chosen for the whole document, with auto policy and document granularity"""
+        return self._document_engine
+
+    def select(self, page_index: int) -> str:
+        """Engine to use for the text of a page (0-based index)"""
+        if self.policy != ENGINE_AUTO:
+            return self.policy
+        if self._document_engine:
+            return self._document_engine
+        return ENGINE_PDFPLUMBER if self.has_rulings(page_index) else ENGINE_PDFIUM
+
+    def needs_table_detection(self, page_index: int) -> bool:
+        """Whether pdfplumber table detection can find anything on this page"""
+        if self._pdf is None:
+            return True
+        return self.has_rulings(page_index)
+
+    def has_rulings(self, page_index: int) -> bool:
+        """Whether the page draws enough vector path segments to form a table grid"""
+        if self._pdf is None:
+            return True
+
+        if page_index not in self._rulings:
+            page = self._pdf[page_index]
+            try:
+                segments = sum(
+                    pdfium_c.FPDFPath_CountSegments(obj.raw)
+                    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_PATH,))
+                )
+            finally:
+                page.close()
+            self._rulings[page_index] = segments >= self.ruling_threshold
+
+        return self._rulings[page_index]
+
+    def extract_text(self, page_index: int) -> str:
+        """Extract the raw text of a page with pdfium"""
+        page = self._pdf[page_index]
+        textpage = page.get_textpage()
+        try:
+            text = textpage.get_text_range()
+        finally:
+            textpage.close()
+            page.close()
+
+        # pdfium uses CRLF line breaks and marks soft hyphens with control characters
+        return text.replace("\r\n", "\n").replace("\x02", "").replace("\ufffe", "")
+
+
+def summarize_engines(page_engines: List[Optional[str]]) -> Dict[str, int]:
+    """Count pages per text engine"""
+    summary: Dict[str, int] = {}
+    for engine in page_engines:
+        if engine:
+            summary[engine] = summary.get(engine, 0) + 1
+    return summary
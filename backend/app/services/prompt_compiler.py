@@ -0,0 +1,136 @@
+# prompt_compiler.py
+import json
+import logging
+import textwrap
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.text_chunker import estimate_tokens
+from app.services.tabular_output import TABULAR_INSTRUCTION, tabular_schema
+
+logger = logging.getLogger(__name__)
+
+
+def minify_schema(schema: Any) -> str:
+    """Schema JSON without indentation or spaces; key order is kept, so the output is stable"""
+    return json.dumps(schema, separators=(",", ":"), ensure_ascii=False)
+
+
+def _block(text: str) -> str:
+    """Dedent a triple-quoted block and drop its surrounding blank lines"""
+    return textwrap.dedent(text).strip()
+
+
+class CompiledPrompt:
+    """
+    A template's extraction prompt, built once per template version.
+
+    The prefix holds everything that is the same for every call of the template
+    (instructions, guidelines, output rules), so it is byte-identical across
+    calls and provider-side prompt-prefix caching can apply. Everything that
+    varies comes after it: the document part or section note, the document
+    text and the required JSON structure, whose schema may be pruned or
+    narrowed to one section. With tabular_lists, record lists are requested
+    in the compact table form of tabular_output.
+    """
+
+    def __init__(self, template_id: int, template_config: Dict[str, Any], tabular_lists: bool = False):
+        self.template_id = template_id
+        self.version = template_config["version"]
+        self.schema = template_config["json_schema"]
+        self.tabular_lists = tabular_lists
+        output_rules = f"\n{TABULAR_INSTRUCTION}" if tabular_lists else ""
+
+        self.prefix = "\n\n".join([
+            "FINANCIAL DOCUMENT DATA EXTRACTION",
+            f"TEMPLATE ID: {template_id}\nTEMPLATE NAME: {template_config['name']}",
+            _block(template_config["prompt_focus"]),
+            "EXTRACTION GUIDELINES:\n" + _block(template_config["extraction_guidelines"]),
+            _block(f"""
+                CRITICAL INSTRUCTIONS:
+                - Extract data specifically for TEMPLATE {template_id}
+                - Use null for missing data
+                - Format dates as YYYY-MM-DD
+                - Return ONLY valid JSON matching the exact REQUIRED JSON STRUCTURE given after the document text
+                - DO NOT include any explanations or additional text
+                - The JSON structure MUST match Template {template_id} requirements
+            """) + output_rules
+        ]) + "\n\n"
+
+        self.schema_json = self._minify(self.schema)
+        self.section_schema_json = {
+            section: self._minify({section: section_schema}) for section, section_schema in self.schema.items()
+        }
+
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.schema_tokens = estimate_tokens(self.schema_json)
+        self.section_schema_tokens = {
+            section: estimate_tokens(schema_json) for section, schema_json in self.section_schema_json.items()
+        }
+
+    def render(self, text: str, schema: Optional[Dict[str, Any]] = None,
+               part: Optional[Tuple[int, int]] = None, section: Optional[str] = None) -> str:
+        """The full prompt for one call; schema defaults to the template's own"""
+        notes = []
+
+        # Chunks of a longer document only report what is in their own text
+        if part:
+            notes.append(
+                f"DOCUMENT PART {part[0]} OF {part[1]}: the text below is only part of the document.\n"
+                "Extract only data that appears in this part and use null for everything else."
+            )
+
+        # Section calls fill in one top-level key of the template
+        if section:
+            notes.append(
+                f'EXTRACT ONLY THE "{section}" SECTION. The text below contains the pages most relevant to it.\n'
+                f'Return a JSON object whose only key is "{section}".'
+            )
+
+        return "".join([
+            self.prefix,
+            "".join(note + "\n\n" for note in notes),
+            "DOCUMENT TEXT:\n",
+            text,
+            "\n\nREQUIRED JSON STRUCTURE:\n",
+            self.schema_for(schema, section),
+            "\n\nRETURN VALID JSON:"
+        ])
+
+    def schema_for(self, schema: Optional[Dict[str, Any]] = None, section: Optional[str] = None) -> str:
+        """Minified schema for a call; only a pruned schema is serialised again"""
+        if schema is None or schema is self.schema:
+            return self.section_schema_json[section] if section else self.schema_json
+        return self._minify({section: schema[section]} if section else schema)
+
+    def _minify(self, schema: Dict[str, Any]) -> str:
+        return minify_schema(tabular_schema(schema) if self.tabular_lists else schema)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Estimated prompt tokens around the document text"""
+        return {
+            "version": self.version,
+            "tabular_lists": self.tabular_lists,
+            "prefix_tokens": self.prefix_tokens,
+            "schema_tokens": self.schema_tokens,
+            "prompt_tokens_without_text": estimate_tokens(self.render("")),
+            "section_schema_tokens": self.section_schema_tokens
+        }
+
+
+class PromptCompiler:
+    """Compiles each template's prompt once and reuses it until the template version or output form changes"""
+
+    def __init__(self):
+        self._compiled: Dict[Tuple[int, str, bool], CompiledPrompt] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, template_id: int, template_config: Dict[str, Any], tabular_lists: bool = False) -> CompiledPrompt:
+        key = (template_id, template_config["version"], tabular_lists)
+        with self._lock:
+            if key not in self._compiled:
+                compiled = CompiledPrompt(template_id, template_config, tabular_lists)
+                self._compiled[key] = compiled
+                logger.info(f"📝 Compiled prompt for template {template_id} v{compiled.version}: "
+                            f"{compiled.prefix_tokens} prefix tokens, {compiled.schema_tokens} schema tokens")
+            return self._compiled[key]
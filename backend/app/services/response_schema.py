@@ -0,0 +1,182 @@
+# response_schema.py
+import copy
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import ConfigDict, TypeAdapter, ValidationError, WrapValidator
+from typing_extensions import Annotated, TypedDict
+
+from app.services.table_mapper import parse_number
+
+logger = logging.getLogger(__name__)
+
+# Values models write instead of null
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "-", "--", "—", "not available", "not disclosed"}
+
+# Error messages kept per invalid section
+MAX_SECTION_ERRORS = 5
+
+RECORD_CONFIG = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+
+def _coerce_number(value: Any, handler) -> Any:
+    """Plain numbers and numeric strings are coerced by pydantic; formatted ones like "$1,250.5m" are parsed here"""
+    try:
+        return handler(value)
+    except ValidationError:
+        if not isinstance(value, str):
+            raise
+        text = value.strip()
+        if text.lower() in NULL_STRINGS:
+            return None
+        number = parse_number(text)
+        if number is None:
+            raise
+        return number
+
+
+Number = Annotated[Optional[Union[int, float]], WrapValidator(_coerce_number)]
+
+# Location tags pydantic adds for the members of Number's union
+UNION_MEMBERS = {"int", "float"}
+
+
+def _field_type(name: str, node: Any) -> Any:
+    """The pydantic type for one node of a template's example-style schema"""
+    if isinstance(node, dict):
+        record = TypedDict(name, {key: _field_type(f"{name}_{key}", value) for key, value in node.items()}, total=False)
+        record.__pydantic_config__ = RECORD_CONFIG
+        return Optional[record]
+    if isinstance(node, list):
+        return Optional[List[_field_type(name, node[0]) if node else Any]]
+    if isinstance(node, str) and node.startswith("number"):
+        return Number
+    return Optional[str]
+
+
+class ResponseSchema:
+    """
+    A template's response schema compiled into one pydantic TypeAdapter per
+    top-level section, built once per template version.
+
+    validate() coerces each section (numeric strings to numbers, numbers in text
+    fields to strings) and reports which sections are valid; a section that
+    fails keeps its values as the model wrote them. A list section is repaired
+    record by record instead, so one bad record does not cost the whole list.
+    """
+
+    def __init__(self, template_id: int, schema: Dict[str, Any]):
+        self.template_id = template_id
+        self.adapters = {
+            section: TypeAdapter(_field_type(section, section_schema))
+            for section, section_schema in schema.items()
+        }
+        self.record_adapters = {
+            section: TypeAdapter(_field_type(section, section_schema[0]))
+            for section, section_schema in schema.items()
+            if isinstance(section_schema, list) and section_schema
+        }
+
+    def validate(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """The data with valid sections coerced, and each template section's validity"""
+        validated = {}
+        validity = {}
+        for section, value in data.items():
+            adapter = self.adapters.get(section)
+            if adapter is None:
+                validated[section] = value
+                continue
+            try:
+                validated[section] = adapter.validate_python(value)
+                validity[section] = {"valid": True}
+                continue
+            except ValidationError as e:
+                errors = self._errors(section, e)
+            
+            repaired = self._repair_records(section, value)
+            if repaired is not None:
+                validated[section], repaired_records = repaired
+                validity[section] = {
+                    "valid": True,
+                    "repaired_records": repaired_records,
+                    "errors": errors[:MAX_SECTION_ERRORS]
+                }
+                logger.info(f"🩹 Nulled invalid fields in {len(repaired_records)} records of {section}")
+            else:
+                validated[section] = value
+                validity[section] = {
+                    "valid": False,
+                    "error_count": len(errors),
+                    "errors": errors[:MAX_SECTION_ERRORS]
+                }
+        return validated, validity
+
+    def _repair_records(self, section: str, value: Any) -> Optional[Tuple[List[Any], List[int]]]:
+        """
+        Coerce a failed list section record by record. Fields that fail are
+        nulled and records that are not objects are dropped. Returns the records
+        and the indexes of those that were repaired or dropped; None when the
+        section is not a list of records.
+        """
+        adapter = self.record_adapters.get(section)
+        if adapter is None or not isinstance(value, list):
+            return None
+        records = []
+        repaired = []
+        for index, record in enumerate(value):
+            try:
+                records.append(adapter.validate_python(record))
+                continue
+            except ValidationError as e:
+                paths = [[part for part in detail["loc"] if part not in UNION_MEMBERS] for detail in e.errors()]
+            repaired.append(index)
+            if isinstance(record, dict) and all(paths):
+                record = copy.deepcopy(record)
+                for path in paths:
+                    self._null_field(record, path)
+                try:
+                    records.append(adapter.validate_python(record))
+                except ValidationError:
+                    pass
+        return records, repaired
+
+    @staticmethod
+    def _null_field(record: Dict[str, Any], path: List[Union[str, int]]):
+        """Set the field at path to None, or the outermost field when the path cannot be followed"""
+        node = record
+        for part in path[:-1]:
+            try:
+                node = node[part]
+            except (KeyError, IndexError, TypeError):
+                record[path[0]] = None
+                return
+        try:
+            node[path[-1]] = None
+        except (IndexError, TypeError):
+            record[path[0]] = None
+
+    @staticmethod
+    def _errors(section: str, error: ValidationError) -> List[str]:
+        """One message per failing field; a number field fails once per union member, so those are merged"""
+        messages: Dict[str, str] = {}
+        for detail in error.errors():
+            path = ".".join(str(part) for part in detail["loc"] if part not in UNION_MEMBERS)
+            messages.setdefault(f"{section}.{path}" if path else section, detail["msg"])
+        return [f"{path}: {message}" for path, message in messages.items()]
+
+
+class ResponseSchemaCompiler:
+    """Compiles each template's response schema once and reuses it until the template version changes"""
+
+    def __init__(self):
+        self._compiled: Dict[Tuple[int, str], ResponseSchema] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, template_id: int, template_config: Dict[str, Any]) -> ResponseSchema:
+        key = (template_id, template_config["version"])
+        with self._lock:
+            if key not in self._compiled:
+                self._compiled[key] = ResponseSchema(template_id, template_config["json_schema"])
+                logger.info(f"🧾 Compiled response schema for template {template_id} v{template_config['version']}")
+            return self._compiled[key]
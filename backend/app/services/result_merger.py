@@ -0,0 +1,134 @@
+# result_merger.py
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+# Values the models use for "not found"
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "-"}
+
+# Trailing legal-form tokens ignored when matching company names
+COMPANY_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited",
+    "llc", "llp", "lp", "plc", "gmbh", "ag", "sa", "sas", "sarl", "bv", "nv", "ab", "spa", "holdings"
+}
+
+COMPANY_KEY = "Company_Name"
+
+
+def is_null(value: Any) -> bool:
+    """Whether an extracted value means 'no data'"""
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in NULL_STRINGS
+    if isinstance(value, (list, dict)):
+        return not value
+    return False
+
+
+def normalize_company_name(name: Any) -> str:
+    """Match key for a company name: case, punctuation and legal suffixes ignored"""
+    if not isinstance(name, str):
+        return ""
+    tokens = re.sub(r"[^a-z0-9]+", " ", name.lower()).split()
+    while len(tokens) > 1 and tokens[-1] in COMPANY_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def merge_extraction_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge template-shaped results extracted from separate chunks of one document.
+
+    Objects are merged key by key, the first non-null scalar wins, and list
+    sections are concatenated with duplicate records folded together.
+    """
+    merged: Dict[str, Any] = {}
+    for result in results:
+        if isinstance(result, dict):
+            merged = _merge_values(merged, {k: v for k, v in result.items() if k != "_metadata"})
+    return merged
+
+
+def _merge_values(current: Any, incoming: Any) -> Any:
+    if is_null(current):
+        return incoming
+    if is_null(incoming):
+        return current
+
+    if isinstance(current, dict) and isinstance(incoming, dict):
+        merged = dict(current)
+        for key, value in incoming.items():
+            merged[key] = _merge_values(merged.get(key), value)
+        return merged
+
+    if isinstance(current, list) and isinstance(incoming, list):
+        return _merge_lists(current, incoming)
+
+    # Conflicting scalars: keep the earlier chunk's value
+    return current
+
+
+def _merge_lists(current: List[Any], incoming: List[Any]) -> List[Any]:
+    """Concatenate two list sections, folding duplicate records into one"""
+    merged: List[Any] = []
+    company_index: Dict[str, List[int]] = {}
+    seen: Dict[str, int] = {}
+
+    for item in list(current) + list(incoming):
+        if is_null(item):
+            continue
+
+        if isinstance(item, dict):
+            company = normalize_company_name(item.get(COMPANY_KEY))
+            if company:
+                match = _find_matching_record(merged, company_index.get(company, []), item)
+                if match is not None:
+                    merged[match] = _merge_values(merged[match], item)
+                    continue
+                company_index.setdefault(company, []).append(len(merged))
+                merged.append(item)
+                continue
+
+        fingerprint = _fingerprint(item)
+        if fingerprint in seen:
+            if isinstance(item, dict):
+                merged[seen[fingerprint]] = _merge_values(merged[seen[fingerprint]], item)
+            continue
+        seen[fingerprint] = len(merged)
+        merged.append(item)
+
+    return merged
+
+
+def _find_matching_record(merged: List[Dict[str, Any]], candidates: List[int], item: Dict[str, Any]) -> Optional[int]:
+    """
+    Same-company record the item duplicates, if any.
+
+    Records only match when they do not disagree on a date or transaction type,
+    so separate transactions of one company stay separate rows.
+    """
+    for index in candidates:
+        existing = merged[index]
+        if not any(_conflicts(existing.get(key), item.get(key)) for key in _identity_fields(existing, item)):
+            return index
+    return None
+
+
+def _identity_fields(first: Dict[str, Any], second: Dict[str, Any]) -> List[str]:
+    keys = set(first) | set(second)
+    return [key for key in keys if key.endswith("_Date") or key.endswith("_Type")]
+
+
+def _conflicts(first: Any, second: Any) -> bool:
+    if is_null(first) or is_null(second):
+        return False
+    if isinstance(first, str) and isinstance(second, str):
+        return first.strip().lower() != second.strip().lower()
+    return first != second
+
+
+def _fingerprint(item: Any) -> str:
+    if isinstance(item, str):
+        return item.strip().lower()
+    return json.dumps(item, sort_keys=True, default=str)
@@ -0,0 +1,55 @@
+# sqlite_store.py
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator
+
+# Seconds a writer waits for another process's lock before giving up
+SQLITE_BUSY_TIMEOUT = 30
+
+
+def create_store(db_path: str):
+    """Create the store's directory and switch it to WAL, so readers never block the writer"""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    with connect(db_path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+
+@contextmanager
+def connect(db_path: str) -> Iterator[sqlite3.Connection]:
+    """Short-lived connection, committed and closed on exit, safe to use from any thread or process"""
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def increment(conn: sqlite3.Connection, name: str, amount: int = 1):
+    """Add to a counter in the store's stats table"""
+    conn.execute(
+        "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+        (name, amount, amount)
+    )
+
+
+def evict_least_recently_used(conn: sqlite3.Connection, table: str, max_bytes: int) -> int:
+    """
+    Drop least-recently-used rows of table (keyed by key, sized by size) until
+    it fits in max_bytes; returns how many were dropped and counts them as evictions
+    """
+    total_bytes = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+    if total_bytes <= max_bytes:
+        return 0
+
+    evicted = 0
+    for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_accessed ASC").fetchall():
+        if total_bytes <= max_bytes:
+            break
+        conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        total_bytes -= size
+        evicted += 1
+
+    increment(conn, "evictions", evicted)
+    return evicted
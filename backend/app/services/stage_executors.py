@@ -0,0 +1,191 @@
+# stage_executors.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Samples kept per stage for percentile reporting
+METRIC_WINDOW = 200
+
+# Per-process service instances, created lazily inside each worker
+_worker_services: Dict[str, Any] = {}
+
+
+def _timed_call(fn: Callable, args: Tuple, submitted_at: float) -> Tuple[bool, Any, float, float]:
+    """Run fn inside the executor and report when it actually started and finished"""
+    started_at = time.time()
+    try:
+        result = fn(*args)
+        return True, result, started_at, time.time()
+    except Exception as e:
+        return False, e, started_at, time.time()
+
+
+def _get_pdf_extractor():
+    from app.services.pdf_extractor import PDFExtractor
+
+    if "pdf_extractor" not in _worker_services:
+        _worker_services["pdf_extractor"] = PDFExtractor()
+    return _worker_services["pdf_extractor"]
+
+
+def parse_pdf(file_path: str) -> Dict[str, Any]:
+    """Parse a PDF in a worker process"""
+    return _get_pdf_extractor().extract_text(file_path)
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """Count the pages of a PDF in a worker process"""
+    return _get_pdf_extractor().get_page_count(file_path)
+
+
+def select_pdf_engine(file_path: str) -> Optional[str]:
+    """Choose the text engine for a whole PDF in a worker process (None when chosen per page)"""
+    return _get_pdf_extractor().select_document_engine(file_path)
+
+
+def parse_pdf_pages(file_path: str, start_page: int, end_page: int,
+                    document_engine: Optional[str] = None) -> Dict[str, Any]:
+    """Parse one contiguous page range of a PDF in a worker process"""
+    return _get_pdf_extractor().extract_page_range(file_path, start_page, end_page, document_engine)
+
+
+def load_cached_extraction(file_path: str) -> Optional[Dict[str, Any]]:
+    """Look up a cached extraction result in a worker process"""
+    return _get_pdf_extractor().get_cached_result(file_path)
+
+
+def cache_extraction(file_path: str, result: Dict[str, Any]):
+    """Store an extraction result in the cache from a worker process"""
+    _get_pdf_extractor().cache_result(file_path, result)
+
+
+def generate_excel(structured_data: Dict[str, Any], template_id: int, output_path: str) -> str:
+    """Build the Excel workbook in a worker process"""
+    from app.services.excel_generator import ExcelGenerator
+
+    if "excel_generator" not in _worker_services:
+        _worker_services["excel_generator"] = ExcelGenerator()
+    return _worker_services["excel_generator"].generate_excel(structured_data, template_id, output_path)
+
+
+class StageExecutors:
+    """
+    Dedicated executors for the blocking pipeline stages, keeping the event loop free.
+
+    PDF parsing and Excel generation are CPU-bound and run in process pools;
+    LLM calls are network-bound and run in a thread pool.
+    """
+
+    def __init__(self, parse_workers: Optional[int] = None, excel_workers: int = 1, llm_workers: int = 4):
+        self.pool_sizes = {
+            "parse": max(1, parse_workers or os.cpu_count() or 1),
+            "excel": max(1, excel_workers),
+            "llm": max(1, llm_workers)
+        }
+        self._executors: Dict[str, Executor] = {}
+        self.metrics = {stage: self._empty_metrics() for stage in self.pool_sizes}
+
+        logger.info(f"Stage executors configured: {self.pool_sizes}")
+
+    def start(self):
+        """Create the worker pools"""
+        if self._executors:
+            return
+
+        self._executors = {
+            "parse": ProcessPoolExecutor(max_workers=self.pool_sizes["parse"]),
+            "excel": ProcessPoolExecutor(max_workers=self.pool_sizes["excel"]),
+            "llm": ThreadPoolExecutor(max_workers=self.pool_sizes["llm"], thread_name_prefix="llm")
+        }
+        logger.info("⚙️ Stage executors started")
+
+    def shutdown(self, wait: bool = False):
+        """Shut the worker pools down"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        self._executors = {}
+        logger.info("⚙️ Stage executors stopped")
+
+    async def run(self, stage: str, fn: Callable, *args) -> Any:
+        """
+        Run fn(*args) on the executor for the given stage.
+
+        For process pools fn and its arguments must be picklable, so pass
+        module-level functions such as parse_pdf and generate_excel.
+        """
+        executor = self._executors.get(stage)
+        if executor is None:
+            raise RuntimeError(f"No executor running for stage '{stage}'")
+
+        stage_metrics = self.metrics[stage]
+        stage_metrics["submitted"] += 1
+        stage_metrics["in_flight"] += 1
+        submitted_at = time.time()
+
+        try:
+            loop = asyncio.get_running_loop()
+            ok, result, started_at, finished_at = await loop.run_in_executor(
+                executor, _timed_call, fn, args, submitted_at
+            )
+        finally:
+            stage_metrics["in_flight"] -= 1
+
+        self._record(stage, max(0.0, started_at - submitted_at), finished_at - started_at, ok)
+
+        if not ok:
+            raise result
+        return result
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Stage metrics with queue wait reported separately from run time"""
+        report = {}
+        for stage, stage_metrics in self.metrics.items():
+            report[stage] = {
+                "pool_size": self.pool_sizes[stage],
+                "submitted": stage_metrics["submitted"],
+                "completed": stage_metrics["completed"],
+                "failed": stage_metrics["failed"],
+                "in_flight": stage_metrics["in_flight"],
+                "queue_wait_seconds": self._summarize(stage_metrics["queue_wait"]),
+                "run_time_seconds": self._summarize(stage_metrics["run_time"])
+            }
+        return report
+
+    def _record(self, stage: str, queue_wait: float, run_time: float, ok: bool):
+        """Record timing for a finished task"""
+        stage_metrics = self.metrics[stage]
+        stage_metrics["completed" if ok else "failed"] += 1
+        stage_metrics["queue_wait"].append(queue_wait)
+        stage_metrics["run_time"].append(run_time)
+
+        logger.debug(f"⏱️ {stage}: waited {queue_wait:.3f}s, ran {run_time:.3f}s")
+
+    def _empty_metrics(self) -> Dict[str, Any]:
+        return {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "in_flight": 0,
+            "queue_wait": deque(maxlen=METRIC_WINDOW),
+            "run_time": deque(maxlen=METRIC_WINDOW)
+        }
+
+    def _summarize(self, samples: deque) -> Dict[str, Any]:
+        """Mean, p50, p95 and max over the recent samples"""
+        if not samples:
+            return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "mean": round(sum(ordered) / len(ordered), 4),
+            "p50": round(ordered[int(0.50 * (len(ordered) - 1))], 4),
+            "p95": round(ordered[int(0.95 * (len(ordered) - 1))], 4),
+            "max": round(ordered[-1], 4)
+        }
@@ -0,0 +1,369 @@
+# table_mapper.py
+import logging
+import re
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.kpi_extractor import (
+    PrefilledFields, SCALE_NOTE_PATTERN, SCALE_UNITS, VALUE_PATTERN, from_percent, note_scale, text_scale
+)
+
+logger = logging.getLogger(__name__)
+
+# Column headings documents use for each list-section field, besides the field name itself
+COLUMN_SYNONYMS = {
+    "Company_Name": ["company", "portfolio company", "portfolio companies", "investment", "investments",
+                     "portfolio investment", "issuer", "investee", "name"],
+    "Fund_Name": ["fund", "fund name"],
+    "Industry": ["industry", "sector"],
+    "Headquarters_Country": ["country", "headquarters", "hq", "location"],
+    "Headquarters": ["headquarters", "hq", "location", "country"],
+    "Status": ["status", "investment status"],
+    "Investment_Status": ["status", "investment status"],
+    "Investment_Date": ["investment date", "date of investment", "acquisition date", "date acquired", "entry date"],
+    "Initial_Investment_Date": ["investment date", "initial investment date", "date of investment",
+                                "date of initial investment", "acquisition date", "date acquired", "entry date"],
+    "Initial_Investment_Amount": ["initial investment", "initial cost", "initial investment amount"],
+    "Currency": ["currency", "ccy"],
+    "Instrument_Type": ["instrument", "security", "security type", "type of security"],
+    "Security_Type": ["security", "security type", "type of security", "instrument", "instrument type"],
+    "Committed_Capital": ["commitment", "committed", "committed capital"],
+    "Fund_Commitment": ["commitment", "committed", "committed capital", "fund commitment"],
+    "Invested_Capital": ["invested", "invested capital", "capital invested", "amount invested", "total invested"],
+    "Total_Invested": ["invested", "invested capital", "capital invested", "amount invested", "total invested",
+                       "cumulative invested"],
+    "Current_Cost": ["cost", "current cost", "cost basis", "remaining cost"],
+    "Unrealized_Value": ["unrealized value", "unrealised value", "fair value", "remaining value", "market value"],
+    "Reported_Value": ["reported value", "fair value", "market value", "carrying value", "value"],
+    "Total_Value": ["total value"],
+    "Realized_Proceeds": ["realized proceeds", "realised proceeds", "proceeds", "realized value", "realised value"],
+    "Gross_IRR": ["gross irr", "irr"],
+    "Valuation_Date": ["valuation date", "as of date", "date"],
+    "Reported_Date": ["reported date", "reporting date", "as of date", "valuation date"],
+    "Financial_Date": ["financial date", "reporting date", "as of date", "period", "date"],
+    "Reporting_Date": ["reporting date", "reported date", "as of date", "period", "date"],
+    "Enterprise_Value": ["enterprise value", "ev"],
+    "Equity_Value": ["equity value"],
+    "Ownership_Percentage": ["ownership", "ownership %", "% owned", "stake", "equity stake", "fully diluted ownership"],
+    "Fund_Ownership_Percentage": ["ownership", "fund ownership", "ownership %", "% owned", "stake"],
+    "Revenue_LTM": ["revenue", "ltm revenue", "revenue ltm", "sales", "net sales"],
+    "EBITDA_LTM": ["ebitda", "ltm ebitda", "ebitda ltm"],
+    "Cash_Balance": ["cash", "cash balance"],
+    "Total_Debt": ["debt", "total debt"],
+    "Revenue_Growth_YoY": ["revenue growth", "growth", "yoy growth"],
+    "EBITDA_Margin": ["ebitda margin", "margin"],
+    "Transaction_Date": ["date", "transaction date", "value date", "payment date"],
+    "Transaction_Type": ["type", "transaction type", "transaction"],
+    "Transaction_Amount": ["amount", "transaction amount"],
+    "Amount": ["amount", "transaction amount"],
+    "Investor_Name": ["investor", "investor name", "limited partner", "lp", "partner"],
+    "Description": ["description", "details", "memo"],
+    "Company_Description": ["description", "business description", "company description"],
+    "Business_Model": ["business model"]
+}
+
+# Fields a record cannot be identified without; a table must map them to fill a section
+IDENTITY_FIELDS = {
+    "LP_Investor_Cashflows": ["Transaction_Date", "Amount"]
+}
+DEFAULT_IDENTITY_FIELDS = ["Company_Name"]
+
+# A header must be at least this similar to a field's name or synonym to map to it
+MIN_HEADER_SIMILARITY = 0.85
+
+# Besides the identity fields, a table must map this many fields of a section,
+# including one of its numeric fields if it has any
+MIN_EXTRA_FIELDS = 2
+
+# Share of filled numeric cells that must parse as numbers
+MIN_NUMERIC_PARSE_RATE = 0.8
+
+# Numeric fields holding ratios, which a table's "($ in millions)" does not scale
+RATIO_FIELD_PATTERN = re.compile(r"Percentage|IRR|Margin|Growth|MOIC|TVPI|DPI|RVPI")
+
+EMPTY_CELLS = {"", "-", "–", "—", "n/a", "na", "nm", "n.m.", "none", "nil"}
+TOTAL_ROW_PATTERN = re.compile(r"^\s*(?:sub-?\s*)?(?:grand\s+)?totals?\b", re.IGNORECASE)
+
+DATE_FORMATS = ["%Y-%m-%d", "%d %B %Y", "%d %b %Y", "%B %d, %Y", "%b %d, %Y", "%d-%b-%Y", "%d-%b-%y", "%d.%m.%Y"]
+SLASH_DATE_PATTERN = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})$")
+
+
+def normalize_header(cell: Any) -> str:
+    """The header text for matching; scale and currency notes are dropped (header_scales reads the scale)"""
+    text = str(cell or "").lower().replace("\n", " ")
+    text = SCALE_NOTE_PATTERN.sub(lambda match: " " if note_scale(match.group()) else match.group(), text)
+    text = re.sub(r"\((?:[$€£]|(?:usd|eur|gbp|chf)m?|in [^)]*|m|mm|000s?)\)", " ", text)
+    text = re.sub(r"[^a-z0-9% ]", " ", text)
+    text = re.sub(r"\d+\s*$", "", text)  # footnote markers
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def header_scales(header: List[str]) -> List[Optional[float]]:
+    """
+    The scale each column's amounts are stated in: a note in the column's own
+    header, else one in the top-left cell, e.g. "Company ($ in millions)"
+    """
+    table_scale = text_scale(header[0]) if header else None
+    return [text_scale(cell) or table_scale for cell in header]
+
+
+def clean_cell(cell: Any) -> str:
+    return re.sub(r"\s+", " ", str(cell or "")).strip()
+
+
+def is_empty_cell(text: str) -> bool:
+    return text.lower() in EMPTY_CELLS
+
+
+def parse_number(text: str, scale: Optional[float] = None, percent: bool = False) -> Optional[float]:
+    """
+    Number in a table cell: thousands separators, currency, %, x and (negative)
+    parentheses allowed. Percentages become decimals (15% = 0.15), as the
+    templates expect. scale multiplies numbers written without a unit; with
+    percent, those are percentages instead (a column headed "%").
+    """
+    text = re.sub(r"^(?:usd|eur|gbp|chf)\s*", "", text, flags=re.IGNORECASE)
+    match = VALUE_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    number = float(match.group("number").replace(",", ""))
+    unit = (match.group("unit") or "").lower()
+    if unit == "%" or (percent and not unit):
+        number = from_percent(number)
+    else:
+        number *= SCALE_UNITS.get(unit, 1) if unit else scale or 1
+    if match.group("negative"):
+        number = -number
+    return int(number) if number == int(number) else number
+
+
+def normalize_date(text: str) -> str:
+    """YYYY-MM-DD when the date is unambiguous, otherwise the text as written"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+
+    match = SLASH_DATE_PATTERN.match(text)
+    if match:
+        first, second, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+        # Only when one part cannot be a month is the order certain
+        day, month = (first, second) if first > 12 else (second, first) if second > 12 else (None, None)
+        if day is not None:
+            try:
+                return datetime(year, month, day).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+    return text
+
+
+def header_similarity(header: str, field: str) -> float:
+    """Best similarity between a normalized header and a field's name or synonyms"""
+    if not header:
+        return 0.0
+    candidates = [field.replace("_", " ").lower()] + COLUMN_SYNONYMS.get(field, [])
+    best = 0.0
+    for candidate in candidates:
+        if header == candidate:
+            return 1.0
+        best = max(best, SequenceMatcher(None, header, candidate).ratio())
+    return best
+
+
+class TableMapper:
+    """
+    Fills list sections of the template straight from the PDF's tables.
+
+    Table headers are matched to section fields by synonym and fuzzy matching;
+    a table is used for a section only when it maps the section's identity
+    fields plus a few more and its numeric columns parse cleanly. Tables that
+    continue on the next page without a header are stitched to the table
+    before them. A section is only filled when every table that looked like
+    it belonged to the section could be mapped; otherwise it is left to the LLM.
+    """
+
+    def fill(self, extracted_texts: List[Dict[str, Any]], schema: Dict[str, Any], prefilled: PrefilledFields):
+        schema_types = {
+            name: section[0]
+            for name, section in schema.items()
+            if isinstance(section, list) and section and isinstance(section[0], dict)
+        }
+        sections = {name: list(field_types) for name, field_types in schema_types.items()}
+        if not sections:
+            return
+
+        records: Dict[str, List[Dict[str, Any]]] = {name: [] for name in sections}
+        sources: Dict[str, List[Dict[str, Any]]] = {name: [] for name in sections}
+        rejected = set()
+
+        for text_data in extracted_texts:
+            previous = None
+            tables = sorted(text_data.get("tables") or [], key=lambda t: (t.get("page") or 0, t.get("table_number") or 0))
+            for table in tables:
+                rows = [[clean_cell(cell) for cell in row] for row in (table.get("data") or []) if row]
+                if not rows:
+                    continue
+
+                mappings, candidates, header, data_start = self._map_table(rows, sections, schema_types)
+                continued = False
+                if not mappings and not candidates and previous and self._continues(previous, table, rows):
+                    mappings, header, data_start, continued = previous["mappings"], previous["header"], 0, True
+
+                scales = header_scales(header)
+                percent_columns = {column for column, cell in enumerate(header) if "%" in cell}
+                for section, columns in mappings.items():
+                    section_records = self._records(rows[data_start:], columns, section, schema_types[section],
+                                                    scales, percent_columns)
+                    if section_records is None:
+                        rejected.add(section)
+                        continue
+                    records[section].extend(section_records)
+                    source = {
+                        "file": text_data.get("filename"),
+                        "page": table.get("page"),
+                        "table": table.get("table_number"),
+                        "rows": len(section_records),
+                        "continued": continued,
+                        "columns": {field: header[column] for column, field in sorted(columns.items())}
+                    }
+                    scaled = {
+                        field: scales[column] for column, field in sorted(columns.items())
+                        if column < len(scales) and scales[column] and self._scaled_field(field, schema_types[section])
+                    }
+                    if scaled:
+                        source["scales"] = scaled
+                    sources[section].append(source)
+                rejected.update(candidates)
+
+                if mappings:
+                    previous = {"mappings": mappings, "header": header, "columns": len(rows[0]), "page": table.get("page")}
+                else:
+                    previous = None
+
+        for section in sections:
+            if section in rejected:
+                if records[section]:
+                    logger.info(f"📋 Some {section} tables could not be mapped confidently, leaving the section to the LLM")
+                continue
+            if records[section]:
+                prefilled.set([section], records[section], {"source": "tables", "tables": sources[section]})
+                logger.info(f"📋 Filled {section} with {len(records[section])} rows from {len(sources[section])} tables")
+
+    def _map_table(self, rows: List[List[str]], sections: Dict[str, List[str]],
+                   schema_types: Dict[str, Dict[str, str]]) -> Tuple[Dict[str, Dict[int, str]], set, List[str], int]:
+        """
+        Confident column mappings per section, sections the table only partly
+        matches (left to the LLM), the header cells and the first data row.
+        """
+        header = rows[0]
+        data_start = 1
+        # Headings wrapped onto a second row
+        if len(rows) > 2 and not any(parse_number(cell) is not None for cell in rows[1] if cell):
+            joined = [f"{top} {bottom}".strip() for top, bottom in zip(header, rows[1])]
+            if self._mapped_count(joined, sections) > self._mapped_count(header, sections):
+                header, data_start = joined, 2
+
+        headers = [normalize_header(cell) for cell in header]
+        mappings = {}
+        candidates = set()
+        for section, fields in sections.items():
+            columns = self._assign_columns(headers, fields)
+            identity = IDENTITY_FIELDS.get(section, DEFAULT_IDENTITY_FIELDS)
+            if not all(field in columns.values() for field in identity if field in fields):
+                continue
+            numeric = [field for field in fields if str(schema_types[section].get(field, "")).startswith("number")]
+            maps_numeric = not numeric or any(field in numeric for field in columns.values())
+            if len(columns) - len(identity) >= MIN_EXTRA_FIELDS and maps_numeric:
+                mappings[section] = columns
+            elif len(columns) > len(identity):
+                candidates.add(section)
+
+        return mappings, candidates, header, data_start
+
+    def _mapped_count(self, header: List[str], sections: Dict[str, List[str]]) -> int:
+        headers = [normalize_header(cell) for cell in header]
+        return max((len(self._assign_columns(headers, fields)) for fields in sections.values()), default=0)
+
+    def _assign_columns(self, headers: List[str], fields: List[str]) -> Dict[int, str]:
+        """Column index -> field, pairing the most similar header and field first"""
+        scored = sorted(
+            (
+                (header_similarity(header, field), column, field)
+                for column, header in enumerate(headers)
+                for field in fields
+            ),
+            reverse=True
+        )
+        columns: Dict[int, str] = {}
+        used_fields = set()
+        for score, column, field in scored:
+            if score < MIN_HEADER_SIMILARITY:
+                break
+            if column in columns or field in used_fields:
+                continue
+            columns[column] = field
+            used_fields.add(field)
+        return columns
+
+    def _continues(self, previous: Dict[str, Any], table: Dict[str, Any], rows: List[List[str]]) -> bool:
+        """A headerless table right after a mapped one, with the same columns, continues it"""
+        page = table.get("page") or 0
+        return (
+            len(rows[0]) == previous["columns"]
+            and page - (previous["page"] or 0) in (0, 1)
+            and any(parse_number(cell) is not None for cell in rows[0] if cell)
+        )
+
+    @staticmethod
+    def _scaled_field(field: str, field_types: Dict[str, str]) -> bool:
+        """Whether a column's scale applies to the field: numeric amounts, not ratios"""
+        return str(field_types.get(field, "")).startswith("number") and not RATIO_FIELD_PATTERN.search(field)
+
+    def _records(self, rows: List[List[str]], columns: Dict[int, str], section: str,
+                 field_types: Dict[str, str], scales: Optional[List[Optional[float]]] = None,
+                 percent_columns: Optional[set] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Section records for the data rows, or None if the numeric columns do not
+        parse. Amounts are multiplied by their column's scale from scales; ratio
+        fields in percent_columns (headed "%") are read as percentages.
+        """
+        scales = scales or []
+        percent_columns = percent_columns or set()
+        fields = list(field_types)
+        identity = [field for field in IDENTITY_FIELDS.get(section, DEFAULT_IDENTITY_FIELDS) if field in fields]
+        numeric_cells = 0
+        parsed_cells = 0
+        records = []
+
+        for row in rows:
+            if not any(row) or any(TOTAL_ROW_PATTERN.match(cell) for cell in row[:2] if cell):
+                continue
+
+            record = {field: None for field in fields}
+            for column, field in columns.items():
+                text = row[column] if column < len(row) else ""
+                if is_empty_cell(text):
+                    continue
+                if str(field_types.get(field, "")).startswith("number"):
+                    numeric_cells += 1
+                    scale = scales[column] if column < len(scales) and self._scaled_field(field, field_types) else None
+                    percent = column in percent_columns and RATIO_FIELD_PATTERN.search(field) is not None
+                    value = parse_number(text, scale, percent)
+                    if value is not None:
+                        parsed_cells += 1
+                    record[field] = value
+                elif field.endswith("_Date"):
+                    record[field] = normalize_date(text)
+                else:
+                    record[field] = text
+
+            if all(record[field] is not None for field in identity):
+                records.append(record)
+
+        if numeric_cells and parsed_cells / numeric_cells < MIN_NUMERIC_PARSE_RATE:
+            logger.debug(f"Table rejected for {section}: {parsed_cells}/{numeric_cells} numeric cells parsed")
+            return None
+        return records
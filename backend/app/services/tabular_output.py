@@ -0,0 +1,62 @@
+# tabular_output.py
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Prompt rule for the compact form, added to the compiled prompt when it is enabled
+TABULAR_INSTRUCTION = (
+    '- List sections use a compact table form: copy "columns" exactly as shown, then write one array '
+    'of values per record in "rows", in column order, with null for missing values'
+)
+
+
+def is_record_list(section_schema: Any) -> bool:
+    """A list section whose records are flat objects: those are sent as tables"""
+    return (
+        isinstance(section_schema, list) and len(section_schema) == 1 and isinstance(section_schema[0], dict)
+        and not any(isinstance(value, (dict, list)) for value in section_schema[0].values())
+    )
+
+
+def tabular_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """The schema with each record list replaced by its header row and one example row"""
+    return {
+        section: {"columns": list(section_schema[0]), "rows": [list(section_schema[0].values())]}
+        if is_record_list(section_schema) else section_schema
+        for section, section_schema in schema.items()
+    }
+
+
+def is_table(value: Any) -> bool:
+    return (
+        isinstance(value, dict) and isinstance(value.get("columns"), list) and isinstance(value.get("rows"), list)
+        and all(isinstance(column, str) for column in value["columns"])
+    )
+
+
+def expand_table(table: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Records from a compact table; short rows are padded with null and extra values dropped"""
+    columns = table["columns"]
+    records = []
+    for row in table["rows"]:
+        if isinstance(row, dict):
+            # The model fell back to a plain record
+            records.append(row)
+            continue
+        if not isinstance(row, list):
+            logger.debug(f"Skipping table row that is not an array: {row!r}")
+            continue
+        if len(row) != len(columns):
+            logger.debug(f"Table row has {len(row)} values for {len(columns)} columns")
+        values = row[:len(columns)] + [None] * (len(columns) - len(row))
+        records.append(dict(zip(columns, values)))
+    return records
+
+
+def expand_tabular_sections(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn every compact table among the top-level sections back into the usual list of records"""
+    return {
+        section: expand_table(value) if is_table(value) else value
+        for section, value in data.items()
+    }
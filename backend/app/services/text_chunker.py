@@ -0,0 +1,175 @@
+# text_chunker.py
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Word pieces, digit runs and single punctuation marks, roughly as a BPE tokenizer splits them
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+
+# Page boundaries: form feeds, or the page header written by PDFExtractor._clean_text
+PAGE_BREAK_PATTERN = re.compile(r"\f|(?====== Page \d+ =====)")
+
+# Tokens added by the "\n\n" placed between units
+SEPARATOR_TOKENS = 1
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of text locally, in one linear pass.
+
+    Calibrated to err slightly high for Llama-3 style BPE vocabularies: common
+    words are one token, long words one per six characters, numbers one per
+    three digits and punctuation one each.
+    """
+    if not text:
+        return 0
+
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += max(1, (len(piece) + 4) // 6)
+    return tokens
+
+
+def chunk_tokens_for_models(models: List[Dict[str, Any]], prompt_overhead_tokens: int,
+                            max_chunk_tokens: Optional[int] = None) -> int:
+    """
+    Largest chunk every model can take: context window minus the completion
+    budget and the prompt around the text, optionally capped.
+    """
+    limits = [
+        model["context_window"] - model["max_tokens"] - prompt_overhead_tokens
+        for model in models
+        if model.get("context_window")
+    ]
+    size = min(limits) if limits else max_chunk_tokens
+    if max_chunk_tokens:
+        size = min(size, max_chunk_tokens)
+    if not size or size <= 0:
+        raise ValueError("Prompt overhead leaves no room for document text")
+    return size
+
+
+class TextChunker:
+    """
+    Splits text into chunks of at most max_tokens estimated tokens.
+
+    Text is cut at page boundaries where possible, then paragraphs, then lines,
+    and only hard-split inside a line that is itself too long. Consecutive chunks
+    share up to overlap_tokens of trailing units so records that straddle a
+    boundary are seen whole. Runs in time linear in the input.
+    """
+
+    def __init__(self, max_tokens: int, overlap_tokens: int = 0):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+
+    def split(self, text: str) -> List[str]:
+        """Chunk a single text"""
+        return self.split_documents([text])
+
+    def split_documents(self, texts: List[str]) -> List[str]:
+        """Chunk several documents in order; a document boundary is treated as a page boundary"""
+        pages = [page for text in texts for page in self._split_pages(text)]
+
+        chunks: List[str] = []
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+
+        for page_units in pages:
+            page_tokens = sum(tokens + SEPARATOR_TOKENS for _, tokens in page_units)
+
+            # Start the page in a fresh chunk rather than cut it, unless that wastes over half a chunk
+            if current and current_tokens + page_tokens > self.max_tokens and current_tokens >= self.max_tokens // 2:
+                current, current_tokens = self._flush(chunks, current)
+
+            for unit in page_units:
+                unit_tokens = unit[1] + SEPARATOR_TOKENS
+                if current and current_tokens + unit_tokens > self.max_tokens:
+                    current, current_tokens = self._flush(chunks, current)
+                    # Shorten the carried-over overlap until the unit fits after it
+                    while current and current_tokens + unit_tokens > self.max_tokens:
+                        current_tokens -= current.pop(0)[1] + SEPARATOR_TOKENS
+                current.append(unit)
+                current_tokens += unit_tokens
+
+        if current:
+            self._flush(chunks, current)
+
+        return [chunk for chunk in chunks if chunk.strip()]
+
+    def _flush(self, chunks: List[str], current: List[Tuple[str, int]]) -> Tuple[List[Tuple[str, int]], int]:
+        """Emit the current chunk and return the overlap that opens the next one"""
+        chunks.append("\n\n".join(text for text, _ in current))
+
+        overlap: List[Tuple[str, int]] = []
+        overlap_tokens = 0
+        for unit in reversed(current[1:]):
+            unit_tokens = unit[1] + SEPARATOR_TOKENS
+            if overlap_tokens + unit_tokens > self.overlap_tokens:
+                break
+            overlap.append(unit)
+            overlap_tokens += unit_tokens
+
+        overlap.reverse()
+        return overlap, overlap_tokens
+
+    def _split_pages(self, text: str) -> List[List[Tuple[str, int]]]:
+        """Pages of (unit_text, tokens) units, each unit no larger than max_tokens"""
+        pages = []
+        for page in PAGE_BREAK_PATTERN.split(text):
+            units = []
+            for paragraph in page.split("\n\n"):
+                if not paragraph.strip():
+                    continue
+                units.extend(self._fit_unit(paragraph))
+            if units:
+                pages.append(units)
+        return pages
+
+    def _fit_unit(self, paragraph: str) -> List[Tuple[str, int]]:
+        """Break an oversized paragraph into lines, and an oversized line into word runs"""
+        tokens = estimate_tokens(paragraph)
+        if tokens <= self.max_tokens:
+            return [(paragraph, tokens)]
+
+        units = []
+        for line in paragraph.split("\n"):
+            line_tokens = estimate_tokens(line)
+            if line_tokens <= self.max_tokens:
+                if line.strip():
+                    units.append((line, line_tokens))
+                continue
+
+            piece: List[str] = []
+            piece_tokens = 0
+            for word in line.split(" "):
+                word_tokens = estimate_tokens(word)
+                if piece and piece_tokens + word_tokens > self.max_tokens:
+                    units.append((" ".join(piece), piece_tokens))
+                    piece, piece_tokens = [], 0
+                if word_tokens > self.max_tokens:
+                    # A single unbroken run (e.g. a long number string); cut by characters
+                    step = max(1, len(word) * self.max_tokens // word_tokens)
+                    units.extend((word[i:i + step], estimate_tokens(word[i:i + step])) for i in range(0, len(word), step))
+                    continue
+                piece.append(word)
+                piece_tokens += word_tokens
+            if piece:
+                units.append((" ".join(piece), piece_tokens))
+
+        # Lines rejoined later with "\n\n"; keep consecutive short lines together where they fit
+        merged: List[Tuple[str, int]] = []
+        for text, unit_tokens in units:
+            if merged and merged[-1][1] + unit_tokens + SEPARATOR_TOKENS <= self.max_tokens:
+                merged[-1] = (merged[-1][0] + "\n" + text, merged[-1][1] + unit_tokens + SEPARATOR_TOKENS)
+            else:
+                merged.append((text, unit_tokens))
+        return merged
@@ -0,0 +1,152 @@
+# json_parsing.py
+"""
+Micro-benchmark for parsing JSON out of LLM responses.
+
+Compares the previous multi-strategy parser (full parse, code-fence regex, greedy
+brace regex, line brace counting) with app.services.json_stream.parse_json_object.
+
+Run from the backend directory:
+
+    python -m benchmarks.json_parsing [directory of recorded responses] [--repeat N] [--synthetic]
+
+Recorded responses are raw model outputs saved as *.txt or *.json files, one
+response per file. Without a directory, the anonymised replies checked in under
+benchmarks/responses are used; --synthetic adds large generated responses.
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.services.json_stream import ORJSON_AVAILABLE, parse_json_object
+
+RESPONSES_DIRECTORY = Path(__file__).parent / "responses"
+
+
+def legacy_parse(response_text: str) -> Dict[str, Any]:
+    """The parser LLMProcessor._parse_response used before the single-pass scanner"""
+    cleaned_text = response_text.strip()
+    try:
+        return json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        pass
+
+    json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', cleaned_text, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group(1).strip())
+        except json.JSONDecodeError:
+            pass
+
+    brace_match = re.search(r'\{[\s\S]*\}', cleaned_text)
+    if brace_match:
+        try:
+            return json.loads(brace_match.group(0))
+        except json.JSONDecodeError:
+            pass
+
+    lines = cleaned_text.split('\n')
+    json_start = -1
+    json_end = -1
+    brace_count = 0
+    for i, line in enumerate(lines):
+        if '{' in line and json_start == -1:
+            json_start = i
+            brace_count += line.count('{') - line.count('}')
+        elif json_start != -1:
+            brace_count += line.count('{') - line.count('}')
+            if brace_count == 0:
+                json_end = i + 1
+                break
+
+    if json_start != -1 and json_end != -1:
+        try:
+            return json.loads('\n'.join(lines[json_start:json_end]))
+        except json.JSONDecodeError:
+            pass
+
+    raise ValueError("No valid JSON found in response")
+
+
+def synthetic_responses(rows: int = 400) -> List[Tuple[str, str]]:
+    """Template-shaped outputs in the wrappings models actually produce"""
+    data = {
+        "Fund_and_Investment_Vehicle_Information": {
+            "Fund_Name": "Example Capital Partners IV, L.P.",
+            "Vintage_Year": 2019,
+            "Total_Commitments": 750000000,
+            "Notes": "Commitments {as amended} include the \"top-up\" closing"
+        },
+        "Schedule_of_Investments": [
+            {
+                "Company_Name": f"Portfolio Company {i}",
+                "Security_Type": "Series B Preferred {participating}" if i % 7 == 0 else "Common Equity",
+                "Cost": 1250000 + i * 1000,
+                "Fair_Value": 1800000.5 + i * 1500,
+                "Description": "Provider of \"cloud\" software; see note {3}"
+            }
+            for i in range(rows)
+        ]
+    }
+    body = json.dumps(data, indent=2)
+    return [
+        ("bare", body),
+        ("fenced", f"```json\n{body}\n```"),
+        ("prose", f"Here is the extracted data for {{the}} fund:\n\n{body}\n\nLet me know if you need anything else."),
+        ("truncated", f"Sure.\n{body[:-200]}"),
+    ]
+
+
+def recorded_responses(directory: Path) -> List[Tuple[str, str]]:
+    files = sorted(list(directory.glob("*.txt")) + list(directory.glob("*.json")))
+    return [(path.name, path.read_text(encoding="utf-8")) for path in files]
+
+
+def time_parser(parser: Callable[[str], Dict[str, Any]], text: str, repeat: int) -> Tuple[float, bool]:
+    """Best time per call in milliseconds, and whether an object was found"""
+    best = float("inf")
+    found = True
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            parser(text)
+        except ValueError:
+            found = False
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", type=Path, default=RESPONSES_DIRECTORY,
+                        help="Directory of recorded model responses (default: benchmarks/responses)")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per response (best time is reported)")
+    parser.add_argument("--synthetic", action="store_true", help="Also time large generated responses")
+    args = parser.parse_args()
+
+    responses = recorded_responses(args.directory)
+    if args.synthetic:
+        responses += synthetic_responses()
+    if not responses:
+        print(f"No *.txt or *.json responses in {args.directory}")
+        return
+
+    print(f"orjson: {'yes' if ORJSON_AVAILABLE else 'no (stdlib json)'}")
+    print(f"{'response':<32} {'size':>9} {'legacy ms':>10} {'scanner ms':>11} {'speedup':>8}")
+    totals = [0.0, 0.0]
+    for name, text in responses:
+        legacy_ms, legacy_found = time_parser(legacy_parse, text, args.repeat)
+        scanner_ms, scanner_found = time_parser(parse_json_object, text, args.repeat)
+        totals[0] += legacy_ms
+        totals[1] += scanner_ms
+        note = "" if legacy_found == scanner_found else f"  (found: legacy={legacy_found}, scanner={scanner_found})"
+        print(f"{name[:32]:<32} {len(text):>9} {legacy_ms:>10.3f} {scanner_ms:>11.3f} "
+              f"{legacy_ms / scanner_ms if scanner_ms else float('inf'):>7.1f}x{note}")
+    print(f"{'total':<32} {'':>9} {totals[0]:>10.3f} {totals[1]:>11.3f} "
+          f"{totals[0] / totals[1] if totals[1] else float('inf'):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
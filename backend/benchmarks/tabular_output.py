@@ -0,0 +1,87 @@
+# tabular_output.py
+"""
+Output-token comparison of the record-list formats, per template.
+
+Builds a synthetic extraction with ROWS records in every record-list section
+of each template, then estimates the output tokens of the usual JSON records
+against the compact table form (LLM_TABULAR_LISTS) and checks that the table
+form expands back to the same records.
+
+Run from the backend directory:
+
+    python -m benchmarks.tabular_output [--rows N]
+"""
+import argparse
+import json
+import os
+from typing import Any, Dict
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from app.services.llm_processor import LLMProcessor
+from app.services.tabular_output import expand_tabular_sections, is_record_list
+from app.services.text_chunker import estimate_tokens
+
+# Completion budget of the configured models
+MAX_OUTPUT_TOKENS = 8000
+
+
+def sample_value(field: str, field_type: str, row: int) -> Any:
+    if field_type.startswith("number"):
+        return round(1250000 + row * 98765.43, 2)
+    if "date" in field.lower():
+        return f"2023-{row % 12 + 1:02d}-{row % 28 + 1:02d}"
+    if "name" in field.lower():
+        return f"Portfolio Company {row} Holdings"
+    return f"{field.replace('_', ' ').lower()} {row}"
+
+
+def sample_extraction(schema: Dict[str, Any], rows: int) -> Dict[str, Any]:
+    return {
+        section: [
+            {field: sample_value(field, str(field_type), row) for field, field_type in section_schema[0].items()}
+            for row in range(rows)
+        ]
+        for section, section_schema in schema.items()
+        if is_record_list(section_schema)
+    }
+
+
+def as_tables(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        section: {"columns": list(records[0]), "rows": [list(record.values()) for record in records]}
+        for section, records in data.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=25, help="Records per list section")
+    args = parser.parse_args()
+
+    processor = LLMProcessor(cache_enabled=False)
+    try:
+        print(f"{'template':<10} {'section':<32} {'records':>10} {'table':>8} {'saved':>7} {'max rows':>17}")
+        for template_id, config in processor.template_configs.items():
+            data = sample_extraction(config["json_schema"], args.rows)
+            tables = as_tables(data)
+            assert expand_tabular_sections(json.loads(json.dumps(tables))) == data
+
+            totals = [0, 0]
+            for section in data:
+                record_tokens = estimate_tokens(json.dumps({section: data[section]}))
+                table_tokens = estimate_tokens(json.dumps({section: tables[section]}))
+                totals[0] += record_tokens
+                totals[1] += table_tokens
+                # Records that fit in one completion, per format
+                max_records = MAX_OUTPUT_TOKENS * args.rows // record_tokens
+                max_table = MAX_OUTPUT_TOKENS * args.rows // table_tokens
+                print(f"{template_id:<10} {section[:32]:<32} {record_tokens:>10} {table_tokens:>8} "
+                      f"{1 - table_tokens / record_tokens:>6.0%} {max_records:>8} -> {max_table:<6}")
+            print(f"{template_id:<10} {'total':<32} {totals[0]:>10} {totals[1]:>8} {1 - totals[1] / totals[0]:>6.0%}")
+    finally:
+        processor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# test_json_stream.py
+import json
+
+import pytest
+
+from app.services.json_stream import (
+    IncrementalJSONParser, StreamAbort, ends_inside_object, iter_json_objects, parse_json_object,
+    repair_truncated_json
+)
+
+REPLY = {
+    "Fund_Details": {"Fund_Name": "Example Fund {II}", "Vintage_Year": 2019, "Notes": "a \"quoted\" } brace"},
+    "Schedule_of_Investments": [
+        {"Company_Name": "Alpha", "Cost": 1250000},
+        {"Company_Name": "Beta", "Cost": 800000}
+    ]
+}
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(REPLY),
+    f"```json\n{json.dumps(REPLY, indent=2)}\n```",
+    f"Here is the data for {{the}} fund:\n{json.dumps(REPLY)}\nNote: braces {{like these}} were ignored.",
+])
+def test_parse_json_object_finds_the_reply(text):
+    assert parse_json_object(text) == REPLY
+
+
+def test_parse_json_object_without_an_object():
+    with pytest.raises(ValueError):
+        parse_json_object("No data was found in the document.")
+
+
+def test_iter_json_objects_skips_braces_in_strings():
+    text = 'first {"a": "}"} then {"b": [1, {"c": 2}]} and {"open": '
+    assert list(iter_json_objects(text)) == ['{"a": "}"}', '{"b": [1, {"c": 2}]}']
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2', True),
+    ('{', True),
+    ('Here it is: {\n  "a": "unterminated', True),
+    ('{"a": 1}', False),
+    ('{"a": 1} and then { stray', False),
+    ('x { y', False),
+    ('prose {not json} {"a": 1', True),
+    ('', False),
+])
+def test_ends_inside_object(text, expected):
+    assert ends_inside_object(text) is expected
+
+
+def test_repair_keeps_complete_fields_of_an_object():
+    text = '{"Fund_Name": "Example", "Vintage_Year": 2019, "Fund_Size": 12'
+    assert repair_truncated_json(text) == {"Fund_Name": "Example", "Vintage_Year": 2019}
+
+
+def test_repair_drops_a_half_written_record():
+    text = '{"Schedule": [{"Company_Name": "Alpha", "Cost": 1}, {"Company_Name": "Beta", "Cost"'
+    assert repair_truncated_json(text) == {"Schedule": [{"Company_Name": "Alpha", "Cost": 1}]}
+
+
+def test_repair_stops_before_an_unterminated_string():
+    text = '{"a": 1, "b": "cut off in the midd'
+    assert repair_truncated_json(text) == {"a": 1}
+
+
+def test_repair_without_anything_usable():
+    assert repair_truncated_json('{"a') is None
+    assert repair_truncated_json("no json here") is None
+
+
+def test_incremental_parser_emits_sections_as_they_close():
+    sections = []
+    parser = IncrementalJSONParser(expected_keys=REPLY, on_section=lambda key, value: sections.append((key, value)))
+    text = "```json\n" + json.dumps(REPLY) + "\n```"
+    for start in range(0, len(text), 3):
+        parser.feed(text[start:start + 3])
+
+    assert parser.complete
+    assert sections == list(REPLY.items())
+    assert parser.sections == list(REPLY)
+    assert parse_json_object(parser.text()) == REPLY
+
+
+def test_incremental_parser_aborts_on_an_unexpected_key():
+    parser = IncrementalJSONParser(expected_keys=["Fund_Details"])
+    with pytest.raises(StreamAbort):
+        parser.feed('{"error": "cannot help with that"}')
+
+
+def test_incremental_parser_aborts_on_a_long_preamble():
+    parser = IncrementalJSONParser(max_preamble=20)
+    with pytest.raises(StreamAbort):
+        parser.feed("I am sorry, but I cannot extract data from this document. {")
@@ -0,0 +1,77 @@
+# test_kpi_extractor.py
+import pytest
+
+from app.services.kpi_extractor import KPIExtractor, note_scale
+
+SCHEMA = {
+    "Fund_Performance": {
+        "Gross_IRR": "number or null",
+        "Net_IRR": "number or null",
+        "TVPI": "number or null",
+        "NAV_Net": "number or null",
+        "Total_Commitments": "number or null",
+        "Vintage_Year": "number or null"
+    },
+    "Fund_Details": {"Fund_Name": "string or null"}
+}
+
+
+def extract(text="", tables=None):
+    document = {"filename": "report.pdf", "text": text, "tables": tables or []}
+    return KPIExtractor().extract([document], SCHEMA)
+
+
+def test_text_statements_fill_their_fields():
+    prefilled = extract(
+        "===== Page 2 =====\n\nPerformance summary Net IRR: 15.2% Gross IRR 21.0% TVPI 1.45x "
+        "Vintage year 2019 Total commitments $300m"
+    )
+
+    assert prefilled.data["Fund_Performance"] == {
+        "Net_IRR": pytest.approx(0.152),
+        "Gross_IRR": pytest.approx(0.21),
+        "TVPI": 1.45,
+        "Vintage_Year": 2019,
+        "Total_Commitments": 300000000
+    }
+    source = prefilled.provenance["Fund_Performance.Net_IRR"]
+    assert source["page"] == 2
+    assert source["text"] == "Net IRR: 15.2%"
+    assert source["offset"] > 0
+
+
+def test_percent_from_a_label_cell_is_a_decimal():
+    prefilled = extract(tables=[{"page": 3, "table_number": 1, "data": [
+        ["Metric", "Value"],
+        ["Net IRR (%)", "15.2"]
+    ]}])
+
+    assert prefilled.data["Fund_Performance"]["Net_IRR"] == pytest.approx(0.152)
+
+
+def test_amounts_take_the_stated_scale():
+    prefilled = extract(
+        "===== Page 1 =====\n\nStatement of assets ($ in millions) Net asset value 125.4",
+        tables=[{"page": 1, "table_number": 1, "data": [["(USD 000s)", "Q2 2024"], ["NAV", "125,400"]]}]
+    )
+
+    assert prefilled.data["Fund_Performance"]["NAV_Net"] == 125400000
+    assert len(prefilled.covered) == 1
+
+
+def test_conflicting_values_are_left_to_the_llm():
+    prefilled = extract("===== Page 1 =====\n\nNet IRR: 15.2% ... later restated Net IRR: 14.8%")
+
+    assert "Fund_Performance.Net_IRR" not in prefilled.covered
+
+
+@pytest.mark.parametrize("note, scale", [
+    ("($ in millions)", 1e6),
+    ("(USD 000s)", 1e3),
+    ("(in thousands)", 1e3),
+    ("(€m)", 1e6),
+    ("(b)", None),
+    ("(unaudited)", None),
+])
+def test_note_scale(note, scale):
+    assert note_scale(note) == scale
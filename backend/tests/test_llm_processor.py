@@ -0,0 +1,28 @@
+import httpx
+import pytest
+from groq import BadRequestError
+
+from app.services.llm_processor import LLMProcessor
+
+
+def bad_request(message, **details):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    body = {"error": {"message": message, "type": "invalid_request_error", **details}}
+    return BadRequestError(message, response=httpx.Response(400, request=request), body=body)
+
+
+@pytest.mark.parametrize("error", [
+    bad_request("response_format `json_object` is not supported with this model"),
+    bad_request("This model does not support JSON mode"),
+    bad_request("invalid value", param="response_format"),
+])
+def test_rejects_json_mode(error):
+    assert LLMProcessor._rejects_json_mode(error)
+
+
+@pytest.mark.parametrize("error", [
+    bad_request("Please reduce the length of the messages or completion.", param="messages"),
+    bad_request("max_tokens must be less than or equal to 8192"),
+])
+def test_other_bad_requests_do_not_disable_json_mode(error):
+    assert not LLMProcessor._rejects_json_mode(error)
@@ -0,0 +1,86 @@
+import importlib
+import os
+
+import pytest
+
+from app.services.model_router import LLM_ROUTER_SMALL_PAGES, DocumentFeatures
+from app.services.pdf_extractor import PDFExtractor
+
+
+def make_pdf(pages):
+    """A minimal PDF with one Helvetica content stream per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for content in pages:
+        objects.append(f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def line(x, y, text):
+    return f"BT /F1 10 Tf {x} {y} Td ({text}) Tj ET"
+
+
+def ruled_table(x, y, widths, rows, height=20):
+    xs = [x]
+    for width in widths:
+        xs.append(xs[-1] + width)
+    ys = [y - row * height for row in range(len(rows) + 1)]
+    ops = [f"{xs[0]} {row_y} m {xs[-1]} {row_y} l S" for row_y in ys]
+    ops += [f"{col_x} {ys[0]} m {col_x} {ys[-1]} l S" for col_x in xs]
+    for row, cells in enumerate(rows):
+        ops += [line(xs[column] + 3, ys[row] - 14, cell) for column, cell in enumerate(cells)]
+    return "\n".join(ops)
+
+
+@pytest.fixture(scope="module")
+def main_module(tmp_path_factory):
+    """app.main creates its upload, output and cache directories in the working directory on import"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        yield importlib.import_module("app.main")
+    finally:
+        os.chdir(cwd)
+
+
+def test_document_features_see_real_page_count_and_financial_score(main_module, tmp_path):
+    page_count = LLM_ROUTER_SMALL_PAGES + 2
+    pages = [
+        "\n".join([
+            line(72, 740, "Quarterly report: Net IRR 15.2% and total commitments $300m"),
+            ruled_table(72, 700, [150, 100, 100], [
+                ["Company", "Cost", "Fair Value"],
+                ["Alpha", "1,000", "2,500"],
+                ["Beta", "500", "700"],
+            ]),
+        ])
+    ] + [line(72, 740, f"Notes to the financial statements, page {page}") for page in range(2, page_count + 1)]
+    path = tmp_path / "report.pdf"
+    path.write_bytes(make_pdf(pages))
+
+    extraction_result = PDFExtractor(use_cache=False).extract_text(str(path))
+    assert extraction_result["status"] == "success"
+    document = main_module._extracted_document("report.pdf", extraction_result["text"], extraction_result)
+    features = DocumentFeatures([document])
+
+    assert features.pages == page_count
+    assert features.financial_content_score == extraction_result["financial_content_score"] > 0
+    assert features.tables == 1
+    # Few tokens but more pages than a small document may have
+    assert features.size == "medium"
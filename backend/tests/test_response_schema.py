@@ -0,0 +1,85 @@
+# test_response_schema.py
+from app.services.response_schema import ResponseSchema, ResponseSchemaCompiler
+
+SCHEMA = {
+    "Fund_Details": {
+        "Fund_Name": "string or null",
+        "Fund_Size": "number or null",
+        "Vintage_Year": "number or null"
+    },
+    "Schedule_of_Investments": [{
+        "Company_Name": "string",
+        "Cost": "number or null",
+        "Terms": {"Coupon": "number or null", "Maturity": "string or null"}
+    }]
+}
+
+
+def test_valid_sections_are_coerced():
+    data, validity = ResponseSchema(1, SCHEMA).validate({
+        "Fund_Details": {"Fund_Name": 2019, "Fund_Size": "$1,250.5m", "Vintage_Year": "2019"},
+        "Schedule_of_Investments": [{"Company_Name": "Alpha", "Cost": "1,000", "Terms": None}]
+    })
+
+    assert data["Fund_Details"] == {"Fund_Name": "2019", "Fund_Size": 1250500000, "Vintage_Year": 2019}
+    assert data["Schedule_of_Investments"] == [{"Company_Name": "Alpha", "Cost": 1000, "Terms": None}]
+    assert validity == {"Fund_Details": {"valid": True}, "Schedule_of_Investments": {"valid": True}}
+
+
+def test_null_strings_become_none():
+    data, validity = ResponseSchema(1, SCHEMA).validate({"Fund_Details": {"Fund_Size": "N/A", "Vintage_Year": "-"}})
+
+    assert data["Fund_Details"] == {"Fund_Size": None, "Vintage_Year": None}
+    assert validity["Fund_Details"]["valid"]
+
+
+def test_invalid_object_section_keeps_the_model_values():
+    reply = {"Fund_Details": {"Fund_Name": "Example", "Fund_Size": "about a billion"}}
+    data, validity = ResponseSchema(1, SCHEMA).validate(reply)
+
+    assert data["Fund_Details"] == reply["Fund_Details"]
+    assert validity["Fund_Details"]["valid"] is False
+    assert validity["Fund_Details"]["errors"][0].startswith("Fund_Details.Fund_Size:")
+    # A number field fails once per union member; those are reported as one error
+    assert validity["Fund_Details"]["error_count"] == 1
+
+
+def test_bad_records_are_repaired_not_the_whole_list():
+    data, validity = ResponseSchema(1, SCHEMA).validate({"Schedule_of_Investments": [
+        {"Company_Name": "Alpha", "Cost": "1,000"},
+        {"Company_Name": "Beta", "Cost": "undisclosed", "Terms": {"Coupon": "high", "Maturity": "2027"}},
+        "Gamma",
+        {"Company_Name": "Delta", "Cost": 5}
+    ]})
+
+    assert data["Schedule_of_Investments"] == [
+        {"Company_Name": "Alpha", "Cost": 1000},
+        {"Company_Name": "Beta", "Cost": None, "Terms": {"Coupon": None, "Maturity": "2027"}},
+        {"Company_Name": "Delta", "Cost": 5}
+    ]
+    report = validity["Schedule_of_Investments"]
+    assert report["valid"] is True
+    assert report["repaired_records"] == [1, 2]
+
+
+def test_list_section_that_is_not_a_list_is_invalid():
+    reply = {"Schedule_of_Investments": {"Company_Name": "Alpha"}}
+    data, validity = ResponseSchema(1, SCHEMA).validate(reply)
+
+    assert data == reply
+    assert validity["Schedule_of_Investments"]["valid"] is False
+
+
+def test_keys_outside_the_schema_pass_through_unvalidated():
+    data, validity = ResponseSchema(1, SCHEMA).validate({"Extra": {"anything": "goes"}})
+
+    assert data == {"Extra": {"anything": "goes"}}
+    assert validity == {}
+
+
+def test_compiler_reuses_a_schema_until_the_version_changes():
+    compiler = ResponseSchemaCompiler()
+    first = compiler.compile(1, {"version": "1.0", "json_schema": SCHEMA})
+
+    assert compiler.compile(1, {"version": "1.0", "json_schema": SCHEMA}) is first
+    assert compiler.compile(1, {"version": "1.1", "json_schema": SCHEMA}) is not first
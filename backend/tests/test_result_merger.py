@@ -0,0 +1,57 @@
+# test_result_merger.py
+from app.services.result_merger import is_null, merge_extraction_results, normalize_company_name
+
+
+def test_objects_merge_key_by_key_and_the_first_value_wins():
+    merged = merge_extraction_results([
+        {"Fund_Details": {"Fund_Name": "Example Fund", "Fund_Size": None}, "_metadata": {"model": "a"}},
+        {"Fund_Details": {"Fund_Name": "Example Fund II", "Fund_Size": 500, "Vintage_Year": "N/A"}},
+        {"Fund_Details": {"Vintage_Year": 2019}}
+    ])
+
+    assert merged == {"Fund_Details": {"Fund_Name": "Example Fund", "Fund_Size": 500, "Vintage_Year": 2019}}
+
+
+def test_same_company_records_are_folded_together():
+    merged = merge_extraction_results([
+        {"Schedule": [{"Company_Name": "Alpha Holdings, Inc.", "Cost": 100, "Fair_Value": None}]},
+        {"Schedule": [{"Company_Name": "alpha holdings", "Cost": 120, "Fair_Value": 300},
+                      {"Company_Name": "Beta Ltd", "Cost": 50}]}
+    ])
+
+    assert merged["Schedule"] == [
+        {"Company_Name": "Alpha Holdings, Inc.", "Cost": 100, "Fair_Value": 300},
+        {"Company_Name": "Beta Ltd", "Cost": 50}
+    ]
+
+
+def test_transactions_on_different_dates_stay_separate():
+    merged = merge_extraction_results([
+        {"History": [{"Company_Name": "Alpha", "Transaction_Date": "2021-01-05", "Amount": 10}]},
+        {"History": [{"Company_Name": "Alpha", "Transaction_Date": "2022-03-01", "Amount": 20},
+                     {"Company_Name": "Alpha", "Transaction_Date": "2021-01-05", "Currency": "USD"}]}
+    ])
+
+    assert merged["History"] == [
+        {"Company_Name": "Alpha", "Transaction_Date": "2021-01-05", "Amount": 10, "Currency": "USD"},
+        {"Company_Name": "Alpha", "Transaction_Date": "2022-03-01", "Amount": 20}
+    ]
+
+
+def test_records_without_a_company_are_deduplicated_exactly():
+    merged = merge_extraction_results([
+        {"Cashflows": [{"Date": "2021-01-05", "Amount": 10}, None]},
+        {"Cashflows": [{"Amount": 10, "Date": "2021-01-05"}, {"Date": "2021-02-05", "Amount": 10}]},
+        {"Currencies": ["USD", "EUR"]},
+        {"Currencies": ["usd ", "GBP"]}
+    ])
+
+    assert merged["Cashflows"] == [{"Date": "2021-01-05", "Amount": 10}, {"Date": "2021-02-05", "Amount": 10}]
+    assert merged["Currencies"] == ["USD", "EUR", "GBP"]
+
+
+def test_helpers():
+    assert is_null("n/a") and is_null([]) and is_null(None)
+    assert not is_null(0)
+    assert normalize_company_name("Beta Software GmbH") == "beta software"
+    assert normalize_company_name("Holdings") == "holdings"
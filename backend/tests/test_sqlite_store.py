@@ -0,0 +1,30 @@
+from app.services.sqlite_store import connect, create_store, evict_least_recently_used, increment
+
+
+def make_store(path):
+    create_store(path)
+    with connect(path) as conn:
+        conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_accessed REAL NOT NULL)")
+        conn.execute("CREATE TABLE stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+
+def test_create_store_makes_the_directory_and_uses_wal(tmp_path):
+    path = str(tmp_path / "nested" / "store.sqlite3")
+    create_store(path)
+    with connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_evict_least_recently_used_drops_oldest_until_it_fits(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    make_store(path)
+    with connect(path) as conn:
+        conn.executemany("INSERT INTO entries VALUES (?, ?, ?)", [("a", 40, 3.0), ("b", 40, 1.0), ("c", 40, 2.0)])
+        assert evict_least_recently_used(conn, "entries", 100) == 1
+        assert evict_least_recently_used(conn, "entries", 100) == 0
+        increment(conn, "hits")
+        increment(conn, "hits", 2)
+
+    with connect(path) as conn:
+        assert [key for key, in conn.execute("SELECT key FROM entries ORDER BY key")] == ["a", "c"]
+        assert dict(conn.execute("SELECT name, value FROM stats")) == {"evictions": 1, "hits": 3}
@@ -0,0 +1,183 @@
+# test_table_mapper.py
+import pytest
+
+from app.services.kpi_extractor import PrefilledFields
+from app.services.pdf_extractor import PDFExtractor
+from app.services.table_mapper import TableMapper, normalize_date, normalize_header, parse_number
+
+SCHEMA = {
+    "Company_Investment_Positions": [{
+        "Company_Name": "string",
+        "Invested_Capital": "number or null",
+        "Total_Value": "number or null",
+        "Gross_IRR": "number or null"
+    }],
+    "Fund_Details": {"Fund_Name": "string or null"}
+}
+
+
+def fill(*tables):
+    prefilled = PrefilledFields()
+    TableMapper().fill([{"filename": "report.pdf", "tables": list(tables)}], SCHEMA, prefilled)
+    return prefilled
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,250", 1250),
+    ("$1,250.50", 1250.5),
+    ("(3,400)", -3400),
+    ("-12", -12),
+    ("14.2%", 0.142),
+    ("(2.5%)", -0.025),
+    ("1.8x", 1.8),
+    ("$2.5m", 2500000),
+    ("USD 3bn", 3000000000),
+    ("n/a", None),
+    ("Series B", None),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+def test_parse_number_scales_only_unitless_numbers():
+    assert parse_number("12.5", scale=1e6) == 12500000
+    assert parse_number("14%", scale=1e6) == 0.14
+    assert parse_number("14", percent=True) == 0.14
+    assert parse_number("2k", scale=1e6) == 2000
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2024-06-30", "2024-06-30"),
+    ("30 June 2024", "2024-06-30"),
+    ("Jun 30, 2024", "2024-06-30"),
+    ("30/06/2024", "2024-06-30"),
+    ("06/30/24", "2024-06-30"),
+    ("03/04/2024", "03/04/2024"),
+    ("Q2 2024", "Q2 2024"),
+])
+def test_normalize_date(text, expected):
+    assert normalize_date(text) == expected
+
+
+def test_normalize_header_drops_scale_and_currency_notes():
+    assert normalize_header("Fair Value\n(USD 000s)") == "fair value"
+    assert normalize_header("Cost ($m)") == "cost"
+    assert normalize_header("Ownership (%)") == "ownership %"
+
+
+def test_fill_maps_columns_and_skips_totals():
+    prefilled = fill({"page": 4, "table_number": 1, "data": [
+        ["Portfolio Company", "Invested Capital", "Total Value", "Gross IRR"],
+        ["Alpha Inc.", "1,000", "2,500", "24.1%"],
+        ["Beta Ltd", "500", "-", "n/m"],
+        ["Total", "1,500", "2,500", ""]
+    ]})
+
+    assert prefilled.data["Company_Investment_Positions"] == [
+        {"Company_Name": "Alpha Inc.", "Invested_Capital": 1000, "Total_Value": 2500, "Gross_IRR": 0.241},
+        {"Company_Name": "Beta Ltd", "Invested_Capital": 500, "Total_Value": None, "Gross_IRR": None}
+    ]
+    source = prefilled.provenance["Company_Investment_Positions"]["tables"][0]
+    assert (source["page"], source["table"], source["rows"]) == (4, 1, 2)
+    assert "Fund_Details" not in prefilled.data
+
+
+def test_fill_applies_header_scales_to_amounts_only():
+    prefilled = fill({"page": 2, "table_number": 1, "data": [
+        ["Company ($ in millions)", "Invested Capital", "Total Value (USD 000s)", "Gross IRR"],
+        ["Alpha", "12.5", "20,100", "18.2"]
+    ]})
+
+    assert prefilled.data["Company_Investment_Positions"] == [
+        {"Company_Name": "Alpha", "Invested_Capital": 12500000, "Total_Value": 20100000, "Gross_IRR": 18.2}
+    ]
+    source = prefilled.provenance["Company_Investment_Positions"]["tables"][0]
+    assert source["scales"] == {"Invested_Capital": 1e6, "Total_Value": 1e3}
+
+
+def test_fill_reads_ratio_columns_headed_percent_as_percentages():
+    prefilled = fill({"page": 2, "table_number": 1, "data": [
+        ["Company", "Invested Capital (%)", "Total Value", "Gross IRR (%)"],
+        ["Alpha", "12", "20", "18.5"]
+    ]})
+
+    assert prefilled.data["Company_Investment_Positions"] == [
+        {"Company_Name": "Alpha", "Invested_Capital": 12, "Total_Value": 20, "Gross_IRR": 0.185}
+    ]
+
+
+def test_fill_stitches_a_headerless_continuation():
+    prefilled = fill(
+        {"page": 4, "table_number": 1, "data": [
+            ["Company", "Invested Capital", "Total Value", "Gross IRR"],
+            ["Alpha", "1,000", "2,500", "24.1%"]
+        ]},
+        {"page": 5, "table_number": 1, "data": [
+            ["Gamma", "700", "900", "8.0%"]
+        ]}
+    )
+
+    companies = [record["Company_Name"] for record in prefilled.data["Company_Investment_Positions"]]
+    assert companies == ["Alpha", "Gamma"]
+    assert prefilled.provenance["Company_Investment_Positions"]["tables"][1]["continued"] is True
+
+
+def test_fill_leaves_a_section_with_unparseable_numbers_to_the_llm():
+    prefilled = fill({"page": 1, "table_number": 1, "data": [
+        ["Company", "Invested Capital", "Total Value", "Gross IRR"],
+        ["Alpha", "see note 4", "see note 4", "see note 4"],
+        ["Beta", "undisclosed", "undisclosed", "undisclosed"]
+    ]})
+
+    assert prefilled.data == {}
+    assert prefilled.covered == set()
+
+
+def extracted_page(extractor, page, *tables):
+    """A page as PDFExtractor._process_page returns it, for the given raw tables"""
+    return {"page_number": page, "tables": [
+        {
+            "page": page,
+            "table_number": number,
+            "data": table,
+            "rows": len(table),
+            "columns": len(table[0]),
+            "is_financial": extractor._is_financial_table(table),
+            "financial_score": 0
+        }
+        for number, table in enumerate(tables, start=1)
+    ]}
+
+
+def test_headerless_continuation_survives_extraction_and_is_stitched():
+    extractor = PDFExtractor(use_cache=False)
+    pages = [
+        extracted_page(extractor, 4, [
+            ["Company", "Invested Capital", "Total Value", "Gross IRR"],
+            ["Alpha", "1,000", "2,500", "24.1%"]
+        ]),
+        extracted_page(extractor, 5, [
+            ["Gamma", "700", "900", "8.0%"],
+            ["Delta", "300", "450", "5.5%"]
+        ], [
+            ["Signed", "Date"],
+            ["J. Doe", "2024-06-30"]
+        ])
+    ]
+
+    tables = extractor._financial_tables(pages)
+    assert [(table["page"], table["table_number"]) for table in tables] == [(4, 1), (5, 1)]
+
+    prefilled = fill(*tables)
+    companies = [record["Company_Name"] for record in prefilled.data["Company_Investment_Positions"]]
+    assert companies == ["Alpha", "Gamma", "Delta"]
+
+
+def test_unrelated_headerless_table_is_not_kept():
+    extractor = PDFExtractor(use_cache=False)
+    pages = [
+        extracted_page(extractor, 1, [["Partner", "Office"], ["A. Smith", "London"]]),
+        extracted_page(extractor, 2, [["B. Jones", "Paris"], ["C. Wu", "Boston"]])
+    ]
+
+    assert extractor._financial_tables(pages) == []
@@ -67,7 +67,10 @@ const PDFExtractor = () => {
       })
 
       // Make API call
-      const response = await extractService.extractData(files, selectedTemplate.id)
+      const response = await extractService.extractData(files, selectedTemplate.id, (job) => {
+        setExtractionStatus('processing')
+        setProgress(prev => Math.max(prev, job.progress?.percent || 0))
+      })
       
       clearInterval(progressInterval)
       setProgress(100)
@@ -51,8 +51,12 @@ const api = axios.create({
   timeout: 300000, // 5 minutes timeout for large files
 })
 
+// How long to wait for a queued job, and how many failed status polls in a row to tolerate
+const JOB_MAX_WAIT = 30 * 60 * 1000 // 30 minutes
+const MAX_POLL_ERRORS = 5
+
 export const extractService = {
-  async extractData(files, templateId) {
+  async extractData(files, templateId, onStatus) {
     const formData = new FormData()
     
     files.forEach(file => {
@@ -68,7 +72,53 @@ export const extractService = {
       },
     })
 
-    return response
+    // The backend queues the job and answers 202 right away; poll until it finishes
+    const job = await this.waitForJob(response.data.job_id, onStatus)
+
+    return { ...response, data: job.result }
+  },
+
+  async getJobStatus(jobId) {
+    const response = await api.get(`/api/jobs/${jobId}`)
+    return response.data
+  },
+
+  async waitForJob(jobId, onStatus, pollInterval = 2000) {
+    const deadline = Date.now() + JOB_MAX_WAIT
+    let pollErrors = 0
+
+    while (true) {
+      let job
+      try {
+        job = await this.getJobStatus(jobId)
+        pollErrors = 0
+      } catch (error) {
+        // A dropped request or a backend restart is retried; a job that keeps failing to answer is given up
+        pollErrors += 1
+        console.warn(`⚠️ Polling job ${jobId} failed (${pollErrors}/${MAX_POLL_ERRORS}):`, error.message)
+        if (pollErrors >= MAX_POLL_ERRORS) {
+          throw new Error('Lost contact with the server while extracting. Please try again.')
+        }
+      }
+
+      if (job) {
+        if (onStatus) {
+          onStatus(job)
+        }
+
+        if (job.status === 'completed') {
+          return job
+        }
+        if (job.status === 'failed') {
+          throw new Error(job.error?.detail || 'Extraction failed. Please try again.')
+        }
+      }
+
+      if (Date.now() + pollInterval > deadline) {
+        throw new Error('Extraction is taking too long. Please try again later.')
+      }
+      await new Promise(resolve => setTimeout(resolve, pollInterval))
+    }
   },
 
   async downloadFile(jobId) {